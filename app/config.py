@@ -10,5 +10,32 @@ class Settings(BaseSettings):
     ENV: str = "prod"
     ALERT_COOLDOWN_MIN: int = 1440  # 24h per token
     WATCH_LOG_PATH: str = "/data/watch.log"
+    WATCH_INDEX_EVERY: int = 1000  # watch log lines per sparse index entry (0 = off)
+    WATCH_AGG_MAX_HOURS: int = 720  # per-minute summary buckets kept in memory (0 = off)
+    WATCH_ASYNC_WRITES: bool = True  # append through the background group-commit writer
+    WATCH_FSYNC: str = "interval"  # never | batch | interval
+    WATCH_FSYNC_INTERVAL_SECONDS: float = 1.0
+    WATCH_FLUSH_TIMEOUT_SECONDS: float = 2.0  # readers wait this long for queued appends
+    WATCH_SEGMENT_SECONDS: int = 3600  # rotate the watch log on these boundaries (0 = off)
+    WATCH_SEGMENT_MAX_MB: int = 64  # ...or once it grows past this (0 = off)
+    WATCH_SEGMENT_GRACE_SECONDS: float = 60  # closed segments are gzipped after this
+    WATCH_RETENTION_HOURS: int = 720  # drop segments older than this (0 = keep)
+    WATCH_STORE: str = "jsonl"  # jsonl | binary (see watch_binlog)
+    WATCH_BIN_PATH: str = "/data/watch.bin"
+    WATCH_STAGE_CONFIG_PATH: str = ""  # JSON overrides for SOL_STAGE_THRESHOLDS, hot-reloaded
+    WATCH_STAGE_OVERRIDES: str = ""  # inline JSON overrides; WATCH_STAGE_CONFIG_PATH is laid over these
+    WATCH_STAGE_RELOAD_SECONDS: float = 5.0  # how often the file's mtime is checked
+    WATCH_SNAPSHOT_PATH: str = "/data/watch_state.snap"  # in-memory watch state, restored on startup
+    WATCH_SNAPSHOT_SECONDS: float = 60  # snapshot interval (0 = off)
+    WEBHOOK_WORKERS: int = 4  # concurrent n8n transition webhook requests
+    WEBHOOK_QUEUE_MAX: int = 10_000  # pending deliveries (retries included) before dead-lettering
+    WEBHOOK_MAX_ATTEMPTS: int = 5
+    WEBHOOK_TIMEOUT_SECONDS: float = 5.0
+    WEBHOOK_BACKOFF_SECONDS: float = 1.0  # first retry delay, doubling per attempt
+    WEBHOOK_MAX_BACKOFF_SECONDS: float = 60.0
+    WEBHOOK_DEAD_LETTER_PATH: str = "/data/webhook_dead_letter.jsonl"
+    WEBHOOK_CLOSE_TIMEOUT_SECONDS: float = 5.0  # at exit, time given to queued deliveries
+    SCAN_REFRESH_SECONDS: float = 15.0  # background refresh of the /scan snapshot (0 = on demand only)
+    SCAN_MAX_STALENESS_SECONDS: float = 30.0  # oldest snapshot /scan serves unless the payload asks otherwise
 
 settings = Settings()
@@ -1,5 +1,7 @@
 from fastapi import FastAPI
 from app.routes import health, scan, score, packet, watch
+from app.services.scan_snapshot import SCAN_SNAPSHOTS
+from app.watch.snapshot import start_watch_snapshots
 
 app = FastAPI(title="signal-engine")
 
@@ -8,3 +10,13 @@ app.include_router(scan.router)
 app.include_router(score.router)
 app.include_router(packet.router)
 app.include_router(watch.router)
+
+
+@app.on_event("startup")
+def _restore_watch_state():
+    start_watch_snapshots("api")
+
+
+@app.on_event("startup")
+async def _start_scan_snapshots():
+    SCAN_SNAPSHOTS.start()
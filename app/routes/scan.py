@@ -1,6 +1,8 @@
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Request, HTTPException, Response
 import os
-from app.services.scan_service import process_scan_payload, ScanRequestError
+from app.config import settings
+from app.services.scan_service import parse_scan_payload, scan_response, ScanRequestError
+from app.services.scan_snapshot import SCAN_SNAPSHOTS
 
 """
 Scan ingestion endpoint for automation-driven token discovery.
@@ -8,6 +10,9 @@ Scan ingestion endpoint for automation-driven token discovery.
 Authentication:
 - Expects X-N8N-Signature header containing HMAC SHA-256 of the raw body.
 - Uses shared secret from N8N_SHARED_SECRET environment variable.
+
+Candidates come from the shared scan snapshot (see scan_snapshot), not a
+Dexscreener fetch per request.
 """
 
 router = APIRouter()
@@ -16,12 +21,14 @@ router = APIRouter()
 N8N_SHARED_SECRET = os.getenv("N8N_SHARED_SECRET", "")
 
 @router.post("/scan")
-async def scan(request: Request):
+async def scan(request: Request, response: Response):
     """
     Ingest a scan payload and return a deterministic response shape.
 
     Request payload (JSON):
     - expected to include a "timestamp" field used for echoing observed_at
+    - optional "max_staleness_seconds": oldest snapshot acceptable
+      (default SCAN_MAX_STALENESS_SECONDS; 0 forces a fresh fetch)
     - additional fields are accepted but not validated here
 
     Authentication:
@@ -32,13 +39,25 @@ async def scan(request: Request):
       - status: "ok"
       - count: number of candidates in response
       - candidates: list of candidate objects
+      - X-Scan-Age header: seconds since the snapshot's fetch started
     - 401 Unauthorized when signature is missing or invalid
     - 400 Bad Request when JSON is malformed
     - 422 Unprocessable Entity when required fields are missing or invalid
+    - 503 Service Unavailable when no snapshot is fresh enough and the
+      fetch fails
     """
     signature = request.headers.get("X-N8N-Signature")
     raw_body = await request.body()
     try:
-        return process_scan_payload(raw_body, signature, N8N_SHARED_SECRET)
+        data = parse_scan_payload(raw_body, signature, N8N_SHARED_SECRET)
     except ScanRequestError as exc:
         raise HTTPException(status_code=exc.status_code, detail=exc.detail)
+
+    max_staleness = data.get("max_staleness_seconds", settings.SCAN_MAX_STALENESS_SECONDS)
+    try:
+        snap = await SCAN_SNAPSHOTS.get(max_staleness)
+    except Exception as exc:
+        print(f"[scan] no snapshot within {max_staleness}s: {exc}", flush=True)
+        raise HTTPException(status_code=503, detail="Scan unavailable")
+    response.headers["X-Scan-Age"] = f"{snap.age():.1f}"
+    return scan_response(snap.candidates)
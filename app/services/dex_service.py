@@ -1,11 +1,129 @@
+import os
+import threading
+
 import requests
+from requests.adapters import HTTPAdapter
 
 DEX_URL = "https://api.dexscreener.com/latest/dex/search?q=solana"
+# Pairs of several tokens at once, comma separated, at most DEX_TOKENS_MAX.
+DEX_TOKENS_URL = "https://api.dexscreener.com/tokens/v1/solana/{}"
+DEX_TOKENS_MAX = 30
+DEX_TIMEOUT_SECONDS = float(os.getenv("DEX_TIMEOUT_SECONDS", "10"))
+
+_SESSION: requests.Session | None = None
+_SESSION_LOCK = threading.Lock()
+
+# Validators and body of the last 200 from DEX_URL, for conditional requests.
+_LAST = {"etag": None, "last_modified": None, "pairs": None}
+_LAST_LOCK = threading.Lock()
+
+FETCH_STATS = {"requests": 0, "not_modified": 0}
+
+
+def get_session() -> requests.Session:
+    """Keep-alive session shared by every Dexscreener call in the process."""
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                _SESSION = s
+    return _SESSION
 
 
 def fetch_solana_pairs():
-    r = requests.get(DEX_URL, timeout=10)
+    """
+    Pairs from DEX_URL. Sends If-None-Match / If-Modified-Since when the
+    last response carried an ETag / Last-Modified; on 304 the pairs of that
+    response are returned again (the same list object).
+    """
+    with _LAST_LOCK:
+        etag, last_modified, cached = _LAST["etag"], _LAST["last_modified"], _LAST["pairs"]
+    headers = {}
+    if cached is not None:
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+    r = get_session().get(DEX_URL, headers=headers, timeout=DEX_TIMEOUT_SECONDS)
+    FETCH_STATS["requests"] += 1
+    if r.status_code == 304 and cached is not None:
+        FETCH_STATS["not_modified"] += 1
+        print(f"[dex] not modified, reusing {len(cached)} pairs", flush=True)
+        return cached
     r.raise_for_status()
     pairs = r.json().get("pairs", [])
+    with _LAST_LOCK:
+        _LAST["etag"] = r.headers.get("ETag")
+        _LAST["last_modified"] = r.headers.get("Last-Modified")
+        _LAST["pairs"] = pairs
     print(f"[dex] fetched {len(pairs)} pairs", flush=True)
     return pairs
+
+
+def fetch_token_pairs(addresses: list[str]) -> list[dict]:
+    """Every pair of up to DEX_TOKENS_MAX token addresses, in one request."""
+    if len(addresses) > DEX_TOKENS_MAX:
+        raise ValueError(f"at most {DEX_TOKENS_MAX} addresses per lookup, got {len(addresses)}")
+    r = get_session().get(DEX_TOKENS_URL.format(",".join(addresses)), timeout=DEX_TIMEOUT_SECONDS)
+    r.raise_for_status()
+    data = r.json()
+    # A bare list from tokens/v1; the older latest/dex/tokens shape wraps it.
+    if isinstance(data, dict):
+        data = data.get("pairs")
+    return data or []
+
+
+def _items(value):
+    return tuple(value.items()) if isinstance(value, dict) else value
+
+
+def pair_fingerprint(p: dict) -> tuple:
+    """The fields scoring reads, plus updatedAt where the API sends it."""
+    return (
+        _items(p.get("liquidity")),
+        _items(p.get("volume")),
+        _items(p.get("priceChange")),
+        p.get("pairCreatedAt"),
+        p.get("updatedAt"),
+    )
+
+
+class PairChangeFilter:
+    """
+    Drops pairs that are unchanged since the previous call.
+
+    Keyed on pairAddress; a pair passes when it is new or its
+    pair_fingerprint() differs. Only the last response's pairs are
+    remembered, so a pair that drops out and comes back counts as new.
+    Pairs without an address always pass. `last` holds the counts of the
+    latest call.
+
+    Scoring reads nothing but the fingerprinted fields and the pair's age,
+    and an older pair never passes a gate it failed, so a skipped pair
+    could only have repeated a result already handed on.
+    """
+
+    def __init__(self):
+        self._prints: dict[str, tuple] = {}
+        self.last = {"pairs": 0, "changed": 0, "skipped": 0}
+
+    def changed(self, pairs: list[dict]) -> list[dict]:
+        prints: dict[str, tuple] = {}
+        out = []
+        for p in pairs:
+            address = p.get("pairAddress") if isinstance(p, dict) else None
+            if not address:
+                out.append(p)
+                continue
+            fp = pair_fingerprint(p)
+            if address not in prints and self._prints.get(address) != fp:
+                out.append(p)
+            prints[address] = fp
+        self._prints = prints
+        self.last = {"pairs": len(pairs), "changed": len(out), "skipped": len(pairs) - len(out)}
+        return out
@@ -0,0 +1,438 @@
+"""
+Sender for the Discord outbox (state_service.queue_message and
+TokenStateTxn.queue_message).
+
+One thread reads due messages from the state store, posts them through a
+keep-alive session and settles them in the store: delivered messages are
+deleted, connection errors, timeouts and 5xx are retried with capped
+exponential backoff and full jitter, and messages Discord rejects (any other
+4xx) or that run out of attempts are kept as dead. Stopping the process
+loses nothing; whatever is left is sent after the next start.
+
+Messages without a pinned URL go round-robin over their mode's WEBHOOKS,
+skipping webhooks that are rate limited at the moment (see RateLimits). A
+429 is not a failed attempt: the message goes back to the queue and the
+webhook stays closed for the retry_after Discord asked for.
+
+Alert embeds are coalesced: an embeds-only message without a pinned URL is
+held until the scan cycle that queued it has ended (end_discord_cycle()) or
+it is DISCORD_COALESCE_MS old, then sent together with the other held
+embeds of its mode, up to Discord's 10 embeds and 6000 characters per
+message. Modes go out in PRIORITY order.
+"""
+import atexit
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.services import state_service
+from app.services.discord_service import WEBHOOKS
+from app.services.state_backends import OutboxMessage
+
+TIMEOUT_SECONDS = float(os.getenv("DISCORD_TIMEOUT_SECONDS", "6"))
+MAX_ATTEMPTS = int(os.getenv("DISCORD_OUTBOX_MAX_ATTEMPTS", "10"))
+BACKOFF_SECONDS = float(os.getenv("DISCORD_OUTBOX_BACKOFF_SECONDS", "2"))
+MAX_BACKOFF_SECONDS = float(os.getenv("DISCORD_OUTBOX_MAX_BACKOFF_SECONDS", "300"))
+# Messages read from the store per round, and the longest idle wait.
+BATCH = int(os.getenv("DISCORD_OUTBOX_BATCH", "100"))
+POLL_SECONDS = float(os.getenv("DISCORD_OUTBOX_POLL_SECONDS", "1"))
+# Longest an alert embed waits for the rest of its cycle (0 = never held).
+COALESCE_MS = int(os.getenv("DISCORD_COALESCE_MS", "2000"))
+
+# Discord's limits for one webhook message.
+MAX_EMBEDS = 10
+MAX_EMBED_CHARS = 6000
+
+# Send order of modes; anything else (logs, digest) comes last.
+PRIORITY = {"pass": 0, "rug": 1, "near_pass": 2}
+
+
+def _seconds(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _embeds(msg: OutboxMessage) -> Optional[list]:
+    """The message's embeds if it can share a post with others, else None."""
+    if msg.url:
+        return None
+    try:
+        payload = json.loads(msg.payload)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict) or list(payload) != ["embeds"]:
+        return None
+    return payload["embeds"]
+
+
+def embed_chars(embed: dict) -> int:
+    """Characters Discord counts towards a message's embed total."""
+    n = len(embed.get("title") or "") + len(embed.get("description") or "")
+    n += len((embed.get("footer") or {}).get("text") or "")
+    n += len((embed.get("author") or {}).get("name") or "")
+    for field in embed.get("fields") or ():
+        n += len(field.get("name") or "") + len(field.get("value") or "")
+    return n
+
+
+class _Post:
+    """One HTTP request to make: the messages it settles and its body."""
+
+    __slots__ = ("mode", "url", "messages", "payload")
+
+    def __init__(self, mode: str, url: Optional[str], messages: list, payload: str):
+        self.mode = mode
+        self.url = url
+        self.messages = messages
+        self.payload = payload
+
+
+class _Bucket:
+    __slots__ = ("remaining", "reset_at")
+
+    def __init__(self):
+        self.remaining = 1.0
+        self.reset_at = 0.0
+
+
+class RateLimits:
+    """
+    Discord rate-limit state per webhook URL, kept from the X-RateLimit-*
+    headers of every response. Times are time.monotonic().
+
+    A URL maps to the bucket named by X-RateLimit-Bucket (its own until the
+    first response says otherwise), so webhooks sharing a bucket share its
+    budget. A bucket with X-RateLimit-Remaining 0 is closed until
+    X-RateLimit-Reset-After has passed. A 429 closes the bucket for its
+    retry_after (body, else Retry-After); with X-RateLimit-Global it closes
+    every URL.
+    """
+
+    def __init__(self):
+        self._bucket_of: Dict[str, str] = {}
+        self._buckets: Dict[str, _Bucket] = {}
+        self._global_until = 0.0
+
+    def _bucket(self, url: str) -> _Bucket:
+        key = self._bucket_of.get(url, url)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket()
+        return bucket
+
+    def open_at(self, url: str) -> float:
+        """When `url` may be posted to next (<= now: right away)."""
+        bucket = self._bucket(url)
+        at = self._global_until
+        if bucket.remaining <= 0:
+            at = max(at, bucket.reset_at)
+        return at
+
+    def update(self, url: str, resp: requests.Response, now: float) -> None:
+        h = resp.headers
+        name = h.get("X-RateLimit-Bucket")
+        if name and self._bucket_of.get(url) != name:
+            self._bucket_of[url] = name
+        bucket = self._bucket(url)
+        remaining = _seconds(h.get("X-RateLimit-Remaining"))
+        reset_after = _seconds(h.get("X-RateLimit-Reset-After"))
+        if remaining is not None:
+            bucket.remaining = remaining
+        if reset_after is not None:
+            bucket.reset_at = now + reset_after
+        if resp.status_code != 429:
+            return
+
+        try:
+            body = resp.json()
+        except ValueError:
+            body = {}
+        if not isinstance(body, dict):
+            body = {}
+        retry_after = _seconds(body.get("retry_after"))
+        if retry_after is None:
+            retry_after = _seconds(h.get("Retry-After"))
+        if retry_after is None:
+            retry_after = reset_after if reset_after is not None else 1.0
+        if body.get("global") or h.get("X-RateLimit-Global", "").lower() == "true":
+            self._global_until = max(self._global_until, now + retry_after)
+        else:
+            bucket.remaining = 0
+            bucket.reset_at = max(bucket.reset_at, now + retry_after)
+
+
+class DiscordOutbox:
+    """
+    The outbox sender thread. run_once() does one round and can be called
+    directly (tests, benchmarks); start() runs rounds until stop(), waking
+    as soon as state_service.OUTBOX_READY reports new messages.
+
+    max_embeds caps the embeds coalesced into one post (1 = one post per
+    message) and coalesce_seconds how long an embed waits for its cycle.
+
+    stats() reports counts and end-to-end latency (queued -> delivered)
+    percentiles over the last LATENCY_WINDOW deliveries. `posts` counts
+    HTTP requests made, `saved` the requests avoided by coalescing.
+    """
+
+    LATENCY_WINDOW = 1024
+
+    def __init__(
+        self,
+        webhooks: Optional[Dict[str, list]] = None,
+        timeout: float = TIMEOUT_SECONDS,
+        max_attempts: int = MAX_ATTEMPTS,
+        backoff_seconds: float = BACKOFF_SECONDS,
+        max_backoff_seconds: float = MAX_BACKOFF_SECONDS,
+        batch: int = BATCH,
+        poll_seconds: float = POLL_SECONDS,
+        max_embeds: int = MAX_EMBEDS,
+        coalesce_seconds: float = COALESCE_MS / 1000,
+    ):
+        self.webhooks = WEBHOOKS if webhooks is None else webhooks
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.batch = batch
+        self.poll_seconds = poll_seconds
+        self.max_embeds = max(1, min(max_embeds, MAX_EMBEDS))
+        self.coalesce_seconds = coalesce_seconds
+        self.limits = RateLimits()
+        # time.time() at the end of the last scan cycle: embeds queued
+        # before it are complete and need not wait.
+        self._cycle_end = 0.0
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        # mode -> index of the webhook to try first
+        self._turn: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._latencies: deque = deque(maxlen=self.LATENCY_WINDOW)
+        self._counts = {
+            "sent": 0,
+            "posts": 0,
+            "saved": 0,
+            "retried": 0,
+            "rate_limited": 0,
+            "deferred": 0,
+            "dead": 0,
+        }
+
+    def end_cycle(self) -> None:
+        """Everything queued so far is one cycle's worth: send it now."""
+        self._cycle_end = time.time()
+        state_service.OUTBOX_READY.set()
+
+    def _pick(self, post: _Post, now: float) -> tuple[Optional[str], float]:
+        """(webhook to send `post` to, now), or (None, when one opens); (None, inf) if it has none."""
+        hooks = [post.url] if post.url else self.webhooks.get(post.mode) or []
+        start = self._turn.get(post.mode, 0)
+        soonest = math.inf
+        for k in range(len(hooks)):
+            url = hooks[(start + k) % len(hooks)]
+            at = self.limits.open_at(url)
+            if at <= now:
+                if not post.url:
+                    self._turn[post.mode] = (start + k + 1) % len(hooks)
+                return url, now
+            soonest = min(soonest, at)
+        return None, soonest
+
+    def _plan(self, messages: list[OutboxMessage], now: float) -> tuple[list[_Post], list[OutboxMessage], float]:
+        """
+        Split due messages into posts, in send order, and the ones held back
+        for their cycle; the float is when the first held one falls due.
+        """
+        posts: list[_Post] = []
+        held: list[OutboxMessage] = []
+        release_at = math.inf
+        by_mode: Dict[str, list] = {}
+        for msg in messages:
+            embeds = _embeds(msg) if self.max_embeds > 1 else None
+            if embeds is None:
+                posts.append(_Post(msg.mode, msg.url, [msg], msg.payload))
+                continue
+            due = msg.created_at + self.coalesce_seconds
+            if msg.created_at > self._cycle_end and due > now:
+                held.append(msg)
+                release_at = min(release_at, due)
+                continue
+            by_mode.setdefault(msg.mode, []).append((msg, embeds))
+
+        for mode, items in by_mode.items():
+            group: list = []
+            batch: list = []
+            chars = 0
+            for msg, embeds in items:
+                n = sum(embed_chars(e) for e in embeds)
+                if group and (len(batch) + len(embeds) > self.max_embeds or chars + n > MAX_EMBED_CHARS):
+                    posts.append(_Post(mode, None, group, json.dumps({"embeds": batch})))
+                    group, batch, chars = [], [], 0
+                group.append(msg)
+                batch.extend(embeds)
+                chars += n
+            posts.append(_Post(mode, None, group, json.dumps({"embeds": batch})))
+
+        # Stable: within a mode, oldest first.
+        posts.sort(key=lambda p: PRIORITY.get(p.mode, len(PRIORITY)))
+        return posts, held, release_at
+
+    def _backoff(self, attempts: int) -> float:
+        cap = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (attempts - 1))
+        return random.uniform(0, cap)
+
+    def run_once(self) -> float:
+        """Send what is due now; returns how long to wait before the next round."""
+        messages = state_service.outbox_due(self.batch)
+        if not messages:
+            return self.poll_seconds
+
+        posts, held, release_at = self._plan(messages, time.time())
+        sent, retry, dead = [], [], []
+        release = [msg.id for msg in held]
+        wait = min(self.poll_seconds, max(release_at - time.time(), 0.0))
+        for post in posts:
+            now = time.monotonic()
+            url, open_at = self._pick(post, now) if not self._stop.is_set() else (None, now)
+            if url is None:
+                if math.isinf(open_at):
+                    error = f"no webhook configured for {post.mode}"
+                    dead.extend((msg.id, error) for msg in post.messages)
+                    self._counts["dead"] += len(post.messages)
+                else:
+                    release.extend(msg.id for msg in post.messages)
+                    self._counts["deferred"] += len(post.messages)
+                    wait = min(wait, max(open_at - now, 0.0))
+                continue
+
+            self._counts["posts"] += 1
+            try:
+                resp = self._session.post(
+                    url,
+                    data=post.payload,
+                    headers={"Content-Type": "application/json"},
+                    timeout=self.timeout,
+                )
+            except requests.RequestException as e:
+                error = f"{type(e).__name__}: {e}"
+                retryable = True
+            else:
+                self.limits.update(url, resp, time.monotonic())
+                if resp.status_code < 300:
+                    delivered = time.time()
+                    sent.extend(msg.id for msg in post.messages)
+                    self._counts["sent"] += len(post.messages)
+                    self._counts["saved"] += len(post.messages) - 1
+                    self._latencies.extend(max(delivered - msg.created_at, 0.0) for msg in post.messages)
+                    continue
+                if resp.status_code == 429:
+                    # Not the messages' fault: back in the queue, and the
+                    # next round picks a webhook that is open.
+                    release.extend(msg.id for msg in post.messages)
+                    self._counts["rate_limited"] += 1
+                    wait = 0.0
+                    continue
+                error = f"HTTP {resp.status_code}: {resp.text[:200]}"
+                retryable = resp.status_code >= 500 or resp.status_code == 408
+
+            for msg in post.messages:
+                attempts = msg.attempts + 1
+                if retryable and attempts < self.max_attempts:
+                    retry.append((msg.id, time.time() + self._backoff(attempts), error))
+                    self._counts["retried"] += 1
+                else:
+                    dead.append((msg.id, error))
+                    self._counts["dead"] += 1
+                    print(
+                        f"[discord] giving up on {msg.mode} message {msg.id} after {attempts} attempt(s): {error}",
+                        flush=True,
+                    )
+
+        state_service.outbox_finish(sent, retry, dead, release)
+        if len(release) < len(messages):
+            return 0.0  # made progress, there may be more due
+        return wait
+
+    def _run(self) -> None:
+        ready = state_service.OUTBOX_READY
+        while not self._stop.is_set():
+            # Cleared before reading, so a commit during the round is not missed.
+            ready.clear()
+            try:
+                wait = self.run_once()
+            except Exception as e:
+                print(f"[discord] outbox error: {e}", flush=True)
+                wait = self.poll_seconds
+            if wait > 0:
+                ready.wait(wait)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="discord-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Finish the post in progress and stop; unsent messages stay in the outbox."""
+        self._stop.set()
+        state_service.OUTBOX_READY.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1)
+            self._thread = None
+        self._session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        counts = dict(self._counts)
+        latencies = sorted(self._latencies)
+
+        def pct(p: float) -> float:
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else 0.0
+
+        return {
+            **counts,
+            "backlog": state_service.outbox_backlog(),
+            "latency_p50_ms": pct(0.50),
+            "latency_p95_ms": pct(0.95),
+        }
+
+
+_SENDER: Optional[DiscordOutbox] = None
+_SENDER_LOCK = threading.Lock()
+
+
+def start_discord_outbox() -> DiscordOutbox:
+    """Start the process's sender (once); it stops at exit."""
+    global _SENDER
+    with _SENDER_LOCK:
+        if _SENDER is None:
+            _SENDER = DiscordOutbox()
+            _SENDER.start()
+            atexit.register(_SENDER.stop)
+    return _SENDER
+
+
+def end_discord_cycle() -> None:
+    """Mark the end of a scan cycle, so its coalesced alerts go out now."""
+    if _SENDER is not None:
+        _SENDER.end_cycle()
+
+
+def outbox_stats() -> Optional[Dict[str, Any]]:
+    """stats() of the sender, or None if it was not started."""
+    return _SENDER.stats() if _SENDER is not None else None
@@ -1,8 +1,11 @@
-import itertools
+"""
+Discord alert messages. Nothing here talks to Discord: messages are queued
+in the state store's outbox and delivered by app.services.discord_outbox.
+"""
 import os
 from datetime import datetime, timezone
 
-import requests
+from app.services.state_service import queue_message
 
 WEBHOOKS = {
     "near_pass": [os.getenv("DISCORD_WEBHOOK_NEAR_PASS")],
@@ -15,8 +18,6 @@ WEBHOOKS = {
 for k in WEBHOOKS:
     WEBHOOKS[k] = [w for w in WEBHOOKS[k] if w]
 
-_ROUND_ROBIN = {k: itertools.cycle(v) for k, v in WEBHOOKS.items() if v}
-
 COLORS = {
     "near_pass": 0xF1C40F,
     "pass": 0x2ECC71,
@@ -40,18 +41,15 @@ def _bar(value, max_value, length=10):
     return "" * filled + "" * (length - filled)
 
 
-def _post(url: str, payload: dict):
-    try:
-        requests.post(url, json=payload, timeout=6)
-    except Exception:
-        pass
+def _send(embed: dict, mode: str):
+    if WEBHOOKS.get(mode):
+        queue_message(mode, {"embeds": [embed]})
 
 
-def _send(embed: dict, mode: str):
-    hooks = WEBHOOKS.get(mode, [])
-    if not hooks:
-        return
-    _post(next(_ROUND_ROBIN[mode]), {"embeds": [embed]})
+def queue_embed(txn, embed: dict, mode: str):
+    """Queue `embed` in a TokenStateTxn's outbox, so it is committed with that token's row."""
+    if WEBHOOKS.get(mode):
+        txn.queue_message(mode, {"embeds": [embed]})
 
 
 def send_text(text: str, mode: str = "logs", fanout: bool = False):
@@ -60,9 +58,9 @@ def send_text(text: str, mode: str = "logs", fanout: bool = False):
         return
     if fanout:
         for h in hooks:
-            _post(h, {"content": text})
+            queue_message(mode, {"content": text}, url=h)
     else:
-        _post(next(_ROUND_ROBIN[mode]), {"content": text})
+        queue_message(mode, {"content": text})
 
 
 def _confidence_score(m: dict) -> int:
@@ -95,7 +93,7 @@ def _wallet_badge(wallet: dict | None) -> tuple[str, str]:
     return ("Unknown", "")
 
 
-def send_candidate(candidate: dict, mode: str, explanation: str):
+def candidate_embed(candidate: dict, mode: str, explanation: str) -> dict:
     m = candidate.get("metrics", {})
     sym = candidate.get("symbol", "UNK")
     token = candidate.get("token", "")
@@ -167,7 +165,7 @@ def send_candidate(candidate: dict, mode: str, explanation: str):
         ]
     )
 
-    embed = {
+    return {
         "title": HEADERS.get(mode, "SIGNAL"),
         "description": f"**SOL  ${sym}**",
         "color": COLORS.get(mode, 0xFFFFFF),
@@ -175,15 +173,17 @@ def send_candidate(candidate: dict, mode: str, explanation: str):
         "footer": {"text": f"signal-engine  {now}"},
     }
 
-    _send(embed, mode)
 
+def send_candidate(candidate: dict, mode: str, explanation: str):
+    _send(candidate_embed(candidate, mode, explanation), mode)
 
-def send_collapsed_repeat(
+
+def repeat_embed(
     candidate: dict,
     mode: str,
     stats: dict,
     heating_up: bool = False,
-):
+) -> dict:
     sym = candidate.get("symbol", "UNK")
     token = candidate.get("token", "")
     first_seen = stats.get("first_seen")
@@ -197,7 +197,7 @@ def send_collapsed_repeat(
     if heating_up:
         title += " 🔥"
 
-    embed = {
+    return {
         "title": title,
         "description": f"**SOL  ${sym}**",
         "color": COLORS.get(mode, 0xFFFFFF),
@@ -231,4 +231,11 @@ def send_collapsed_repeat(
         },
     }
 
-    _send(embed, mode)
+
+def send_collapsed_repeat(
+    candidate: dict,
+    mode: str,
+    stats: dict,
+    heating_up: bool = False,
+):
+    _send(repeat_embed(candidate, mode, stats, heating_up), mode)
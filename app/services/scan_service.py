@@ -4,13 +4,29 @@ import hmac
 import json
 from datetime import datetime as dt_datetime
 
-from app.services.dex_service import fetch_solana_pairs
-from app.services.score_service import score_pairs
+from app.services.dex_service import PairChangeFilter, fetch_solana_pairs
+from app.services.score_service import score_pairs_batch
 
+# Pairs seen by the worker's poll loop, the only caller of changed_only.
+_CHANGES = PairChangeFilter()
 
-def process_scan():
+
+def process_scan(changed_only: bool = False):
+    """
+    Score the current Dexscreener pairs. With changed_only, pairs unchanged
+    since the last changed_only scan are skipped before scoring.
+    """
     pairs = fetch_solana_pairs()
-    scored = score_pairs(pairs)
+    if changed_only:
+        pairs = _CHANGES.changed(pairs)
+        n = _CHANGES.last
+        ratio = n["skipped"] / n["pairs"] if n["pairs"] else 0.0
+        print(
+            f"[dex] pairs={n['pairs']} changed={n['changed']} "
+            f"skipped={n['skipped']} skip_ratio={ratio:.0%}",
+            flush=True,
+        )
+    scored = score_pairs_batch(pairs)
     ts = datetime.now(timezone.utc).isoformat()
     for s in scored:
         s["observed_at"] = ts
@@ -57,20 +73,37 @@ def _validate_payload(data: dict) -> None:
     if not isinstance(ts, str) or not ts.strip():
         raise ScanRequestError(422, "Invalid payload: missing or invalid timestamp")
     _validate_timestamp(ts)
+    staleness = data.get("max_staleness_seconds")
+    if staleness is not None and (
+        isinstance(staleness, bool) or not isinstance(staleness, (int, float)) or not staleness >= 0
+    ):
+        raise ScanRequestError(422, "Invalid payload: max_staleness_seconds must be a number >= 0")
 
 
-def process_scan_payload(
+def parse_scan_payload(
     raw_body: bytes,
     signature: str | None,
     secret: str,
 ) -> dict:
+    """Verify and validate a /scan request body; the parsed payload."""
     _verify_signature(raw_body, signature, secret)
     data = _parse_json(raw_body)
     _validate_payload(data)
+    return data
 
-    candidates = process_scan()
+
+def scan_response(candidates: list) -> dict:
     return {
         "status": "ok",
         "count": len(candidates),
         "candidates": candidates,
     }
+
+
+def process_scan_payload(
+    raw_body: bytes,
+    signature: str | None,
+    secret: str,
+) -> dict:
+    parse_scan_payload(raw_body, signature, secret)
+    return scan_response(process_scan())
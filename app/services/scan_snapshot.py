@@ -0,0 +1,107 @@
+"""
+The /scan response, served from a shared snapshot instead of a Dexscreener
+fetch per request.
+
+process_scan() blocks on Dexscreener, so it runs in a worker thread, never
+on the event loop. A background task refreshes the snapshot every
+SCAN_REFRESH_SECONDS; a request is answered from it when it is at most
+max_staleness seconds old and otherwise waits for a refresh. Refreshes are
+single-flight: callers arriving while one is in flight wait for it instead
+of starting their own.
+
+Staleness is measured from when the fetch behind a snapshot started.
+"""
+import asyncio
+import time
+from typing import NamedTuple
+
+from app.config import settings
+from app.services.scan_service import process_scan
+
+SCAN_STATS = {"requests": 0, "cached": 0, "joined": 0, "refreshes": 0, "errors": 0}
+
+
+class ScanSnapshot(NamedTuple):
+    candidates: list
+    started_at: float  # time.monotonic() when its fetch began
+
+    def age(self) -> float:
+        return time.monotonic() - self.started_at
+
+
+class ScanSnapshots:
+    """
+    Inputs:
+    - fetch: blocking call returning the scored candidates (process_scan)
+
+    Invariants:
+    - at most one fetch in flight
+    - `current` only moves to a snapshot whose fetch started later
+    """
+
+    def __init__(self, fetch=process_scan):
+        self.fetch = fetch
+        self.current: ScanSnapshot | None = None
+        self._inflight: asyncio.Task | None = None
+        self._task: asyncio.Task | None = None
+
+    async def _refresh(self) -> ScanSnapshot:
+        started = time.monotonic()
+        SCAN_STATS["refreshes"] += 1
+        try:
+            candidates = await asyncio.to_thread(self.fetch)
+        except Exception:
+            SCAN_STATS["errors"] += 1
+            raise
+        finally:
+            self._inflight = None
+        snap = ScanSnapshot(candidates, started)
+        if self.current is None or started >= self.current.started_at:
+            self.current = snap
+        return snap
+
+    async def refresh(self) -> ScanSnapshot:
+        """Join the fetch in flight, or start one."""
+        task = self._inflight
+        if task is None:
+            task = self._inflight = asyncio.create_task(self._refresh())
+            # Nobody may be left waiting on a failed fetch; retrieve it anyway.
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        else:
+            SCAN_STATS["joined"] += 1
+        # A caller giving up (client gone) must not cancel the others' fetch.
+        return await asyncio.shield(task)
+
+    async def get(self, max_staleness: float) -> ScanSnapshot:
+        """A snapshot whose fetch started at most max_staleness seconds before this call."""
+        SCAN_STATS["requests"] += 1
+        oldest = time.monotonic() - max_staleness
+        snap = self.current
+        if snap is not None and snap.started_at >= oldest:
+            SCAN_STATS["cached"] += 1
+            return snap
+        while True:
+            snap = await self.refresh()
+            # A joined fetch may have started before the window; then go again.
+            if snap.started_at >= oldest:
+                return snap
+
+    async def run(self, interval: float) -> None:
+        """Refresh whenever the snapshot is `interval` seconds old."""
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"[scan] snapshot refresh failed: {e}", flush=True)
+                await asyncio.sleep(interval)
+                continue
+            snap = self.current
+            await asyncio.sleep(max(interval - snap.age(), 0) if snap else interval)
+
+    def start(self, interval: float = settings.SCAN_REFRESH_SECONDS) -> None:
+        """Start the background refresh on the running loop (once; not when interval <= 0)."""
+        if self._task is None and interval > 0:
+            self._task = asyncio.get_running_loop().create_task(self.run(interval))
+
+
+SCAN_SNAPSHOTS = ScanSnapshots()
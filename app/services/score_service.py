@@ -1,8 +1,15 @@
 from datetime import datetime, timezone
+from itertools import repeat
 
+try:
+    import numpy as np
+except ImportError:  # score_pairs_batch falls back to score_pairs
+    np = None
 
-def score_pairs(pairs: list[dict]) -> list[dict]:
-    now_ms = datetime.now(timezone.utc).timestamp() * 1000
+
+def score_pairs(pairs: list[dict], now_ms: float | None = None) -> list[dict]:
+    if now_ms is None:
+        now_ms = datetime.now(timezone.utc).timestamp() * 1000
     out = []
 
     for p in pairs:
@@ -35,3 +42,165 @@ def score_pairs(pairs: list[dict]) -> list[dict]:
             continue
 
     return out
+
+
+def pair_candidate(p: dict, reason: str, now_ms: float | None = None) -> dict | None:
+    """
+    The candidate score_pairs would build for one pair, without its gate.
+    None when the pair has no pairCreatedAt or malformed fields.
+    """
+    if now_ms is None:
+        now_ms = datetime.now(timezone.utc).timestamp() * 1000
+    try:
+        liq = float(p.get("liquidity", {}).get("usd") or 0)
+        vol5m = float(p.get("volume", {}).get("m5") or 0)
+        chg5m = float(p.get("priceChange", {}).get("m5") or 0)
+        created = p.get("pairCreatedAt")
+        if not created:
+            return None
+        age = (now_ms - created) / 60000
+        return {
+            "token": p["baseToken"]["address"],
+            "symbol": p["baseToken"]["symbol"],
+            "reason": reason,
+            "metrics": {
+                "liquidity": round(liq, 2),
+                "volume_5m": round(vol5m, 2),
+                "price_change_5m": round(chg5m, 2),
+                "age_minutes": round(age, 1),
+            },
+        }
+    except Exception:
+        return None
+
+
+_EMPTY: dict = {}
+_MALFORMED = object()
+_NUMBER_TYPES = {float, int, bool}
+
+
+def _created_column(pairs: list[dict]) -> list:
+    try:
+        return list(map(dict.get, pairs, repeat("pairCreatedAt", len(pairs))))
+    except TypeError:
+        pass
+    # Some pair is not an object; score_pairs skips it.
+    out = []
+    for p in pairs:
+        try:
+            out.append(p.get("pairCreatedAt"))
+        except Exception:
+            out.append(None)
+    return out
+
+
+def _metric_columns(pairs: list[dict]) -> tuple[list, list, list]:
+    """liquidity.usd, volume.m5 and priceChange.m5, as found."""
+    try:
+        rows = [
+            (p.get("liquidity", _EMPTY).get("usd"), p.get("volume", _EMPTY).get("m5"), p.get("priceChange", _EMPTY).get("m5"))
+            for p in pairs
+        ]
+    except Exception:
+        # Some pair is malformed; score_pairs skips it, and so does
+        # _float_column, failing to convert _MALFORMED.
+        rows = []
+        for p in pairs:
+            try:
+                rows.append(
+                    (p.get("liquidity", _EMPTY).get("usd"), p.get("volume", _EMPTY).get("m5"), p.get("priceChange", _EMPTY).get("m5"))
+                )
+            except Exception:
+                rows.append((_MALFORMED, None, None))
+    return tuple(map(list, zip(*rows)))
+
+
+def _float_column(raw: list):
+    """(float(v or 0) as float64, mask of rows where that raised, or None)."""
+    values = [v or 0 for v in raw]
+    if set(map(type, values)) <= _NUMBER_TYPES:
+        try:
+            return np.array(values, dtype=np.float64), None
+        except OverflowError:
+            pass
+    out = []
+    bad = np.zeros(len(values), dtype=bool)
+    for i, v in enumerate(values):
+        try:
+            out.append(float(v))
+        except Exception:
+            out.append(0.0)
+            bad[i] = True
+    return np.array(out, dtype=np.float64), bad
+
+
+def score_pairs_batch(pairs: list[dict], now_ms: float | None = None) -> list[dict]:
+    """
+    score_pairs for a whole Dexscreener response.
+
+    Inputs:
+    - pairs: decoded JSON pairs, malformed ones included
+    - now_ms: the clock to age pairs against (default: now)
+
+    Outputs:
+    - exactly what score_pairs(pairs, now_ms) returns
+
+    pairCreatedAt is loaded into a NumPy column for every pair and the age
+    gate applied at once; liquidity, volume and price change are loaded and
+    gated only for pairs under the age limit, and candidate dicts built only
+    for those passing. A pair failing any part of the gate, or malformed
+    anywhere, is skipped by score_pairs either way, so checking age first
+    changes nothing but the cost. Without NumPy this is score_pairs.
+    """
+    if np is None or not pairs:
+        return score_pairs(pairs, now_ms)
+    if now_ms is None:
+        now_ms = datetime.now(timezone.utc).timestamp() * 1000
+
+    # (now_ms - created) / 60000 only works out for numbers; a missing or
+    # zero pairCreatedAt is skipped, and any other value fails to subtract.
+    raw = _created_column(pairs)
+    if not set(map(type, raw)) <= _NUMBER_TYPES:
+        raw = [c if type(c) in _NUMBER_TYPES else None for c in raw]
+    created, created_bad = _float_column(raw)
+    age = (now_ms - created) / 60000
+    young = (created != 0) & (age <= 0.5)
+    if created_bad is not None:
+        young &= ~created_bad
+    rows = np.flatnonzero(young)
+    if not len(rows):
+        return []
+
+    subset = [pairs[i] for i in rows.tolist()]
+    liq_raw, vol_raw, chg_raw = _metric_columns(subset)
+    liq, liq_bad = _float_column(liq_raw)
+    vol, vol_bad = _float_column(vol_raw)
+    chg, chg_bad = _float_column(chg_raw)
+    keep = (liq >= 800) & (vol >= 20) & (chg >= -10)
+    for bad in (liq_bad, vol_bad, chg_bad):
+        if bad is not None:
+            keep &= ~bad
+
+    out = []
+    hits = np.flatnonzero(keep)
+    for j, l, v, c, a in zip(
+        hits.tolist(), liq[hits].tolist(), vol[hits].tolist(), chg[hits].tolist(), age[rows[hits]].tolist()
+    ):
+        p = subset[j]
+        try:
+            out.append(
+                {
+                    "token": p["baseToken"]["address"],
+                    "symbol": p["baseToken"]["symbol"],
+                    "reason": "aggressive_near_pass",
+                    "metrics": {
+                        "liquidity": round(l, 2),
+                        "volume_5m": round(v, 2),
+                        "price_change_5m": round(c, 2),
+                        "age_minutes": round(a, 1),
+                    },
+                }
+            )
+        except Exception:
+            continue
+    return out
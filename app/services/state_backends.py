@@ -0,0 +1,1081 @@
+"""
+Storage backends for state_service.
+
+A backend only stores token_state rows, kv entries and the message outbox;
+the seen / mute / escalation / cooldown / repeat rules stay in
+state_service.TokenStateTxn and run the same way on every backend. Rows are
+plain dicts keyed by ROW_FIELDS.
+
+Outbox messages are written by write_rows() in the same transaction as the
+rows whose change produced them, as (mode, url, payload, created_at) tuples
+(payload is the JSON body, url None for "any webhook of this mode"), and
+read back as OutboxMessage.
+
+- SqliteStateBackend: engine.db, schema migrations, archive DB for retention
+- MemoryStateBackend: process-local dicts, for replay runs and benchmarks
+- RedisStateBackend: any Redis-protocol server, shared between workers
+"""
+import itertools
+import json
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, NamedTuple
+from urllib.parse import unquote, urlparse
+
+# Candidate metrics stored as typed token_state columns. Any other key (or a
+# non-numeric value) goes to the metrics_extra JSON overflow column.
+METRIC_COLUMNS = ("liquidity", "volume_5m", "price_change_5m", "age_minutes")
+
+ROW_FIELDS = (
+    "last_sent",
+    "sent_count",
+    "first_seen",
+    "last_seen",
+    *METRIC_COLUMNS,
+    "metrics_extra",
+    "muted_until",
+    "confirm_count",
+    "confirm_window_start",
+    "last_severity",
+)
+
+_INT_FIELDS = frozenset(
+    (
+        "last_sent",
+        "sent_count",
+        "first_seen",
+        "last_seen",
+        "muted_until",
+        "confirm_count",
+        "confirm_window_start",
+    )
+)
+_FLOAT_FIELDS = frozenset(METRIC_COLUMNS)
+
+
+class OutboxMessage(NamedTuple):
+    id: int | str
+    mode: str
+    url: str | None
+    payload: str
+    created_at: float
+    attempts: int
+
+
+def split_metrics(metrics: dict) -> tuple:
+    values = []
+    extra = None
+    for key in METRIC_COLUMNS:
+        v = metrics.get(key)
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            values.append(v)
+        else:
+            values.append(None)
+    if len(metrics) > sum(v is not None for v in values):
+        extra = {
+            k: v
+            for k, v in metrics.items()
+            if k not in METRIC_COLUMNS or not isinstance(v, (int, float)) or isinstance(v, bool)
+        }
+    return (*values, json.dumps(extra) if extra else None)
+
+
+def join_metrics(row: dict) -> dict:
+    metrics = {k: row[k] for k in METRIC_COLUMNS if row.get(k) is not None}
+    if row.get("metrics_extra"):
+        try:
+            metrics.update(json.loads(row["metrics_extra"]))
+        except Exception:
+            pass
+    return metrics
+
+
+class StateBackend:
+    """
+    Interface implemented by every state store.
+
+    write_behind tells state_service whether to keep its in-process
+    write-behind cache in front of the backend. That only makes sense for a
+    store owned by a single process; shared stores are written through.
+    single_writer routes every write through one StateWriter thread, for
+    stores that serialize writers with a file lock (sqlite).
+    """
+
+    name = "base"
+    write_behind = False
+    single_writer = False
+
+    def init(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    @contextmanager
+    def lock(self, token: str) -> Iterator[None]:
+        """Exclusive section for one read-modify-write of a token's row."""
+        raise NotImplementedError
+
+    def load_row(self, token: str) -> dict | None:
+        raise NotImplementedError
+
+    def load_hot_rows(self, limit: int) -> list[tuple[str, dict]]:
+        """Most recently seen rows, newest first (cache preload)."""
+        return []
+
+    def write_rows(
+        self,
+        rows: list[tuple[str, dict]],
+        kv: list[tuple[str, str | None]],
+        outbox: list[tuple] = (),
+    ) -> None:
+        """Write rows, kv entries and new outbox messages atomically."""
+        raise NotImplementedError
+
+    def kv_get(self, key: str) -> str | None:
+        raise NotImplementedError
+
+    def kv_items(self) -> list[tuple[str, str | None]]:
+        raise NotImplementedError
+
+    def recent_rows(self, cutoff: int, limit: int) -> list[tuple[str, dict]]:
+        """Rows with last_seen >= cutoff, newest first."""
+        raise NotImplementedError
+
+    def rows_since(self, start_ts: int) -> list[tuple[str, dict]]:
+        """Rows with last_seen >= start_ts, oldest first."""
+        raise NotImplementedError
+
+    def sweep(self, cutoff: int, batch_size: int, now: int) -> list[str]:
+        """Retire up to batch_size rows with last_seen < cutoff; return their tokens."""
+        raise NotImplementedError
+
+    def reclaim(self, pause: float, should_stop: Callable[[], bool]) -> int:
+        """Give space freed by sweep() back; return the amount reclaimed."""
+        return 0
+
+    def enable_reclaim(self) -> bool:
+        """
+        One-off rebuild that lets reclaim() work on a store created before it
+        could (may rewrite the whole store); False when there is nothing to do.
+        """
+        return False
+
+    def outbox_due(self, now: float, limit: int) -> list[OutboxMessage]:
+        """
+        Up to `limit` live messages due at `now`, oldest first. A store
+        shared between processes holds each one for this caller until
+        outbox_finish() settles it; a process-local store has one sender.
+        """
+        raise NotImplementedError
+
+    def outbox_finish(
+        self,
+        sent: list,
+        retry: list[tuple],
+        dead: list[tuple],
+        release: list,
+        now: float,
+    ) -> None:
+        """
+        Settle messages from outbox_due() in one step: `sent` ids are
+        deleted, `retry` (id, next_attempt_at, error) count an attempt and
+        wait, `dead` (id, error) count an attempt and stop, `release` ids go
+        back untouched.
+        """
+        raise NotImplementedError
+
+    def outbox_backlog(self) -> int:
+        """Live messages not yet sent."""
+        raise NotImplementedError
+
+
+# --------------------
+# SQLite
+# --------------------
+
+
+def _m001_base_schema(c: sqlite3.Connection):
+    c.execute(
+        """
+    CREATE TABLE IF NOT EXISTS token_state (
+        token TEXT PRIMARY KEY,
+        last_sent INTEGER,
+        sent_count INTEGER DEFAULT 0,
+        first_seen INTEGER,
+        last_seen INTEGER,
+        last_metrics TEXT,
+        muted_until INTEGER DEFAULT 0,
+        confirm_count INTEGER DEFAULT 0,
+        confirm_window_start INTEGER DEFAULT 0,
+        last_severity TEXT DEFAULT 'near_pass'
+    )
+    """
+    )
+    c.execute(
+        """
+    CREATE TABLE IF NOT EXISTS kv (
+        k TEXT PRIMARY KEY,
+        v TEXT
+    )
+    """
+    )
+
+
+def _m002_time_indexes(c: sqlite3.Connection):
+    # top_recent (last_seen DESC), replay (last_seen ASC), the daily digest
+    # (severity within a time range) and mute lookups.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_token_state_last_seen ON token_state (last_seen)")
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_token_state_severity_seen "
+        "ON token_state (last_severity, last_seen)"
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_token_state_muted_until ON token_state (muted_until)")
+
+
+def _m003_typed_metrics(c: sqlite3.Connection):
+    # The well-known metrics become REAL columns; last_metrics is split into
+    # them and renamed to metrics_extra, which keeps only the leftover keys.
+    for key in METRIC_COLUMNS:
+        c.execute(f"ALTER TABLE token_state ADD COLUMN {key} REAL")
+
+    last_rowid = 0
+    while True:
+        rows = c.execute(
+            """
+            SELECT rowid, last_metrics FROM token_state
+            WHERE rowid > ? AND last_metrics IS NOT NULL
+            ORDER BY rowid
+            LIMIT 10000
+        """,
+            (last_rowid,),
+        ).fetchall()
+        if not rows:
+            break
+        updates = []
+        for rowid, last_metrics in rows:
+            try:
+                metrics = json.loads(last_metrics)
+            except Exception:
+                metrics = {}
+            if not isinstance(metrics, dict):
+                metrics = {}
+            updates.append((*split_metrics(metrics), rowid))
+        c.executemany(
+            f"""
+            UPDATE token_state
+            SET {', '.join(f'{k}=?' for k in METRIC_COLUMNS)}, last_metrics=?
+            WHERE rowid=?
+        """,
+            updates,
+        )
+        last_rowid = rows[-1][0]
+
+    c.execute("ALTER TABLE token_state RENAME COLUMN last_metrics TO metrics_extra")
+
+
+def _m004_outbox(c: sqlite3.Connection):
+    # Messages queued with the state change behind them; dead_at is set once
+    # delivery is given up, and the row is kept for inspection.
+    c.execute(
+        """
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        mode TEXT NOT NULL,
+        url TEXT,
+        payload TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        attempts INTEGER DEFAULT 0,
+        next_attempt_at REAL DEFAULT 0,
+        last_error TEXT,
+        dead_at REAL
+    )
+    """
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (next_attempt_at) WHERE dead_at IS NULL"
+    )
+
+
+# Applied in order; PRAGMA user_version records how many have run. Never edit
+# or reorder an existing entry, append a new one instead.
+_MIGRATIONS = [
+    _m001_base_schema,
+    _m002_time_indexes,
+    _m003_typed_metrics,
+    _m004_outbox,
+]
+
+_COLUMNS = ", ".join(ROW_FIELDS)
+_SELECT_ROW = f"SELECT {_COLUMNS} FROM token_state WHERE token=?"
+_UPSERT_ROW = (
+    f"INSERT INTO token_state (token, {_COLUMNS}) "
+    f"VALUES (?, {', '.join('?' for _ in ROW_FIELDS)}) "
+    f"ON CONFLICT(token) DO UPDATE SET {', '.join(f'{f}=excluded.{f}' for f in ROW_FIELDS)}"
+)
+_UPSERT_KV = "INSERT INTO kv (k, v) VALUES (?, ?) ON CONFLICT(k) DO UPDATE SET v=excluded.v"
+_INSERT_OUTBOX = "INSERT INTO outbox (mode, url, payload, created_at) VALUES (?, ?, ?, ?)"
+
+
+class SqliteStateBackend(StateBackend):
+    name = "sqlite"
+    write_behind = True
+    single_writer = True
+
+    def __init__(
+        self,
+        path: Path,
+        busy_timeout: float = 10,
+        mmap_size: int = 256 * 1024 * 1024,
+        cache_kb: int = 16384,
+        cached_statements: int = 256,
+    ):
+        self.path = Path(path)
+        self.busy_timeout = busy_timeout
+        self.mmap_size = mmap_size
+        self.cache_kb = cache_kb
+        self.cached_statements = cached_statements
+        # One long-lived connection per thread. The worker loop and the WS
+        # path run on different threads, and sqlite3 connections must not be
+        # shared between them.
+        self._local = threading.local()
+        self._lock = threading.RLock()
+
+    @property
+    def archive_path(self) -> Path:
+        return self.path.with_name(f"{self.path.stem}_archive{self.path.suffix}")
+
+    def _open(self) -> sqlite3.Connection:
+        c = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            cached_statements=self.cached_statements,
+        )
+        # Must precede journal_mode=WAL to take effect on a brand new file.
+        c.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        c.execute("PRAGMA journal_mode=WAL")
+        c.execute("PRAGMA synchronous=NORMAL")
+        c.execute(f"PRAGMA mmap_size={self.mmap_size}")
+        c.execute(f"PRAGMA cache_size=-{self.cache_kb}")
+        c.execute("PRAGMA temp_store=MEMORY")
+        return c
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Return this thread's connection, opening it on first use.
+
+        Used as `with self._connect() as c:` the block commits (or rolls back)
+        on exit but leaves the connection open, so statements stay prepared
+        between calls.
+        """
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = self._open()
+            self._local.conn = c
+        return c
+
+    def close(self) -> None:
+        c = getattr(self._local, "conn", None)
+        if c is not None:
+            c.close()
+            self._local.conn = None
+
+    def _migrate(self, c: sqlite3.Connection) -> int:
+        """
+        Bring the schema up to date, one migration per transaction.
+        Returns the resulting schema version.
+        """
+        while True:
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                version = c.execute("PRAGMA user_version").fetchone()[0]
+                if version >= len(_MIGRATIONS):
+                    c.rollback()
+                    return version
+                _MIGRATIONS[version](c)
+                c.execute(f"PRAGMA user_version={version + 1}")
+                c.commit()
+            except Exception:
+                c.rollback()
+                raise
+            print(f"[state] migrated schema to v{version + 1}", flush=True)
+
+    @staticmethod
+    def _incremental(c: sqlite3.Connection) -> bool:
+        return c.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+    def init(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        c = self._connect()
+        self._migrate(c)
+        if not self._incremental(c):
+            print(
+                f"[state] {self.path.name} predates incremental auto_vacuum; freed pages are "
+                "not reclaimed until it is converted (STATE_VACUUM_CONVERT)",
+                flush=True,
+            )
+
+    def enable_reclaim(self) -> bool:
+        # auto_vacuum can only change on an empty database (see _open) or
+        # through a VACUUM, which rewrites the file holding the write lock.
+        c = self._connect()
+        if self._incremental(c):
+            return False
+        print(f"[state] converting {self.path.name} to incremental auto_vacuum", flush=True)
+        started = time.perf_counter()
+        c.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        c.execute("VACUUM")
+        print(f"[state] converted in {time.perf_counter() - started:.1f}s", flush=True)
+        return True
+
+    @contextmanager
+    def lock(self, token: str) -> Iterator[None]:
+        with self._lock:
+            yield
+
+    def load_row(self, token: str) -> dict | None:
+        row = self._connect().execute(_SELECT_ROW, (token,)).fetchone()
+        return dict(zip(ROW_FIELDS, row)) if row else None
+
+    def load_hot_rows(self, limit: int) -> list[tuple[str, dict]]:
+        rows = self._connect().execute(
+            f"""
+            SELECT token, {_COLUMNS}
+            FROM token_state
+            ORDER BY last_seen DESC
+            LIMIT ?
+        """,
+            (limit,),
+        ).fetchall()
+        return [(token, dict(zip(ROW_FIELDS, values))) for token, *values in rows]
+
+    def write_rows(
+        self,
+        rows: list[tuple[str, dict]],
+        kv: list[tuple[str, str | None]],
+        outbox: list[tuple] = (),
+    ) -> None:
+        with self._connect() as c:
+            c.executemany(_UPSERT_ROW, ((t, *(r[f] for f in ROW_FIELDS)) for t, r in rows))
+            c.executemany(_UPSERT_KV, kv)
+            c.executemany(_INSERT_OUTBOX, outbox)
+
+    def kv_get(self, key: str) -> str | None:
+        row = self._connect().execute("SELECT v FROM kv WHERE k=?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def kv_items(self) -> list[tuple[str, str | None]]:
+        return self._connect().execute("SELECT k, v FROM kv").fetchall()
+
+    def recent_rows(self, cutoff: int, limit: int) -> list[tuple[str, dict]]:
+        rows = self._connect().execute(
+            f"""
+            SELECT token, {_COLUMNS}
+            FROM token_state
+            WHERE last_seen >= ?
+            ORDER BY last_seen DESC
+            LIMIT ?
+        """,
+            (cutoff, limit),
+        ).fetchall()
+        return [(token, dict(zip(ROW_FIELDS, values))) for token, *values in rows]
+
+    def rows_since(self, start_ts: int) -> list[tuple[str, dict]]:
+        rows = self._connect().execute(
+            f"""
+            SELECT token, {_COLUMNS}
+            FROM token_state
+            WHERE last_seen >= ?
+            ORDER BY last_seen ASC
+        """,
+            (start_ts,),
+        ).fetchall()
+        return [(token, dict(zip(ROW_FIELDS, values))) for token, *values in rows]
+
+    def outbox_due(self, now: float, limit: int) -> list[OutboxMessage]:
+        # Only the sender thread reads the outbox, so nothing needs claiming.
+        rows = self._connect().execute(
+            """
+            SELECT id, mode, url, payload, created_at, attempts
+            FROM outbox
+            WHERE dead_at IS NULL AND next_attempt_at <= ?
+            ORDER BY id
+            LIMIT ?
+        """,
+            (now, limit),
+        ).fetchall()
+        return [OutboxMessage(*row) for row in rows]
+
+    def outbox_finish(self, sent: list, retry: list[tuple], dead: list[tuple], release: list, now: float) -> None:
+        with self._connect() as c:
+            c.executemany("DELETE FROM outbox WHERE id=?", ((i,) for i in sent))
+            c.executemany(
+                "UPDATE outbox SET attempts=attempts+1, next_attempt_at=?, last_error=? WHERE id=?",
+                ((due, error, i) for i, due, error in retry),
+            )
+            c.executemany(
+                "UPDATE outbox SET attempts=attempts+1, last_error=?, dead_at=? WHERE id=?",
+                ((error, now, i) for i, error in dead),
+            )
+
+    def outbox_backlog(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM outbox WHERE dead_at IS NULL").fetchone()[0]
+
+    def _attach_archive(self, c: sqlite3.Connection):
+        if any(row[1] == "archive" for row in c.execute("PRAGMA database_list")):
+            return
+        c.execute("ATTACH DATABASE ? AS archive", (str(self.archive_path),))
+        # Keep in step with the main token_state schema.
+        c.execute(
+            """
+        CREATE TABLE IF NOT EXISTS archive.token_state (
+            token TEXT PRIMARY KEY,
+            last_sent INTEGER,
+            sent_count INTEGER,
+            first_seen INTEGER,
+            last_seen INTEGER,
+            liquidity REAL,
+            volume_5m REAL,
+            price_change_5m REAL,
+            age_minutes REAL,
+            metrics_extra TEXT,
+            muted_until INTEGER,
+            confirm_count INTEGER,
+            confirm_window_start INTEGER,
+            last_severity TEXT,
+            archived_at INTEGER
+        )
+        """
+        )
+
+    def sweep(self, cutoff: int, batch_size: int, now: int) -> list[str]:
+        # Rows move to the attached archive DB so engine.db itself shrinks.
+        c = self._connect()
+        self._attach_archive(c)
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            tokens = [
+                row[0]
+                for row in c.execute(
+                    "SELECT token FROM main.token_state WHERE last_seen < ? LIMIT ?",
+                    (cutoff, batch_size),
+                )
+            ]
+            c.executemany(
+                f"INSERT OR REPLACE INTO archive.token_state (token, {_COLUMNS}, archived_at) "
+                f"SELECT token, {_COLUMNS}, ? FROM main.token_state WHERE token=?",
+                ((now, t) for t in tokens),
+            )
+            c.executemany("DELETE FROM main.token_state WHERE token=?", ((t,) for t in tokens))
+            c.commit()
+        except Exception:
+            c.rollback()
+            raise
+        return tokens
+
+    def reclaim(self, pause: float, should_stop: Callable[[], bool]) -> int:
+        # At least one step runs per call, so a caller that stops early (to let
+        # queued writes through) still makes progress on every call.
+        c = self._connect()
+        if not self._incremental(c):
+            # Freed pages stay in the file until enable_reclaim() has run.
+            return 0
+        vacuumed = 0
+        free = c.execute("PRAGMA freelist_count").fetchone()[0]
+        while free:
+            # executescript steps the pragma to completion; execute() frees a
+            # single page per call.
+            c.executescript("PRAGMA incremental_vacuum(1000)")
+            remaining = c.execute("PRAGMA freelist_count").fetchone()[0]
+            if remaining >= free:
+                break
+            vacuumed += free - remaining
+            free = remaining
+            if should_stop():
+                break
+            time.sleep(pause)
+        return vacuumed
+
+
+# --------------------
+# In-memory
+# --------------------
+
+
+class MemoryStateBackend(StateBackend):
+    """
+    Process-local store with no persistence, for replay runs and benchmarks.
+    Swept rows are dropped rather than archived.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._rows: dict[str, dict] = {}
+        self._kv: dict[str, str | None] = {}
+        # id -> [mode, url, payload, created_at, attempts, next_attempt_at, last_error, dead_at]
+        self._outbox: dict[int, list] = {}
+        self._outbox_ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def lock(self, token: str) -> Iterator[None]:
+        with self._lock:
+            yield
+
+    def load_row(self, token: str) -> dict | None:
+        row = self._rows.get(token)
+        return dict(row) if row is not None else None
+
+    def write_rows(
+        self,
+        rows: list[tuple[str, dict]],
+        kv: list[tuple[str, str | None]],
+        outbox: list[tuple] = (),
+    ) -> None:
+        with self._lock:
+            for token, row in rows:
+                self._rows[token] = dict(row)
+            self._kv.update(kv)
+            for mode, url, payload, created_at in outbox:
+                self._outbox[next(self._outbox_ids)] = [mode, url, payload, created_at, 0, 0.0, None, None]
+
+    def outbox_due(self, now: float, limit: int) -> list[OutboxMessage]:
+        with self._lock:
+            due = [
+                OutboxMessage(i, m[0], m[1], m[2], m[3], m[4])
+                for i, m in self._outbox.items()
+                if m[7] is None and m[5] <= now
+            ]
+        return due[:limit]
+
+    def outbox_finish(self, sent: list, retry: list[tuple], dead: list[tuple], release: list, now: float) -> None:
+        with self._lock:
+            for i in sent:
+                self._outbox.pop(i, None)
+            for i, due, error in retry:
+                m = self._outbox[i]
+                m[4] += 1
+                m[5] = due
+                m[6] = error
+            for i, error in dead:
+                m = self._outbox[i]
+                m[4] += 1
+                m[6] = error
+                m[7] = now
+
+    def outbox_backlog(self) -> int:
+        with self._lock:
+            return sum(m[7] is None for m in self._outbox.values())
+
+    def kv_get(self, key: str) -> str | None:
+        return self._kv.get(key)
+
+    def kv_items(self) -> list[tuple[str, str | None]]:
+        with self._lock:
+            return list(self._kv.items())
+
+    def _matching(self, cutoff: int) -> list[tuple[str, dict]]:
+        with self._lock:
+            return [
+                (token, dict(row))
+                for token, row in self._rows.items()
+                if (row["last_seen"] or 0) >= cutoff
+            ]
+
+    def recent_rows(self, cutoff: int, limit: int) -> list[tuple[str, dict]]:
+        rows = self._matching(cutoff)
+        rows.sort(key=lambda tr: tr[1]["last_seen"], reverse=True)
+        return rows[:limit]
+
+    def rows_since(self, start_ts: int) -> list[tuple[str, dict]]:
+        rows = self._matching(start_ts)
+        rows.sort(key=lambda tr: tr[1]["last_seen"])
+        return rows
+
+    def sweep(self, cutoff: int, batch_size: int, now: int) -> list[str]:
+        with self._lock:
+            tokens = [
+                token
+                for token, row in self._rows.items()
+                if (row["last_seen"] or 0) < cutoff
+            ][:batch_size]
+            for token in tokens:
+                del self._rows[token]
+        return tokens
+
+
+# --------------------
+# Redis protocol
+# --------------------
+
+
+class RedisError(Exception):
+    pass
+
+
+class LockLostError(RedisError):
+    """A per-token lock expired, or was taken over, before its write."""
+
+
+# Deletes the lock only while it still holds this owner's token.
+RELEASE_LOCK_SCRIPT = 'if redis.call("GET", KEYS[1]) == ARGV[1] then return redis.call("DEL", KEYS[1]) end return 0'
+
+
+class _RespConnection:
+    """
+    Minimal RESP2 client: just enough for the commands below, with
+    pipelining. Avoids a hard dependency on redis-py.
+    """
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for a in args:
+            if isinstance(a, bytes):
+                b = a
+            elif isinstance(a, str):
+                b = a.encode()
+            else:
+                b = repr(a).encode() if isinstance(a, float) else str(a).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(b), b))
+        return b"".join(out)
+
+    def _read(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("redis connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            if n < 0:
+                return None
+            data = self._file.read(n + 2)
+            return data[:-2].decode()
+        if kind == b"*":
+            n = int(rest)
+            if n < 0:
+                return None
+            return [self._read() for _ in range(n)]
+        raise RedisError(f"unexpected reply {line!r}")
+
+    def pipeline(self, commands: list[tuple]) -> list:
+        """Send all commands in one write and read every reply in order."""
+        self._sock.sendall(b"".join(self._encode(cmd) for cmd in commands))
+        replies = [self._read() for _ in commands]
+        for r in replies:
+            if isinstance(r, RedisError):
+                raise r
+        return replies
+
+    def call(self, *args):
+        return self.pipeline([args])[0]
+
+    def close(self) -> None:
+        try:
+            self._file.close()
+            self._sock.close()
+        except OSError:
+            pass
+
+
+class RedisStateBackend(StateBackend):
+    """
+    token_state rows as hashes ({prefix}ts:<token>), a sorted set of tokens
+    by last_seen ({prefix}seen) for time queries, and kv as one hash.
+
+    Every read-modify-write holds a short per-token lock (SET NX PX); the
+    row, the index and the lock release are written in one MULTI/EXEC
+    under WATCH of the lock, so several workers can share the state safely.
+    A transaction that outlives lock_ms and loses the lock writes nothing
+    and raises LockLostError; the lock itself is only ever deleted by its
+    owner. Rows also carry a TTL of the retention horizon, so Redis expires
+    idle mints on its own; sweep() trims the index and deletes rows still
+    past the horizon, re-checked under WATCH.
+
+    Outbox messages are JSON records in one hash ({prefix}outbox) with a
+    sorted set of ids by due time ({prefix}outbox:due); given-up ones move
+    to {prefix}outbox:dead. outbox_due() claims each message with a SET NX
+    key that expires after outbox_claim_ms and pushes its due time past the
+    claim, so workers sharing the store never send the same message twice
+    and a crashed sender's claims fall back into the queue.
+    """
+
+    name = "redis"
+    # sweep() retries a batch this often when concurrent writes abort it.
+    SWEEP_ATTEMPTS = 5
+
+    def __init__(
+        self,
+        url: str,
+        prefix: str = "se:",
+        timeout: float = 2.0,
+        lock_ms: int = 5000,
+        row_ttl_seconds: int = 0,
+        outbox_claim_ms: int = 60_000,
+    ):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self.lock_ms = lock_ms
+        self.row_ttl_seconds = row_ttl_seconds
+        self.outbox_claim_ms = outbox_claim_ms
+        self._local = threading.local()
+        self._seen_key = f"{prefix}seen"
+        self._kv_key = f"{prefix}kv"
+        self._outbox_key = f"{prefix}outbox"
+        self._outbox_due_key = f"{prefix}outbox:due"
+        self._outbox_dead_key = f"{prefix}outbox:dead"
+        self._owner = uuid.uuid4().hex
+
+    def _conn(self) -> _RespConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = _RespConnection(self.host, self.port, self.timeout)
+            setup = []
+            if self.password:
+                setup.append(("AUTH", self.password))
+            if self.db:
+                setup.append(("SELECT", self.db))
+            if setup:
+                conn.pipeline(setup)
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def init(self) -> None:
+        self._conn().call("PING")
+
+    def _row_key(self, token: str) -> str:
+        return f"{self.prefix}ts:{token}"
+
+    @staticmethod
+    def _decode_row(flat: list | None) -> dict | None:
+        if not flat:
+            return None
+        raw = dict(zip(flat[::2], flat[1::2]))
+        row = {}
+        for f in ROW_FIELDS:
+            v = raw.get(f)
+            if v is not None and f in _INT_FIELDS:
+                v = int(v)
+            elif v is not None and f in _FLOAT_FIELDS:
+                v = float(v)
+            row[f] = v
+        return row
+
+    @contextmanager
+    def lock(self, token: str) -> Iterator[None]:
+        conn = self._conn()
+        key = f"{self.prefix}lock:{token}"
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_ms / 1000
+        while conn.call("SET", key, owner, "NX", "PX", self.lock_ms) is None:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"state lock busy for {token}")
+            time.sleep(0.001)
+        self._local.held = (key, owner)
+        try:
+            yield
+        finally:
+            # write_rows releases the lock inside its MULTI; this covers
+            # read-only sections and failures.
+            if getattr(self._local, "held", None) == (key, owner):
+                self._local.held = None
+                conn.call("EVAL", RELEASE_LOCK_SCRIPT, 1, key, owner)
+
+    def load_row(self, token: str) -> dict | None:
+        return self._decode_row(self._conn().call("HGETALL", self._row_key(token)))
+
+    def write_rows(
+        self,
+        rows: list[tuple[str, dict]],
+        kv: list[tuple[str, str | None]],
+        outbox: list[tuple] = (),
+    ) -> None:
+        commands: list[tuple] = [("MULTI",)]
+        for token, row in rows:
+            key = self._row_key(token)
+            fields = [x for f in ROW_FIELDS if row[f] is not None for x in (f, row[f])]
+            commands.append(("DEL", key))
+            if fields:
+                commands.append(("HSET", key, *fields))
+            if self.row_ttl_seconds > 0:
+                commands.append(("EXPIRE", key, self.row_ttl_seconds))
+            commands.append(("ZADD", self._seen_key, row["last_seen"] or 0, token))
+        for k, v in kv:
+            if v is None:
+                commands.append(("HDEL", self._kv_key, k))
+            else:
+                commands.append(("HSET", self._kv_key, k, v))
+        for mode, url, payload, created_at in outbox:
+            # Time-ordered ids keep messages with equal due times in order.
+            msg_id = f"{time.time_ns():020d}{uuid.uuid4().hex[:8]}"
+            record = {"mode": mode, "url": url, "payload": payload, "created_at": created_at, "attempts": 0}
+            commands.append(("HSET", self._outbox_key, msg_id, json.dumps(record)))
+            commands.append(("ZADD", self._outbox_due_key, created_at, msg_id))
+        conn = self._conn()
+        held = getattr(self._local, "held", None)
+        if held:
+            # Only write while the lock is still ours: WATCH it, check the
+            # owner, and EXEC aborts if it changes (or expires) meanwhile.
+            key, owner = held
+            if conn.pipeline([("WATCH", key), ("GET", key)])[1] != owner:
+                conn.call("UNWATCH")
+                self._local.held = None
+                raise LockLostError(f"state lock {key} expired before the write")
+            commands.append(("DEL", key))
+        commands.append(("EXEC",))
+        replies = conn.pipeline(commands)
+        if held:
+            self._local.held = None
+            if replies[-1] is None:
+                raise LockLostError(f"state lock {held[0]} lost during the write")
+
+    def kv_get(self, key: str) -> str | None:
+        return self._conn().call("HGET", self._kv_key, key)
+
+    def kv_items(self) -> list[tuple[str, str | None]]:
+        flat = self._conn().call("HGETALL", self._kv_key) or []
+        return list(zip(flat[::2], flat[1::2]))
+
+    def _load_many(self, tokens: list[str]) -> list[tuple[str, dict]]:
+        if not tokens:
+            return []
+        replies = self._conn().pipeline([("HGETALL", self._row_key(t)) for t in tokens])
+        out = []
+        for token, flat in zip(tokens, replies):
+            row = self._decode_row(flat)
+            if row is not None:
+                out.append((token, row))
+        return out
+
+    def recent_rows(self, cutoff: int, limit: int) -> list[tuple[str, dict]]:
+        tokens = self._conn().call(
+            "ZREVRANGEBYSCORE", self._seen_key, "+inf", cutoff, "LIMIT", 0, limit
+        )
+        return self._load_many(tokens)
+
+    def rows_since(self, start_ts: int) -> list[tuple[str, dict]]:
+        tokens = self._conn().call("ZRANGEBYSCORE", self._seen_key, start_ts, "+inf")
+        return self._load_many(tokens)
+
+    def _claim_key(self, msg_id: str) -> str:
+        return f"{self.prefix}outbox:claim:{msg_id}"
+
+    def outbox_due(self, now: float, limit: int) -> list[OutboxMessage]:
+        conn = self._conn()
+        ids = conn.call("ZRANGEBYSCORE", self._outbox_due_key, "-inf", now, "LIMIT", 0, limit)
+        if not ids:
+            return []
+        claims = conn.pipeline(
+            [("SET", self._claim_key(i), self._owner, "NX", "PX", self.outbox_claim_ms) for i in ids]
+        )
+        ids = [i for i, ok in zip(ids, claims) if ok is not None]
+        if not ids:
+            return []
+        hold_until = now + self.outbox_claim_ms / 1000
+        replies = conn.pipeline(
+            [("ZADD", self._outbox_due_key, hold_until, i) for i in ids]
+            + [("HGET", self._outbox_key, i) for i in ids]
+        )[len(ids):]
+        out = []
+        for msg_id, raw in zip(ids, replies):
+            if raw is None:
+                continue
+            r = json.loads(raw)
+            out.append(OutboxMessage(msg_id, r["mode"], r["url"], r["payload"], r["created_at"], r["attempts"]))
+        return out
+
+    def outbox_finish(self, sent: list, retry: list[tuple], dead: list[tuple], release: list, now: float) -> None:
+        conn = self._conn()
+        counted = [i for i, *_ in retry] + [i for i, _ in dead]
+        records = dict(zip(counted, conn.pipeline([("HGET", self._outbox_key, i) for i in counted]))) if counted else {}
+        commands: list[tuple] = [("MULTI",)]
+        for i in sent:
+            commands.append(("ZREM", self._outbox_due_key, i))
+            commands.append(("HDEL", self._outbox_key, i))
+        for i, due, error in retry:
+            if records.get(i) is None:
+                continue
+            r = json.loads(records[i])
+            r["attempts"] += 1
+            r["last_error"] = error
+            commands.append(("HSET", self._outbox_key, i, json.dumps(r)))
+            commands.append(("ZADD", self._outbox_due_key, due, i))
+        for i, error in dead:
+            if records.get(i) is None:
+                continue
+            r = json.loads(records[i])
+            r["attempts"] += 1
+            r["last_error"] = error
+            r["dead_at"] = now
+            commands.append(("ZREM", self._outbox_due_key, i))
+            commands.append(("HDEL", self._outbox_key, i))
+            commands.append(("HSET", self._outbox_dead_key, i, json.dumps(r)))
+        if release:
+            # Back to the front of the queue: ids are creation-ordered.
+            commands.append(("ZADD", self._outbox_due_key, *(x for i in release for x in (0, i))))
+        settled = [*sent, *counted, *release]
+        if settled:
+            commands.append(("DEL", *(self._claim_key(i) for i in settled)))
+        commands.append(("EXEC",))
+        conn.pipeline(commands)
+
+    def outbox_backlog(self) -> int:
+        return self._conn().call("ZCARD", self._outbox_due_key)
+
+    def sweep(self, cutoff: int, batch_size: int, now: int) -> list[str]:
+        conn = self._conn()
+        for _ in range(self.SWEEP_ATTEMPTS):
+            tokens = conn.call(
+                "ZRANGEBYSCORE", self._seen_key, "-inf", f"({cutoff}", "LIMIT", 0, batch_size
+            )
+            if not tokens:
+                return []
+            # Another worker may write one of these rows meanwhile: WATCH
+            # them, re-check last_seen, and let EXEC abort on any change.
+            replies = conn.pipeline(
+                [("WATCH", *(self._row_key(t) for t in tokens))]
+                + [("ZSCORE", self._seen_key, t) for t in tokens]
+            )
+            stale = [t for t, s in zip(tokens, replies[1:]) if s is not None and float(s) < cutoff]
+            if not stale:
+                conn.call("UNWATCH")
+                return []
+            replies = conn.pipeline(
+                [
+                    ("MULTI",),
+                    ("ZREM", self._seen_key, *stale),
+                    ("DEL", *(self._row_key(t) for t in stale)),
+                    ("EXEC",),
+                ]
+            )
+            if replies[-1] is not None:
+                return stale
+        return []
@@ -1,77 +1,282 @@
+import atexit
 import json
-import sqlite3
+import os
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from pathlib import Path
 
-DB_PATH = Path("state/engine.db")
-DB_PATH.parent.mkdir(exist_ok=True)
+from app.services.state_backends import (
+    METRIC_COLUMNS,
+    MemoryStateBackend,
+    OutboxMessage,
+    RedisStateBackend,
+    SqliteStateBackend,
+    StateBackend,
+    join_metrics,
+    split_metrics,
+)
+from app.services.state_writer import StateWriter
+
+# sqlite | memory | redis
+BACKEND = os.getenv("STATE_BACKEND", "sqlite").lower()
+DB_PATH = Path(os.getenv("STATE_DB_PATH", "state/engine.db"))
+REDIS_URL = os.getenv("STATE_REDIS_URL", "redis://127.0.0.1:6379/0")
+REDIS_PREFIX = os.getenv("STATE_REDIS_PREFIX", "se:")
+
+SQLITE_BUSY_TIMEOUT = float(os.getenv("STATE_SQLITE_BUSY_TIMEOUT", "10"))
+SQLITE_MMAP_SIZE = int(os.getenv("STATE_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_KB = int(os.getenv("STATE_SQLITE_CACHE_KB", "16384"))
+SQLITE_CACHED_STATEMENTS = int(os.getenv("STATE_SQLITE_CACHED_STATEMENTS", "256"))
+
+# Write-behind cache for token_state / kv, used when the backend is owned by
+# this process (sqlite). Dirty rows are flushed in one transaction every
+# STATE_FLUSH_INTERVAL_MS (0 = write-through).
+CACHE_MAX_ROWS = int(os.getenv("STATE_CACHE_MAX_ROWS", "50000"))
+CACHE_TTL_SECONDS = int(os.getenv("STATE_CACHE_TTL_SECONDS", "3600"))
+FLUSH_INTERVAL_MS = int(os.getenv("STATE_FLUSH_INTERVAL_MS", "1000"))
+
+# Rows not seen for RETENTION_HOURS are retired (archived for sqlite) in
+# batches of RETENTION_BATCH every RETENTION_INTERVAL_SECONDS.
+RETENTION_HOURS = int(os.getenv("STATE_RETENTION_HOURS", "72"))
+RETENTION_BATCH = int(os.getenv("STATE_RETENTION_BATCH", "2000"))
+RETENTION_INTERVAL_SECONDS = int(os.getenv("STATE_RETENTION_INTERVAL_SECONDS", "600"))
+RETENTION_PAUSE_SECONDS = float(os.getenv("STATE_RETENTION_PAUSE_SECONDS", "0.05"))
+# Opt-in: let the sweeper convert a store created before incremental vacuum
+# (one full VACUUM of engine.db after its first sweep, blocking writes while
+# it runs). Until then freed pages are not reclaimed.
+VACUUM_CONVERT = os.getenv("STATE_VACUUM_CONVERT", "false").lower() in ("1", "true", "yes")
+
+_BACKEND: StateBackend | None = None
+_WRITER: StateWriter | None = None
+
+
+def make_backend(name: str | None = None) -> StateBackend:
+    name = (name or BACKEND).lower()
+    if name == "sqlite":
+        return SqliteStateBackend(
+            DB_PATH,
+            busy_timeout=SQLITE_BUSY_TIMEOUT,
+            mmap_size=SQLITE_MMAP_SIZE,
+            cache_kb=SQLITE_CACHE_KB,
+            cached_statements=SQLITE_CACHED_STATEMENTS,
+        )
+    if name == "memory":
+        return MemoryStateBackend()
+    if name == "redis":
+        return RedisStateBackend(
+            REDIS_URL,
+            prefix=REDIS_PREFIX,
+            row_ttl_seconds=max(RETENTION_HOURS, 0) * 3600,
+        )
+    raise ValueError(f"unknown STATE_BACKEND: {name}")
+
+
+def get_backend() -> StateBackend:
+    global _BACKEND
+    if _BACKEND is None:
+        _BACKEND = make_backend()
+    return _BACKEND
+
+
+def get_writer() -> StateWriter | None:
+    """The writer thread for single_writer backends (sqlite), else None."""
+    global _WRITER
+    backend = get_backend()
+    if _WRITER is None and backend.single_writer:
+        _WRITER = StateWriter(backend)
+    return _WRITER
+
+
+def set_backend(backend: StateBackend):
+    """Swap the state store (replay, benchmarks). Pending writes go to the old one first."""
+    global _BACKEND, _WRITER, _KV_COMPLETE
+    with _CACHE_LOCK:
+        if _BACKEND is not None:
+            flush()
+        if _WRITER is not None:
+            _WRITER.stop()
+            _WRITER = None
+        _CACHE.clear()
+        _DIRTY.clear()
+        _KV.clear()
+        _KV_DIRTY.clear()
+        _OUTBOX.clear()
+        _KV_COMPLETE = False
+        _BACKEND = backend
+
+
+def _write(
+    rows: list[tuple[str, dict]],
+    kv: list[tuple[str, str | None]],
+    outbox: list[tuple] = (),
+) -> Future:
+    writer = get_writer()
+    if writer is not None:
+        return writer.write(rows, kv, outbox)
+    fut: Future = Future()
+    try:
+        get_backend().write_rows(rows, kv, outbox)
+        fut.set_result(None)
+    except Exception as e:
+        fut.set_exception(e)
+    return fut
+
+
+def _call(fn, *args):
+    writer = get_writer()
+    return writer.call(fn, *args) if writer is not None else fn(*args)
+
+
+def close():
+    if _BACKEND is not None:
+        _BACKEND.close()
 
 
-def _connect():
-    return sqlite3.connect(DB_PATH)
+def init():
+    backend = get_backend()
+    backend.init()
+    writer = get_writer()
+    if writer is not None:
+        writer.start()
+    if backend.write_behind:
+        _preload()
+        _start_flusher()
+
+
+class _CacheEntry:
+    __slots__ = ("row", "touched")
+
+    def __init__(self, row: dict, touched: float):
+        self.row = row
+        self.touched = touched
+
+
+# token -> entry, least recently used first. Guarded by _CACHE_LOCK together
+# with the dirty sets, the kv cache and the outbox messages not yet written.
+_CACHE: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+_DIRTY: set[str] = set()
+_KV: dict[str, str | None] = {}
+_KV_DIRTY: set[str] = set()
+_OUTBOX: list[tuple] = []
+_KV_COMPLETE = False
+_CACHE_LOCK = threading.RLock()
+_LAST_FLUSH = time.monotonic()
+_FLUSHER: threading.Thread | None = None
+_FLUSHER_STOP = threading.Event()
+
+
+def _preload():
+    global _KV_COMPLETE
+    backend = get_backend()
+    rows = backend.load_hot_rows(CACHE_MAX_ROWS)
+    kv_rows = backend.kv_items()
+
+    now = time.monotonic()
+    with _CACHE_LOCK:
+        for token, row in reversed(rows):
+            if token not in _CACHE:
+                _CACHE[token] = _CacheEntry(row, now)
+        for k, v in kv_rows:
+            _KV.setdefault(k, v)
+        _KV_COMPLETE = True
+
+
+def flush() -> int:
+    """
+    Write every dirty token_state row, kv entry and queued outbox message in
+    one transaction. Returns the number of rows written.
+
+    The batch is queued on the writer under the cache lock, so flushes reach
+    the store in order, but the wait for the commit happens outside it:
+    scanner transactions on other threads keep running meanwhile. Rows stay
+    dirty until their write is confirmed, so a failed write is retried by
+    the next flush and an in-flight row is never evicted. Outbox messages
+    are taken out of the queue (inserting them twice would send twice) and
+    put back in front if the write fails.
+    """
+    global _LAST_FLUSH
+    with _CACHE_LOCK:
+        _LAST_FLUSH = time.monotonic()
+        if not _DIRTY and not _KV_DIRTY and not _OUTBOX:
+            return 0
+        rows = [(token, _CACHE[token].row) for token in _DIRTY]
+        kvs = [(k, _KV[k]) for k in _KV_DIRTY]
+        outbox = _OUTBOX[:]
+        _OUTBOX.clear()
+        pending = _write(rows, kvs, outbox)
+
+    try:
+        pending.result()
+    except BaseException:
+        with _CACHE_LOCK:
+            _OUTBOX[:0] = outbox
+        raise
+    if outbox:
+        OUTBOX_READY.set()
+    with _CACHE_LOCK:
+        for token, row in rows:
+            entry = _CACHE.get(token)
+            # A newer version written meanwhile stays dirty.
+            if entry is None or entry.row is row:
+                _DIRTY.discard(token)
+        for k, v in kvs:
+            if _KV.get(k) == v:
+                _KV_DIRTY.discard(k)
+    return len(rows) + len(kvs)
+
+
+def _flush_due() -> bool:
+    return (time.monotonic() - _LAST_FLUSH) * 1000 >= FLUSH_INTERVAL_MS
+
+
+def _evict():
+    # Called with _CACHE_LOCK held. Dirty rows are never dropped unwritten:
+    # if the oldest entry is dirty everything pending is flushed first.
+    expire_before = time.monotonic() - CACHE_TTL_SECONDS
+    while _CACHE:
+        token, entry = next(iter(_CACHE.items()))
+        if len(_CACHE) <= CACHE_MAX_ROWS and entry.touched >= expire_before:
+            break
+        if token in _DIRTY:
+            flush()
+        del _CACHE[token]
+
+
+def _flush_loop():
+    interval = max(FLUSH_INTERVAL_MS, 1) / 1000
+    while not _FLUSHER_STOP.wait(interval):
+        try:
+            flush()
+            with _CACHE_LOCK:
+                _evict()
+        except Exception as e:
+            print(f"[state] flush error: {e}", flush=True)
 
 
-def init():
-    with _connect() as c:
-        c.execute(
-            """
-        CREATE TABLE IF NOT EXISTS token_state (
-            token TEXT PRIMARY KEY,
-            last_sent INTEGER,
-            sent_count INTEGER DEFAULT 0,
-            first_seen INTEGER,
-            last_seen INTEGER,
-            last_metrics TEXT,
-            muted_until INTEGER DEFAULT 0,
-            confirm_count INTEGER DEFAULT 0,
-            confirm_window_start INTEGER DEFAULT 0,
-            last_severity TEXT DEFAULT 'near_pass'
-        )
-        """
-        )
-        c.execute(
-            """
-        CREATE TABLE IF NOT EXISTS kv (
-            k TEXT PRIMARY KEY,
-            v TEXT
-        )
-        """
-        )
+def _start_flusher():
+    global _FLUSHER
+    if FLUSH_INTERVAL_MS <= 0 or (_FLUSHER is not None and _FLUSHER.is_alive()):
+        return
+    _FLUSHER_STOP.clear()
+    _FLUSHER = threading.Thread(target=_flush_loop, name="state-flusher", daemon=True)
+    _FLUSHER.start()
 
 
-def upsert_seen(token: str, metrics: dict):
-    now = int(time.time())
-    with _connect() as c:
-        row = c.execute("SELECT token FROM token_state WHERE token=?", (token,)).fetchone()
-        metrics_json = json.dumps(metrics or {})
-        if not row:
-            c.execute(
-                """
-                INSERT INTO token_state (token, first_seen, last_seen, last_metrics)
-                VALUES (?, ?, ?, ?)
-            """,
-                (token, now, now, metrics_json),
-            )
-        else:
-            c.execute(
-                """
-                UPDATE token_state SET last_seen=?, last_metrics=? WHERE token=?
-            """,
-                (now, metrics_json, token),
-            )
+def shutdown():
+    global _FLUSHER
+    _FLUSHER_STOP.set()
+    _RETENTION_STOP.set()
+    if _FLUSHER is not None:
+        _FLUSHER.join()
+        _FLUSHER = None
+    flush()
+    if _WRITER is not None:
+        _WRITER.stop()
 
 
-def should_mute(token: str) -> int:
-    now = int(time.time())
-    with _connect() as c:
-        row = c.execute(
-            "SELECT muted_until FROM token_state WHERE token=?",
-            (token,),
-        ).fetchone()
-        if not row:
-            return 0
-        muted_until = row[0] or 0
-        return muted_until if muted_until > now else 0
+atexit.register(shutdown)
 
 
 def adaptive_cooldown(base_cooldown: int, sent_count: int) -> int:
@@ -82,49 +287,250 @@ def adaptive_cooldown(base_cooldown: int, sent_count: int) -> int:
     return int(base_cooldown * 2.5)
 
 
-def allow_alert(token: str, base_cooldown: int) -> bool:
-    now = int(time.time())
-    with _connect() as c:
-        row = c.execute(
-            """
-            SELECT last_sent, sent_count, muted_until
-            FROM token_state WHERE token=?
-        """,
-            (token,),
-        ).fetchone()
-
-        if not row:
-            c.execute(
-                """
-                INSERT INTO token_state (token, last_sent, sent_count, first_seen, last_seen)
-                VALUES (?, ?, 1, ?, ?)
-            """,
-                (token, now, now, now),
-            )
+class TokenStateTxn:
+    """
+    Unit of work over a single token_state row.
+
+    The row is read once when the block is entered; the methods below apply
+    the seen / mute / escalation / cooldown / repeat rules to it in memory and
+    the result is written back in one step when the block exits. With a
+    write-behind backend the row comes from (and goes back to) the in-process
+    cache and reaches the store with the next batched flush(); otherwise the
+    block holds the backend's per-token lock and writes through. Each method
+    has the same semantics and return value as the module-level function of
+    the same name.
+
+        with TokenStateTxn(token) as st:
+            st.upsert_seen(metrics)
+            if st.maybe_auto_mute(15, 4, 60):
+                return
+    """
+
+    def __init__(self, token: str):
+        self.token = token
+        self.now = int(time.time())
+        self.row: dict | None = None
+        self._dirty = False
+        self._outbox: list[tuple] = []
+        self._backend = get_backend()
+        self._lock = None
+
+    def __enter__(self) -> "TokenStateTxn":
+        if not self._backend.write_behind:
+            self._lock = self._backend.lock(self.token)
+            self._lock.__enter__()
+            try:
+                self.row = self._backend.load_row(self.token)
+            except BaseException:
+                self._lock.__exit__(None, None, None)
+                raise
+            return self
+
+        _CACHE_LOCK.acquire()
+        try:
+            entry = _CACHE.get(self.token)
+            if entry is not None:
+                _CACHE.move_to_end(self.token)
+                entry.touched = time.monotonic()
+                self.row = dict(entry.row)
+            else:
+                self.row = self._backend.load_row(self.token)
+                if self.row is not None:
+                    _CACHE[self.token] = _CacheEntry(dict(self.row), time.monotonic())
+        except Exception:
+            _CACHE_LOCK.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if not self._backend.write_behind:
+            try:
+                if exc_type is None and (self._dirty or self._outbox):
+                    rows = [(self.token, self.row)] if self._dirty else []
+                    _write(rows, [], self._outbox).result()
+                    if self._outbox:
+                        OUTBOX_READY.set()
+            finally:
+                self._lock.__exit__(None, None, None)
+            return False
+
+        try:
+            if exc_type is None and self._dirty:
+                _CACHE[self.token] = _CacheEntry(self.row, time.monotonic())
+                _CACHE.move_to_end(self.token)
+                _DIRTY.add(self.token)
+            if exc_type is None:
+                _OUTBOX.extend(self._outbox)
+            _evict()
+            # Messages are committed right away (with this row), not with the
+            # next periodic flush.
+            due = _flush_due() or (exc_type is None and bool(self._outbox))
+        finally:
+            _CACHE_LOCK.release()
+        if due:
+            flush()
+        return False
+
+    def _create(self, **values) -> dict:
+        # Mirrors the column defaults of the token_state table.
+        self.row = {
+            "last_sent": None,
+            "sent_count": 0,
+            "first_seen": None,
+            "last_seen": None,
+            "liquidity": None,
+            "volume_5m": None,
+            "price_change_5m": None,
+            "age_minutes": None,
+            "metrics_extra": None,
+            "muted_until": 0,
+            "confirm_count": 0,
+            "confirm_window_start": 0,
+            "last_severity": "near_pass",
+        }
+        self.row.update(values)
+        self._dirty = True
+        return self.row
+
+    def _set(self, **values) -> None:
+        self.row.update(values)
+        self._dirty = True
+
+    def upsert_seen(self, metrics: dict) -> None:
+        values = dict(zip((*METRIC_COLUMNS, "metrics_extra"), split_metrics(metrics or {})))
+        if self.row is None:
+            self._create(first_seen=self.now, last_seen=self.now, **values)
+        else:
+            self._set(last_seen=self.now, **values)
+
+    def should_mute(self) -> int:
+        if self.row is None:
+            return 0
+        muted_until = self.row["muted_until"] or 0
+        return muted_until if muted_until > self.now else 0
+
+    def allow_alert(self, base_cooldown: int) -> bool:
+        row = self.row
+        if row is None:
+            self._create(last_sent=self.now, sent_count=1, first_seen=self.now, last_seen=self.now)
             return True
 
-        last_sent, sent_count, muted_until = row
-        muted_until = muted_until or 0
-        if muted_until > now:
+        if (row["muted_until"] or 0) > self.now:
             return False
 
-        cd = adaptive_cooldown(base_cooldown, sent_count or 0)
-        if not last_sent:
-            c.execute(
-                "UPDATE token_state SET last_sent=?, sent_count=sent_count+1 WHERE token=?",
-                (now, token),
-            )
+        last_sent = row["last_sent"]
+        cd = adaptive_cooldown(base_cooldown, row["sent_count"] or 0)
+        if not last_sent or self.now - last_sent >= cd:
+            self._set(last_sent=self.now, sent_count=(row["sent_count"] or 0) + 1)
             return True
 
-        if now - last_sent >= cd:
-            c.execute(
-                "UPDATE token_state SET last_sent=?, sent_count=sent_count+1 WHERE token=?",
-                (now, token),
-            )
+        return False
+
+    def maybe_auto_mute(self, window_minutes: int, after_alerts: int, mute_minutes: int) -> bool:
+        row = self.row
+        if row is None:
+            return False
+
+        if (row["muted_until"] or 0) > self.now:
+            return True
+
+        first_seen = row["first_seen"]
+        if (
+            first_seen
+            and (self.now - first_seen) <= window_minutes * 60
+            and (row["sent_count"] or 0) >= after_alerts
+        ):
+            self._set(muted_until=self.now + mute_minutes * 60)
             return True
 
         return False
 
+    def update_severity(self, severity: str) -> None:
+        if self.row is not None:
+            self._set(last_severity=severity)
+
+    def pass_escalation_check(
+        self,
+        metrics: dict,
+        pass_confirmations: int,
+        pass_window_minutes: int,
+        min_liq: float,
+        min_vol5m: float,
+    ) -> bool:
+        liq = float(metrics.get("liquidity", 0) or 0)
+        vol5m = float(metrics.get("volume_5m", 0) or 0)
+
+        if liq < min_liq or vol5m < min_vol5m:
+            return False
+
+        row = self.row
+        if row is None:
+            return False
+
+        confirm_count = row["confirm_count"] or 0
+        start = row["confirm_window_start"] or 0
+
+        if start == 0 or (self.now - start) > pass_window_minutes * 60:
+            confirm_count = 1
+            start = self.now
+        else:
+            confirm_count += 1
+
+        self._set(confirm_count=confirm_count, confirm_window_start=start)
+        return confirm_count >= pass_confirmations
+
+    def record_alert(self, severity: str) -> None:
+        if self.row is None:
+            self._create(
+                last_sent=self.now,
+                sent_count=1,
+                first_seen=self.now,
+                last_seen=self.now,
+                last_severity=severity,
+            )
+        else:
+            self._set(
+                last_sent=self.now,
+                sent_count=(self.row["sent_count"] or 0) + 1,
+                last_seen=self.now,
+                last_severity=severity,
+            )
+
+    def record_repeat(self, severity: str) -> dict:
+        row = self.row
+        if row is None:
+            return {}
+
+        self._set(last_seen=self.now, last_severity=severity)
+        return {
+            "first_seen": row["first_seen"],
+            "last_seen": self.now,
+            "repeat_count": row["sent_count"] or 1,
+        }
+
+    def queue_message(self, mode: str, payload: dict, url: str | None = None) -> None:
+        """
+        Add a message to the outbox, committed together with this row (or
+        not at all). `url` pins one webhook; None leaves the choice among
+        the mode's webhooks to the sender.
+        """
+        self._outbox.append((mode, url, json.dumps(payload), time.time()))
+
+
+def upsert_seen(token: str, metrics: dict):
+    with TokenStateTxn(token) as st:
+        st.upsert_seen(metrics)
+
+
+def should_mute(token: str) -> int:
+    with TokenStateTxn(token) as st:
+        return st.should_mute()
+
+
+def allow_alert(token: str, base_cooldown: int) -> bool:
+    with TokenStateTxn(token) as st:
+        return st.allow_alert(base_cooldown)
+
 
 def maybe_auto_mute(
     token: str,
@@ -132,38 +538,13 @@ def maybe_auto_mute(
     after_alerts: int,
     mute_minutes: int,
 ) -> bool:
-    now = int(time.time())
-    window_sec = window_minutes * 60
-    mute_sec = mute_minutes * 60
-
-    with _connect() as c:
-        row = c.execute(
-            """
-            SELECT sent_count, last_sent, first_seen, muted_until
-            FROM token_state WHERE token=?
-        """,
-            (token,),
-        ).fetchone()
-        if not row:
-            return False
-
-        sent_count, last_sent, first_seen, muted_until = row
-        if (muted_until or 0) > now:
-            return True
-
-        if first_seen and (now - first_seen) <= window_sec and (sent_count or 0) >= after_alerts:
-            c.execute(
-                "UPDATE token_state SET muted_until=? WHERE token=?",
-                (now + mute_sec, token),
-            )
-            return True
-
-        return False
+    with TokenStateTxn(token) as st:
+        return st.maybe_auto_mute(window_minutes, after_alerts, mute_minutes)
 
 
 def update_severity(token: str, severity: str):
-    with _connect() as c:
-        c.execute("UPDATE token_state SET last_severity=? WHERE token=?", (severity, token))
+    with TokenStateTxn(token) as st:
+        st.update_severity(severity)
 
 
 def pass_escalation_check(
@@ -174,138 +555,219 @@ def pass_escalation_check(
     min_liq: float,
     min_vol5m: float,
 ) -> bool:
-    now = int(time.time())
-    window_sec = pass_window_minutes * 60
-
-    liq = float(metrics.get("liquidity", 0) or 0)
-    vol5m = float(metrics.get("volume_5m", 0) or 0)
-
-    if liq < min_liq or vol5m < min_vol5m:
-        return False
-
-    with _connect() as c:
-        row = c.execute(
-            """
-            SELECT confirm_count, confirm_window_start
-            FROM token_state WHERE token=?
-        """,
-            (token,),
-        ).fetchone()
-
-        if not row:
-            return False
-
-        confirm_count, start = row
-        confirm_count = confirm_count or 0
-        start = start or 0
-
-        if start == 0 or (now - start) > window_sec:
-            confirm_count = 1
-            start = now
-        else:
-            confirm_count += 1
-
-        c.execute(
-            """
-            UPDATE token_state SET confirm_count=?, confirm_window_start=?
-            WHERE token=?
-        """,
-            (confirm_count, start, token),
+    with TokenStateTxn(token) as st:
+        return st.pass_escalation_check(
+            metrics,
+            pass_confirmations,
+            pass_window_minutes,
+            min_liq,
+            min_vol5m,
         )
 
-        return confirm_count >= pass_confirmations
-
 
 def kv_get(key: str, default: str = "") -> str:
-    with _connect() as c:
-        row = c.execute("SELECT v FROM kv WHERE k=?", (key,)).fetchone()
-        return row[0] if row and row[0] is not None else default
+    backend = get_backend()
+    if not backend.write_behind:
+        value = backend.kv_get(key)
+        return value if value is not None else default
+
+    with _CACHE_LOCK:
+        if key in _KV:
+            value = _KV[key]
+        elif _KV_COMPLETE:
+            value = None
+        else:
+            value = backend.kv_get(key)
+            if value is not None:
+                _KV[key] = value
+        return value if value is not None else default
 
 
 def kv_set(key: str, value: str):
-    with _connect() as c:
-        c.execute(
-            "INSERT INTO kv (k, v) VALUES (?, ?) ON CONFLICT(k) DO UPDATE SET v=excluded.v",
-            (key, value),
-        )
+    backend = get_backend()
+    if not backend.write_behind:
+        _write([], [(key, value)]).result()
+        return
+
+    with _CACHE_LOCK:
+        _KV[key] = value
+        _KV_DIRTY.add(key)
+        due = _flush_due()
+    if due:
+        flush()
 
 
 def top_recent(limit: int = 25, lookback_hours: int = 24):
     now = int(time.time())
     cutoff = now - lookback_hours * 3600
-    with _connect() as c:
-        rows = c.execute(
-            """
-            SELECT token, last_seen, last_metrics, last_severity, sent_count
-            FROM token_state
-            WHERE last_seen >= ?
-            ORDER BY last_seen DESC
-            LIMIT ?
-        """,
-            (cutoff, limit),
-        ).fetchall()
+    flush()
 
     out = []
-    for token, last_seen, last_metrics, last_severity, sent_count in rows:
-        try:
-            metrics = json.loads(last_metrics) if last_metrics else {}
-        except Exception:
-            metrics = {}
+    for token, row in get_backend().recent_rows(cutoff, limit):
         out.append(
             {
                 "token": token,
-                "last_seen": last_seen,
-                "metrics": metrics,
-                "severity": last_severity,
-                "sent_count": sent_count or 0,
+                "last_seen": row["last_seen"],
+                "metrics": join_metrics(row),
+                "severity": row["last_severity"],
+                "sent_count": row["sent_count"] or 0,
             }
         )
     return out
 
 
+def seen_since(start_ts: int) -> list[tuple[str, dict, int]]:
+    """
+    (token, metrics, last_seen) for every token seen at or after start_ts,
+    oldest first. Pending cache writes are flushed before reading.
+    """
+    flush()
+    return [
+        (token, join_metrics(row), row["last_seen"])
+        for token, row in get_backend().rows_since(start_ts)
+    ]
+
+
 def record_alert(token: str, severity: str):
-    now = int(time.time())
-    with _connect() as c:
-        c.execute(
-            """
-            INSERT INTO token_state (token, last_sent, sent_count, first_seen, last_seen, last_severity)
-            VALUES (?, ?, 1, ?, ?, ?)
-            ON CONFLICT(token) DO UPDATE SET
-                last_sent=excluded.last_sent,
-                sent_count=sent_count+1,
-                last_seen=excluded.last_seen,
-                last_severity=excluded.last_severity
-        """,
-            (token, now, now, now, severity),
-        )
+    with TokenStateTxn(token) as st:
+        st.record_alert(severity)
 
 
 def record_repeat(token: str, severity: str) -> dict:
-    now = int(time.time())
-    with _connect() as c:
-        row = c.execute(
-            """
-            SELECT first_seen, last_seen, sent_count
-            FROM token_state WHERE token=?
-        """,
-            (token,),
-        ).fetchone()
-
-        if not row:
-            return {}
+    with TokenStateTxn(token) as st:
+        return st.record_repeat(severity)
 
-        first_seen, last_seen, sent_count = row
-        c.execute(
-            """
-            UPDATE token_state
-            SET last_seen=?, last_severity=?
-            WHERE token=?
-        """,
-            (now, severity, token),
-        )
 
-        return {
-            "first_seen": first_seen,
-            "last_seen": now,
-            "repeat_count": sent_count or 1,
-        }
+# --------------------
+# Outbox
+# --------------------
+
+# Set whenever outbox messages have been committed, to wake the sender.
+OUTBOX_READY = threading.Event()
+
+
+def queue_message(mode: str, payload: dict, url: str | None = None):
+    """Commit one outbox message on its own (no token_state change behind it)."""
+    message = (mode, url, json.dumps(payload), time.time())
+    if not get_backend().write_behind:
+        _write([], [], [message]).result()
+        OUTBOX_READY.set()
+        return
+
+    with _CACHE_LOCK:
+        _OUTBOX.append(message)
+    flush()
+
+
+def outbox_due(limit: int) -> list[OutboxMessage]:
+    return get_backend().outbox_due(time.time(), limit)
+
+
+def outbox_finish(sent: list, retry: list[tuple], dead: list[tuple], release: list):
+    _call(get_backend().outbox_finish, sent, retry, dead, release, time.time())
+
+
+def outbox_backlog() -> int:
+    return get_backend().outbox_backlog()
+
+
+# --------------------
+# Retention
+# --------------------
+
+RETENTION_STATS = {
+    "runs": 0,
+    "rows_swept": 0,
+    "seconds": 0.0,
+    "last_run_at": 0,
+    "last_run_rows": 0,
+    "last_run_seconds": 0.0,
+}
+_RETENTION: threading.Thread | None = None
+_RETENTION_STOP = threading.Event()
+
+
+def sweep_stale(horizon_hours: int | None = None, batch_size: int | None = None) -> dict:
+    """
+    Retire token_state rows whose last_seen is older than the horizon, one
+    bounded batch per backend transaction, then let the backend reclaim the
+    space (incremental vacuum for sqlite; see VACUUM_CONVERT for older
+    files). Both run on the state writer.
+    The cache lock is held for one batch at a time (flush, sweep, drop the
+    swept tokens from the cache), so scanner transactions interleave with a
+    long sweep; reclaiming holds no cache lock and hands the writer back
+    whenever writes queue up.
+    """
+    horizon_hours = RETENTION_HOURS if horizon_hours is None else horizon_hours
+    batch_size = batch_size or RETENTION_BATCH
+    started = time.perf_counter()
+    now = int(time.time())
+    cutoff = now - horizon_hours * 3600
+    backend = get_backend()
+
+    swept = 0
+    while not _RETENTION_STOP.is_set():
+        with _CACHE_LOCK:
+            # Pending writes may carry a newer last_seen than the store.
+            flush()
+            tokens = _call(backend.sweep, cutoff, batch_size, now)
+            for t in tokens:
+                _CACHE.pop(t, None)
+
+        swept += len(tokens)
+        if len(tokens) < batch_size:
+            break
+        time.sleep(RETENTION_PAUSE_SECONDS)
+
+    # Converting right after a sweep rebuilds the smallest file; a no-op
+    # once converted.
+    if VACUUM_CONVERT and not _RETENTION_STOP.is_set():
+        _call(backend.enable_reclaim)
+
+    # Reclaim on the writer too, handing it back whenever writes queue up.
+    writer = get_writer()
+    vacuumed = 0
+    while not _RETENTION_STOP.is_set():
+        if writer is None:
+            vacuumed += backend.reclaim(RETENTION_PAUSE_SECONDS, _RETENTION_STOP.is_set)
+            break
+        step = writer.call(
+            backend.reclaim, 0, lambda: _RETENTION_STOP.is_set() or writer.pending()
+        )
+        if not step:
+            break
+        vacuumed += step
+        time.sleep(RETENTION_PAUSE_SECONDS)
+
+    elapsed = time.perf_counter() - started
+    RETENTION_STATS["runs"] += 1
+    RETENTION_STATS["rows_swept"] += swept
+    RETENTION_STATS["seconds"] += elapsed
+    RETENTION_STATS["last_run_at"] = now
+    RETENTION_STATS["last_run_rows"] = swept
+    RETENTION_STATS["last_run_seconds"] = elapsed
+    return {"rows": swept, "vacuumed_pages": vacuumed, "seconds": elapsed}
+
+
+def _retention_loop():
+    while not _RETENTION_STOP.wait(RETENTION_INTERVAL_SECONDS):
+        try:
+            result = sweep_stale()
+            if result["rows"]:
+                print(
+                    f"[state] retention swept={result['rows']} "
+                    f"vacuumed_pages={result['vacuumed_pages']} "
+                    f"took={result['seconds']:.2f}s",
+                    flush=True,
+                )
+        except Exception as e:
+            print(f"[state] retention error: {e}", flush=True)
+
+
+def start_retention_sweeper():
+    global _RETENTION
+    if RETENTION_HOURS <= 0 or (_RETENTION is not None and _RETENTION.is_alive()):
+        return
+    _RETENTION_STOP.clear()
+    _RETENTION = threading.Thread(target=_retention_loop, name="state-retention", daemon=True)
+    _RETENTION.start()
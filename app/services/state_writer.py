@@ -0,0 +1,145 @@
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable
+
+from app.services.state_backends import StateBackend
+
+_WRITE = "write"
+_CALL = "call"
+_STOP = "stop"
+
+
+class StateWriter:
+    """
+    Single thread that owns every write to a state backend.
+
+    The poll loop, the WS handlers, the cache flusher and the retention
+    sweeper all submit commands here instead of opening write transactions
+    on their own connections, so SQLite never sees two writers and nobody
+    waits out busy_timeout on "database is locked". Commands run in
+    submission order; consecutive write_rows commands already queued are
+    merged into one backend transaction.
+
+    submit()/write() return a concurrent.futures.Future; threads call
+    .result(), coroutines can await asyncio.wrap_future(...). Until start()
+    (scripts that never call state_service.init) and on the writer thread
+    itself, commands run inline.
+    """
+
+    def __init__(self, backend: StateBackend, max_batch: int = 256):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.stats = {"commands": 0, "transactions": 0, "merged": 0, "max_queue": 0}
+        self._queue: "queue.Queue[tuple[str, object, Future]]" = queue.Queue()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, name="state-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Run everything already queued, then stop the thread."""
+        if self._thread is None:
+            return
+        fut: Future = Future()
+        self._queue.put((_STOP, None, fut))
+        self._thread.join()
+        self._thread = None
+        # Anything submitted while the thread was stopping.
+        leftover = []
+        while not self._queue.empty():
+            leftover.append(self._queue.get_nowait())
+        self._run(leftover)
+
+    def pending(self) -> bool:
+        return not self._queue.empty()
+
+    def _inline(self) -> bool:
+        t = self._thread
+        return t is None or not t.is_alive() or t is threading.current_thread()
+
+    def _put(self, kind: str, payload) -> Future:
+        fut: Future = Future()
+        if self._inline():
+            self._run([(kind, payload, fut)])
+            return fut
+        self._queue.put((kind, payload, fut))
+        self.stats["max_queue"] = max(self.stats["max_queue"], self._queue.qsize())
+        return fut
+
+    def write(
+        self,
+        rows: list[tuple[str, dict]],
+        kv: list[tuple[str, str | None]],
+        outbox: list[tuple] = (),
+    ) -> Future:
+        return self._put(_WRITE, (rows, kv, outbox))
+
+    def submit(self, fn: Callable, *args) -> Future:
+        return self._put(_CALL, (fn, args))
+
+    def call(self, fn: Callable, *args):
+        return self.submit(fn, *args).result()
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if self._run(batch):
+                return
+
+    def _run(self, batch: list[tuple[str, object, Future]]) -> bool:
+        stop = False
+        i = 0
+        while i < len(batch):
+            kind, payload, fut = batch[i]
+            self.stats["commands"] += 1
+            if kind == _STOP:
+                stop = True
+                fut.set_result(None)
+                i += 1
+                continue
+
+            if kind == _CALL:
+                fn, args = payload
+                try:
+                    fut.set_result(fn(*args))
+                except BaseException as e:
+                    fut.set_exception(e)
+                i += 1
+                continue
+
+            # Fold this write and every write queued right behind it into one
+            # transaction. Later rows for the same token win; outbox
+            # messages are all kept, in order.
+            group = [fut]
+            rows: dict[str, dict] = dict(payload[0])
+            kv: dict[str, str | None] = dict(payload[1])
+            outbox: list[tuple] = list(payload[2])
+            i += 1
+            while i < len(batch) and batch[i][0] == _WRITE:
+                more_rows, more_kv, more_outbox = batch[i][1]
+                rows.update(more_rows)
+                kv.update(more_kv)
+                outbox.extend(more_outbox)
+                group.append(batch[i][2])
+                i += 1
+            self.stats["commands"] += len(group) - 1
+            self.stats["merged"] += len(group) - 1
+            try:
+                self.backend.write_rows(list(rows.items()), list(kv.items()), outbox)
+                self.stats["transactions"] += 1
+            except BaseException as e:
+                for f in group:
+                    f.set_exception(e)
+            else:
+                for f in group:
+                    f.set_result(None)
+        return stop
@@ -0,0 +1,275 @@
+import json
+import threading
+import time
+import zlib
+from bisect import bisect_right, insort
+from datetime import datetime, timezone
+from typing import Any
+
+from app.services.watch_segments import POS_BITS, LogView
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MINUTE_US = 60_000_000
+
+
+def to_us(ts: datetime) -> int:
+    """Exact epoch microseconds of an aware datetime."""
+    delta = ts - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def parse_line(line: bytes) -> tuple[dict, int] | None:
+    """(event, timestamp in epoch us) for a line the window readers would return."""
+    try:
+        event = json.loads(line)
+        ts = datetime.fromisoformat(event["timestamp"])
+    except Exception:
+        return None
+    if ts.tzinfo is None:
+        return None
+    return event, to_us(ts)
+
+
+class _Bucket:
+    __slots__ = ("tokens", "reasons", "lo", "hi", "min_ts")
+
+    def __init__(self):
+        # value -> [count, position of its first occurrence in the log]
+        self.tokens: dict[Any, list] = {}
+        self.reasons: dict[Any, list] = {}
+        self.lo = -1  # byte range of the lines that landed in this minute
+        self.hi = -1
+        self.min_ts = None
+
+
+def _count(target: dict, key, pos) -> None:
+    slot = target.get(key)
+    if slot is None:
+        target[key] = [1, pos]
+    else:
+        slot[0] += 1
+        if pos < slot[1]:
+            slot[1] = pos
+
+
+def _merge(target: dict, source: dict) -> None:
+    for key, (count, pos) in source.items():
+        slot = target.get(key)
+        if slot is None:
+            target[key] = [count, pos]
+        else:
+            slot[0] += count
+            if pos < slot[1]:
+                slot[1] = pos
+
+
+def _ordered(counts: dict) -> dict:
+    # Same order a Counter built by walking the window would have.
+    return {k: v[0] for k, v in sorted(counts.items(), key=lambda kv: kv[1][1])}
+
+
+class WatchAggregator:
+    """
+    Per-minute token and reason counts over the watch log, for /watch/summary.
+
+    append_watch_event feeds each line it writes; anything another process
+    appended, and any segment rotated since (see watch_segments), is read
+    before the next answer, so the buckets always cover the log up to its
+    last complete line. A window is answered by merging the buckets after
+    the cutoff's minute; the cutoff's own minute is re-read from the log
+    (its position range is known) and filtered exactly, so counts match a
+    full scan. Every count keeps the log position of its first occurrence,
+    which restores Counter's first-seen ordering (top_tokens ties,
+    reason_breakdown keys).
+
+    Positions are global (segment seq, byte offset) packed by
+    watch_segments.pos, so they stay valid and ordered across rotations.
+
+    Inputs:
+    - log_path: the JSONL watch log (active segment)
+    - max_hours: buckets kept; older windows return None (caller scans)
+    """
+
+    def __init__(self, log_path: str, max_hours: int):
+        self.log_path = log_path
+        self.max_hours = max_hours
+        self._lock = threading.Lock()
+        self.built = False
+        self._reset()
+
+    def _reset(self) -> None:
+        self._buckets: dict[int, _Bucket] = {}
+        self._minutes: list[int] = []
+        # seq -> bytes consumed, for segments that may still grow (the
+        # active file, and closed ones not yet compressed)
+        self._open: dict[int, int] = {}
+        self._next_seq = 0  # segments below this were read (or skipped)
+        self._head = (-1, 0)  # (active seq, crc of its first line)
+        self._horizon = 0  # first minute known to be complete
+
+    def _ingest(self, event: dict, ts_us: int, start: int, end: int) -> None:
+        minute = ts_us // _MINUTE_US
+        if minute < self._horizon:
+            return
+        b = self._buckets.get(minute)
+        if b is None:
+            b = self._buckets[minute] = _Bucket()
+            insort(self._minutes, minute)
+        try:
+            _count(b.tokens, event.get("token"), start)
+        except TypeError:
+            pass
+        try:
+            for i, r in enumerate(event.get("reasons", [])):
+                _count(b.reasons, r, (start, i))
+        except TypeError:
+            pass
+        if b.lo < 0 or start < b.lo:
+            b.lo = start
+        if end > b.hi:
+            b.hi = end
+        if b.min_ts is None or ts_us < b.min_ts:
+            b.min_ts = ts_us
+
+    def _scan(self, data, seq: int, pos: int) -> int:
+        base = seq << POS_BITS
+        size = len(data)
+        while pos < size:
+            end = data.find(b"\n", pos)
+            if end == -1:
+                break
+            parsed = parse_line(data[pos:end])
+            if parsed is not None:
+                self._ingest(parsed[0], parsed[1], base | pos, base | (end + 1))
+            pos = end + 1
+        return pos
+
+    def _read(self, view: LogView, seq: int, start: int, closed: bool) -> None:
+        data = view.data(seq)
+        if data is None:
+            # Active file not created yet, or a segment retention removed.
+            if seq == view.active_seq:
+                self._open[seq] = 0
+            else:
+                self._open.pop(seq, None)
+            return
+        end = self._scan(data, seq, start)
+        if closed:
+            self._open.pop(seq, None)
+        else:
+            self._open[seq] = end
+
+    def _prune(self, now_us: int) -> None:
+        horizon = (now_us - self.max_hours * 3600 * 1_000_000) // _MINUTE_US + 1
+        if horizon <= self._horizon:
+            return
+        self._horizon = horizon
+        cut = bisect_right(self._minutes, horizon - 1)
+        for minute in self._minutes[:cut]:
+            del self._buckets[minute]
+        del self._minutes[:cut]
+
+    def _sync(self, view: LogView) -> None:
+        active = view.active_seq
+        mm = view.mm
+        head_crc = 0
+        if mm is not None:
+            first = mm.find(b"\n")
+            head_crc = zlib.crc32(mm[: first + 1]) if first != -1 else 0
+        consumed = self._open.get(active, 0)
+        if (
+            not self.built
+            or active < self._next_seq - 1
+            or (mm is not None and consumed > len(mm))
+            or (self._head[0] == active and consumed and head_crc != self._head[1])
+        ):
+            # First use, or the log was replaced / truncated.
+            self._reset()
+            self._prune(int(time.time() * 1_000_000))
+            cutoff_ts = self._horizon * 60
+            for seg in view.overlapping(cutoff_ts):
+                self._read(view, seg["seq"], 0, seg["compressed"])
+            self._open[active] = view.seek(cutoff_ts)
+            self.built = True
+        else:
+            for seg in view.segments:
+                seq = seg["seq"]
+                if seq in self._open:
+                    self._read(view, seq, self._open[seq], seg["compressed"])
+                elif seq >= self._next_seq:
+                    self._read(view, seq, 0, seg["compressed"])
+            if active >= self._next_seq:
+                self._open.setdefault(active, 0)
+        self._read(view, active, self._open.get(active, 0), False)
+        self._next_seq = max(self._next_seq, active + 1)
+        self._head = (active, head_crc)
+
+    def record(self, line: bytes, seq: int, start: int, end: int) -> None:
+        """A line append_watch_event just wrote at [start, end) of segment seq."""
+        with self._lock:
+            if not self.built or seq != self._next_seq - 1 or self._open.get(seq) != start:
+                # Another writer got in between, or the log rotated; the
+                # next summary reads it all.
+                return
+            parsed = parse_line(line)
+            if parsed is not None:
+                base = seq << POS_BITS
+                self._ingest(parsed[0], parsed[1], base | start, base | end)
+            self._open[seq] = end
+
+    def counts(self, view: LogView, cutoff: datetime) -> tuple[dict, dict] | None:
+        """
+        (token -> count, reason -> count) for events with timestamp >= cutoff,
+        in first-occurrence order, or None if the window starts before the
+        retained buckets.
+        """
+        cutoff_us = to_us(cutoff)
+        edge = cutoff_us // _MINUTE_US
+        with self._lock:
+            self._sync(view)
+            self._prune(int(time.time() * 1_000_000))
+            if edge < self._horizon:
+                return None
+
+            tokens: dict[Any, list] = {}
+            reasons: dict[Any, list] = {}
+            i = bisect_right(self._minutes, edge - 1)
+            for minute in self._minutes[i:]:
+                b = self._buckets[minute]
+                if minute == edge and b.min_ts < cutoff_us:
+                    self._read_edge(view, b, edge, cutoff_us, tokens, reasons)
+                    continue
+                _merge(tokens, b.tokens)
+                _merge(reasons, b.reasons)
+
+        return _ordered(tokens), _ordered(reasons)
+
+    @staticmethod
+    def _read_edge(view: LogView, b: _Bucket, edge: int, cutoff_us: int, tokens: dict, reasons: dict) -> None:
+        lo_seq, hi_seq = b.lo >> POS_BITS, b.hi >> POS_BITS
+        mask = (1 << POS_BITS) - 1
+        for seq in range(lo_seq, hi_seq + 1):
+            data = view.data(seq)
+            if data is None:
+                continue
+            base = seq << POS_BITS
+            pos = b.lo & mask if seq == lo_seq else 0
+            stop = b.hi & mask if seq == hi_seq else len(data)
+            while pos < stop:
+                end = data.find(b"\n", pos, stop)
+                if end == -1:
+                    break
+                parsed = parse_line(data[pos:end])
+                if parsed is not None:
+                    event, ts_us = parsed
+                    if ts_us // _MINUTE_US == edge and ts_us >= cutoff_us:
+                        try:
+                            _count(tokens, event.get("token"), base | pos)
+                        except TypeError:
+                            pass
+                        try:
+                            for j, r in enumerate(event.get("reasons", [])):
+                                _count(reasons, r, (base | pos, j))
+                        except TypeError:
+                            pass
+                pos = end + 1
@@ -0,0 +1,533 @@
+import argparse
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterator
+
+from app.services.watch_aggregates import to_us
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_LAYOUT_ID = struct.Struct("<I")
+_I64_AT = struct.Struct("<q").unpack_from
+_U32_AT = struct.Struct("<I").unpack_from
+# dictionary entry: kind, payload length
+_ENTRY = struct.Struct("<BI")
+_STRING, _LIST, _LAYOUT = 0, 1, 2
+
+# Value tags and the struct code each one stores (constants store nothing).
+# "t" is an ISO UTC timestamp kept as epoch microseconds, "l" a list of
+# strings interned as a whole, "j" anything else as interned JSON text.
+_CODES = {"N": "", "T": "", "F": "", "i": "q", "f": "d", "s": "I", "l": "I", "t": "q", "j": "I"}
+_CONSTANTS = {"N": None, "T": True, "F": False}
+_I64 = 1 << 63
+# Records between in-memory seek checkpoints.
+_CHECKPOINT_EVERY = 1024
+
+
+_TS_PREFIX: dict[int, str] = {}  # minute -> "YYYY-MM-DDTHH:MM:"
+
+
+def _ts_prefix(minute: int) -> str:
+    if len(_TS_PREFIX) >= 4096:
+        _TS_PREFIX.clear()
+    prefix = _TS_PREFIX[minute] = (_EPOCH + timedelta(minutes=minute)).isoformat()[:17]
+    return prefix
+
+
+def _fmt_ts(us: int) -> str:
+    """datetime.isoformat() of a UTC epoch-us timestamp, without building the datetime."""
+    minute, rem = divmod(us, 60_000_000)
+    prefix = _TS_PREFIX.get(minute) or _ts_prefix(minute)
+    sec, micro = divmod(rem, 1_000_000)
+    if micro:
+        return "%s%02d.%06d+00:00" % (prefix, sec, micro)
+    return "%s%02d+00:00" % (prefix, sec)
+
+
+def _ts_us(value: str) -> int | None:
+    """Epoch us of a UTC ISO timestamp that formats back to the same string."""
+    try:
+        ts = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if ts.utcoffset() != timedelta(0):
+        return None
+    us = to_us(ts)
+    return us if _fmt_ts(us) == value else None
+
+
+class _Layout:
+    __slots__ = ("keys", "tags", "struct", "size", "fields", "ts_offset", "ts_tag", "build")
+
+    def __init__(self, keys: tuple, tags: str):
+        self.keys = keys
+        self.tags = tags
+        self.struct = struct.Struct("<" + "".join(_CODES[t] for t in tags))
+        self.size = _LAYOUT_ID.size + self.struct.size
+        # Decoding copies a template holding the keys in order and the
+        # constants, then fills the stored values in one pass per kind.
+        template: dict = {}
+        raw, strings, other = [], [], []
+        slot = 0
+        for key, tag in zip(keys, tags):
+            template[key] = _CONSTANTS.get(tag)
+            if tag in _CONSTANTS:
+                continue
+            if tag in "if":
+                raw.append((key, slot))
+            elif tag == "s":
+                strings.append((key, slot))
+            else:
+                other.append((key, tag, slot))
+            slot += 1
+
+        def build(v, S, L, T, J):
+            row = template.copy()
+            for key, i in raw:
+                row[key] = v[i]
+            for key, i in strings:
+                row[key] = S[v[i]]
+            for key, tag, i in other:
+                if tag == "t":
+                    row[key] = T(v[i])
+                elif tag == "l":
+                    row[key] = list(L[v[i]])
+                else:
+                    row[key] = J(S[v[i]])
+            return row
+
+        self.build = build
+        # key -> (tag, byte offset in the record), so readers that need a
+        # field or two (the window test, the summary counts) skip the rest.
+        self.fields: dict[str, tuple[str, int]] = {}
+        offset = _LAYOUT_ID.size
+        for key, tag in zip(keys, tags):
+            self.fields[key] = (tag, offset)
+            offset += struct.calcsize("<" + _CODES[tag])
+        self.ts_tag, self.ts_offset = self.fields.get("timestamp", (None, None))
+
+
+class BinaryEventStore:
+    """
+    Compact append-only store for watch and stage-transition events.
+
+    Each event becomes one fixed-size record: a layout id, then its values
+    packed with struct. A layout is the event's key order plus a type tag
+    per value, so the handful of shapes /score and record_stage_transition
+    emit are described once. Strings (tokens, chains, stages, reasons),
+    whole reason lists and layouts are interned in a dictionary file next
+    to the records (<path>.dict); UTC ISO timestamps are stored as epoch
+    microseconds.
+
+    Decoding gives back a dict equal to the original, key order included;
+    values that would not round-trip exactly (non-UTC or unusual timestamp
+    strings, ints past 64 bits, nested objects) are stored as interned JSON.
+
+    Inputs:
+    - path: the record file
+
+    Invariants:
+    - A record only references dictionary entries written before it
+    - New dictionary entries are appended under an flock on the dictionary
+      file, so several processes agree on ids; encode_many() takes it once
+      and writes everything its events add in one go
+    - Readers stop at a record still being written
+    - Nothing is ever dropped: unlike the segmented JSONL log there is no
+      rotation or retention, so the files grow until replaced
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dict_path = f"{path}.dict"
+        # Guards the dictionary tables (append-only, so decoding reads them
+        # without it), the seek checkpoints and the write fd.
+        self._lock = threading.RLock()
+        self._strings: list[str] = []
+        self._lists: list[tuple] = []
+        self._layouts: list[_Layout] = []
+        self._ids: dict[tuple, int] = {}  # (kind, key) -> id
+        self._dict_size = 0
+        # Set inside _dict_batch: entries not yet written, what they added
+        # to the tables, and the flocked dictionary fd once one is needed.
+        self._pending: bytearray | None = None
+        self._added: list[tuple] = []
+        self._dict_fd: int | None = None
+        self._fd: int | None = None
+        # (largest timestamp before offset, offset), every _CHECKPOINT_EVERY records
+        self._checkpoints: list[tuple[int, int]] = []
+        self._scanned = (0, 0, -1)  # (offset, records, running max ts)
+
+    # -- dictionary -------------------------------------------------------
+
+    def _load_dict(self) -> None:
+        try:
+            with open(self.dict_path, "rb") as f:
+                f.seek(self._dict_size)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        pos = 0
+        while pos + _ENTRY.size <= len(data):
+            kind, length = _ENTRY.unpack_from(data, pos)
+            end = pos + _ENTRY.size + length
+            if end > len(data):
+                break
+            payload = data[pos + _ENTRY.size:end]
+            if kind == _STRING:
+                key = payload.decode("utf-8")
+                table = self._strings
+            elif kind == _LIST:
+                key = tuple(self._strings[i] for i in struct.unpack(f"<{length // 4}I", payload))
+                table = self._lists
+            else:
+                keys, tags = json.loads(payload)
+                key = (tuple(keys), tags)
+                table = self._layouts
+            self._ids[(kind, key)] = len(table)
+            table.append(_Layout(*key) if kind == _LAYOUT else key)
+            pos = end
+        self._dict_size += pos
+
+    @contextmanager
+    def _dict_batch(self) -> Iterator[None]:
+        """
+        Collect the dictionary entries interned inside into one flock and one
+        write, made on leaving (so before any record using them is written).
+        Nested batches join the outer one.
+        """
+        with self._lock:
+            if self._pending is not None:
+                yield
+                return
+            self._pending = bytearray()
+            added: list[tuple] = []
+            self._added = added
+            try:
+                yield
+                view = memoryview(self._pending)
+                while view:
+                    view = view[os.write(self._dict_fd, view):]
+                self._dict_size += len(self._pending)
+            except BaseException:
+                # Nothing after the first of these can be on disk; forget them.
+                for kind, key in reversed(added):
+                    del self._ids[(kind, key)]
+                    (self._strings, self._lists, self._layouts)[kind].pop()
+                raise
+            finally:
+                self._pending = None
+                if self._dict_fd is not None:
+                    os.close(self._dict_fd)
+                    self._dict_fd = None
+
+    def _intern(self, kind: int, key) -> int:
+        found = self._ids.get((kind, key))
+        if found is not None:
+            return found
+        with self._dict_batch():
+            if kind == _LIST:
+                ids = [self._intern(_STRING, s) for s in key]
+            if self._dict_fd is None:
+                os.makedirs(os.path.dirname(self.dict_path) or ".", exist_ok=True)
+                self._dict_fd = os.open(self.dict_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+                fcntl.flock(self._dict_fd, fcntl.LOCK_EX)
+                # Another process may have added it (and others) meanwhile.
+                self._load_dict()
+                found = self._ids.get((kind, key))
+                if found is not None:
+                    return found
+            if kind == _STRING:
+                payload = key.encode("utf-8")
+            elif kind == _LIST:
+                payload = struct.pack(f"<{len(ids)}I", *ids)
+            else:
+                payload = json.dumps([list(key[0]), key[1]]).encode("utf-8")
+            self._pending += _ENTRY.pack(kind, len(payload)) + payload
+            table = (self._strings, self._lists, self._layouts)[kind]
+            found = self._ids[(kind, key)] = len(table)
+            table.append(_Layout(*key) if kind == _LAYOUT else key)
+            self._added.append((kind, key))
+            return found
+
+    # -- writing ----------------------------------------------------------
+
+    def _value(self, key: str, value: Any) -> tuple[str, Any]:
+        if value is None:
+            return "N", None
+        if value is True:
+            return "T", None
+        if value is False:
+            return "F", None
+        if type(value) is int and -_I64 <= value < _I64:
+            return "i", value
+        if type(value) is float:
+            return "f", value
+        if type(value) is str:
+            if key in ("timestamp", "entered_at", "exited_at"):
+                us = _ts_us(value)
+                if us is not None:
+                    return "t", us
+            return "s", self._intern(_STRING, value)
+        if type(value) is list and all(type(v) is str for v in value):
+            return "l", self._intern(_LIST, tuple(value))
+        return "j", self._intern(_STRING, json.dumps(value, ensure_ascii=False))
+
+    def encode(self, event: dict) -> bytes:
+        """One record for a JSON-shaped event dict."""
+        return self.encode_many([event])
+
+    def encode_many(self, events: list[dict]) -> bytes:
+        """Records for several events, with one dictionary write for all they add."""
+        with self._dict_batch():
+            return b"".join([self._encode(event) for event in events])
+
+    def _encode(self, event: dict) -> bytes:
+        tags = []
+        values = []
+        for key, value in event.items():
+            tag, v = self._value(key, value)
+            tags.append(tag)
+            if v is not None:
+                values.append(v)
+        lid = self._intern(_LAYOUT, (tuple(event), "".join(tags)))
+        return _LAYOUT_ID.pack(lid) + self._layouts[lid].struct.pack(*values)
+
+    def append(self, event: dict) -> None:
+        self.write(self.encode(event))
+
+    def write(self, records: bytes) -> None:
+        """Append encoded records with one O_APPEND write."""
+        with self._lock:
+            if self._fd is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            view = memoryview(records)
+            while view:
+                view = view[os.write(self._fd, view):]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    # -- reading ----------------------------------------------------------
+
+    def _layout(self, lid: int) -> _Layout | None:
+        if lid >= len(self._layouts):
+            with self._lock:
+                self._load_dict()
+            if lid >= len(self._layouts):
+                return None
+        return self._layouts[lid]
+
+    def _decode(self, layout: _Layout, mm, pos: int) -> dict:
+        values = layout.struct.unpack_from(mm, pos + _LAYOUT_ID.size)
+        return layout.build(values, self._strings, self._lists, _fmt_ts, json.loads)
+
+    def _records(self, mm, pos: int) -> Iterator[tuple[_Layout, int]]:
+        size = len(mm)
+        layouts = self._layouts
+        unpack_id = _LAYOUT_ID.unpack_from
+        while pos + 4 <= size:
+            lid = unpack_id(mm, pos)[0]
+            layout = layouts[lid] if lid < len(layouts) else self._layout(lid)
+            if layout is None or pos + layout.size > size:
+                # Dictionary entry or record still being written.
+                return
+            yield layout, pos
+            pos += layout.size
+
+    def _in_window(self, layout: _Layout, mm, pos: int, cutoff: datetime, cutoff_us: int) -> bool:
+        # Same test as the JSONL reader: fromisoformat(timestamp) >= cutoff,
+        # anything that raises is out.
+        if layout.ts_tag == "t":
+            return _I64_AT(mm, pos + layout.ts_offset)[0] >= cutoff_us
+        if layout.ts_tag != "s":
+            return False
+        value = self._strings[_U32_AT(mm, pos + layout.ts_offset)[0]]
+        try:
+            return datetime.fromisoformat(value) >= cutoff
+        except Exception:
+            return False
+
+    def _ts_bound(self, layout: _Layout, mm, pos: int) -> int:
+        # Upper bound on the record's time for the seek checkpoints.
+        if layout.ts_tag == "t":
+            return _I64_AT(mm, pos + layout.ts_offset)[0]
+        if layout.ts_tag == "s":
+            value = self._strings[_U32_AT(mm, pos + layout.ts_offset)[0]]
+            try:
+                ts = datetime.fromisoformat(value)
+                if ts.tzinfo is not None:
+                    return to_us(ts)
+            except Exception:
+                pass
+        return -1
+
+    def _seek(self, mm, cutoff_us: int) -> int:
+        offset, records, running = self._scanned
+        if offset > len(mm):
+            # Store replaced or truncated.
+            self._checkpoints = []
+            offset, records, running = 0, 0, -1
+        for layout, pos in self._records(mm, offset):
+            if records % _CHECKPOINT_EVERY == 0:
+                self._checkpoints.append((running, pos))
+            running = max(running, self._ts_bound(layout, mm, pos))
+            records += 1
+            offset = pos + layout.size
+        self._scanned = (offset, records, running)
+        # Last checkpoint before which every record is older than the cutoff.
+        i = bisect_left(self._checkpoints, (cutoff_us, -1))
+        return self._checkpoints[i - 1][1] if i else 0
+
+    def _open(self):
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return None, None
+        if os.fstat(f.fileno()).st_size == 0:
+            f.close()
+            return None, None
+        return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def iter_events(self) -> Iterator[dict]:
+        """Every event, in append order."""
+        f, mm = self._open()
+        if mm is None:
+            return
+        with f, mm:
+            with self._lock:
+                self._load_dict()
+            for layout, pos in self._records(mm, 0):
+                yield self._decode(layout, mm, pos)
+
+    def events_since(self, cutoff: datetime) -> list[dict]:
+        """Events with timestamp >= cutoff, in append order."""
+        f, mm = self._open()
+        if mm is None:
+            return []
+        cutoff_us = to_us(cutoff)
+        with f, mm:
+            with self._lock:
+                self._load_dict()
+                start = self._seek(mm, cutoff_us)
+            events = []
+            for layout, pos in self._records(mm, start):
+                if layout.ts_tag == "t":
+                    if _I64_AT(mm, pos + layout.ts_offset)[0] < cutoff_us:
+                        continue
+                elif not self._in_window(layout, mm, pos, cutoff, cutoff_us):
+                    continue
+                events.append(self._decode(layout, mm, pos))
+            return events
+
+    def window_counts(self, cutoff: datetime) -> tuple[dict, dict] | None:
+        """
+        (token -> count, reason -> count) for events_since(cutoff), in
+        first-occurrence order, reading only those two fields. None when
+        an event in the window has no token or a token/reasons value other
+        than a string (caller decodes and counts instead).
+        """
+        f, mm = self._open()
+        if mm is None:
+            return {}, {}
+        cutoff_us = to_us(cutoff)
+        tokens: dict = {}
+        reasons: dict = {}
+        strings, lists = self._strings, self._lists
+        with f, mm:
+            with self._lock:
+                self._load_dict()
+                start = self._seek(mm, cutoff_us)
+            plans: dict[int, tuple[int, int | None]] = {}
+            for layout, pos in self._records(mm, start):
+                if layout.ts_tag == "t":
+                    if _I64_AT(mm, pos + layout.ts_offset)[0] < cutoff_us:
+                        continue
+                elif not self._in_window(layout, mm, pos, cutoff, cutoff_us):
+                    continue
+                plan = plans.get(id(layout))
+                if plan is None:
+                    token = layout.fields.get("token")
+                    reason = layout.fields.get("reasons")
+                    if token is None or token[0] != "s" or (reason is not None and reason[0] != "l"):
+                        return None
+                    plan = plans[id(layout)] = (token[1], reason[1] if reason else None)
+                token = strings[_U32_AT(mm, pos + plan[0])[0]]
+                tokens[token] = tokens.get(token, 0) + 1
+                if plan[1] is not None:
+                    for r in lists[_U32_AT(mm, pos + plan[1])[0]]:
+                        reasons[r] = reasons.get(r, 0) + 1
+        return tokens, reasons
+
+
+def convert_jsonl(src: str, dst: str, batch: int = 10_000) -> tuple[int, int]:
+    """
+    Write every event of a JSONL watch log (its closed segments first, see
+    watch_segments) into a binary store at dst. Lines that are not JSON
+    objects are dropped, as every reader skips them anyway.
+
+    Outputs:
+    - (events written, lines dropped)
+    """
+    from app.services.watch_segments import SegmentedLog
+
+    log = SegmentedLog(src)
+    store = BinaryEventStore(dst)
+    written = dropped = 0
+    chunk: list[dict] = []
+
+    def _lines() -> Iterator[bytes]:
+        with log.shared():
+            for seg in log.manifest()["segments"]:
+                yield from log.read(seg).split(b"\n")
+            try:
+                with open(src, "rb") as f:
+                    yield from f
+            except FileNotFoundError:
+                pass
+
+    for line in _lines():
+        if not line.strip():
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError:
+            event = None
+        if not isinstance(event, dict):
+            dropped += 1
+            continue
+        chunk.append(event)
+        written += 1
+        if len(chunk) >= batch:
+            store.write(store.encode_many(chunk))
+            chunk = []
+    if chunk:
+        store.write(store.encode_many(chunk))
+    store.close()
+    return written, dropped
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert the JSONL watch log to the binary event store")
+    parser.add_argument("--from", dest="src", required=True, help="JSONL watch log (WATCH_LOG_PATH)")
+    parser.add_argument("--to", dest="dst", required=True, help="binary store (WATCH_BIN_PATH)")
+    args = parser.parse_args()
+
+    if os.path.exists(args.dst):
+        raise SystemExit(f"{args.dst} already exists")
+    written, dropped = convert_jsonl(args.src, args.dst)
+    size = os.path.getsize(args.dst) + os.path.getsize(f"{args.dst}.dict") if written else 0
+    print(f"[watch] converted {written} events ({dropped} unreadable lines dropped), {size} bytes", flush=True)
+
+
+if __name__ == "__main__":
+    main()
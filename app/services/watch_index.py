@@ -0,0 +1,146 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from bisect import bisect_left
+from datetime import datetime
+
+_MAGIC = b"WIDX0001"
+# magic, every, crc32 of the first line, events since last entry,
+# bytes scanned, max timestamp so far
+_HEADER = struct.Struct("<8sIIIQd")
+# max timestamp of every event before offset, offset of a line start
+_ENTRY = struct.Struct("<dQ")
+# Seeks stop this far short of the cutoff; absorbs float rounding of the
+# ISO timestamps so the exact datetime comparison still decides the edge.
+_SLACK_SECONDS = 1.0
+
+
+def event_ts(line: bytes) -> float | None:
+    """Epoch seconds of a watch log line, or None if it can never match a window."""
+    try:
+        ts = datetime.fromisoformat(json.loads(line)["timestamp"])
+    except Exception:
+        return None
+    if ts.tzinfo is None:
+        # Naive timestamps don't compare with the aware cutoff and are skipped.
+        return None
+    return ts.timestamp()
+
+
+class WatchLogIndex:
+    """
+    Sparse (timestamp, byte offset) index over the append-only watch log,
+    kept next to it as <log>.idx.
+
+    Every `every` lines the index records the offset of the next line and
+    the largest timestamp seen before it. That running max only grows, so a
+    binary search finds the last offset before which every event is older
+    than a cutoff, even if writers appended slightly out of order. Readers
+    start decoding there instead of at byte 0.
+
+    Inputs:
+    - log_path: the JSONL watch log
+    - every: lines per index entry (0 = no index, always start at 0)
+
+    Invariants:
+    - Only complete lines are indexed; a line still being appended is picked
+      up by the next refresh
+    - A log that shrank or no longer lines up with the index (rotated,
+      truncated, replaced) is re-indexed from scratch
+    """
+
+    def __init__(self, log_path: str, every: int = 1000):
+        self.log_path = log_path
+        self.path = f"{log_path}.idx"
+        self.every = every
+        self._lock = threading.Lock()
+        self._reset()
+        self._load()
+
+    def _reset(self) -> None:
+        self.head_crc = 0
+        self.scanned = 0
+        self.pending = 0
+        self.running_max = float("-inf")
+        self.max_before: list[float] = []
+        self.offsets: list[int] = []
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        if len(data) < _HEADER.size:
+            return
+        magic, every, head_crc, pending, scanned, running_max = _HEADER.unpack_from(data)
+        if magic != _MAGIC or every != self.every:
+            return
+        body = memoryview(data)[_HEADER.size:]
+        for ts, offset in _ENTRY.iter_unpack(body[: len(body) - len(body) % _ENTRY.size]):
+            self.max_before.append(ts)
+            self.offsets.append(offset)
+        self.head_crc, self.pending, self.scanned, self.running_max = (
+            head_crc,
+            pending,
+            scanned,
+            running_max,
+        )
+
+    def _save(self) -> None:
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(
+                _HEADER.pack(
+                    _MAGIC, self.every, self.head_crc, self.pending, self.scanned, self.running_max
+                )
+            )
+            f.write(b"".join(_ENTRY.pack(t, o) for t, o in zip(self.max_before, self.offsets)))
+        # Several processes may refresh the same index; each replace is whole.
+        os.replace(tmp, self.path)
+
+    def refresh(self, mm: mmap.mmap) -> None:
+        """Index the lines appended since the last refresh."""
+        if self.every <= 0:
+            return
+        size = len(mm)
+        first = mm.find(b"\n")
+        head_crc = zlib.crc32(mm[: first + 1]) if first != -1 else 0
+        with self._lock:
+            if self.scanned and (
+                self.scanned > size
+                or mm[self.scanned - 1 : self.scanned] != b"\n"
+                or head_crc != self.head_crc
+            ):
+                self._reset()
+            self.head_crc = head_crc
+
+            added = 0
+            pos = self.scanned
+            while pos < size:
+                end = mm.find(b"\n", pos)
+                if end == -1:
+                    break
+                if self.pending >= self.every:
+                    self.max_before.append(self.running_max)
+                    self.offsets.append(pos)
+                    self.pending = 0
+                    added += 1
+                ts = event_ts(mm[pos:end])
+                if ts is not None and ts > self.running_max:
+                    self.running_max = ts
+                self.pending += 1
+                pos = end + 1
+            self.scanned = pos
+
+            if added:
+                self._save()
+
+    def seek(self, cutoff_ts: float) -> int:
+        """Byte offset from which every event at or after cutoff_ts is found."""
+        with self._lock:
+            i = bisect_left(self.max_before, cutoff_ts - _SLACK_SECONDS)
+            return self.offsets[i - 1] if i else 0
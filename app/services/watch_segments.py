@@ -0,0 +1,315 @@
+import fcntl
+import gzip
+import json
+import mmap
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from app.services.watch_index import WatchLogIndex, event_ts
+
+# Global log positions: segment seq in the high bits, byte offset below.
+POS_BITS = 40
+# Overlap checks stop this far short of the cutoff (float timestamps).
+_SLACK_SECONDS = 1.0
+# Read size when compressing a closed segment.
+_COMPRESS_CHUNK = 1 << 20
+
+
+def pos(seq: int, offset: int) -> int:
+    return (seq << POS_BITS) | offset
+
+
+class SegmentedLog:
+    """
+    The watch log as a series of segments plus the live file.
+
+    WATCH_LOG_PATH stays the active segment that writers append to. When it
+    crosses an hour boundary (segment_seconds) or max_bytes it is renamed
+    into <log>.segments/ and listed in <log>.manifest.json; after
+    grace_seconds (stragglers from other processes still holding the old
+    file) it is gzipped and its time range recorded. Segments whose newest
+    event is older than retention_hours are deleted.
+
+    Every segment has a seq; the active file is manifest["active_seq"] and
+    keeps that seq once rotated, so (seq, offset) names a line for good.
+
+    Rotation, compression and retention hold an exclusive flock on
+    <log>.lock; readers hold it shared while they look at the manifest and
+    the files, so they always see one consistent set.
+    """
+
+    def __init__(
+        self,
+        log_path: str,
+        segment_seconds: int = 3600,
+        max_bytes: int = 64 * 1024 * 1024,
+        retention_hours: int = 720,
+        grace_seconds: float = 60,
+    ):
+        self.log_path = log_path
+        self.dir = f"{log_path}.segments"
+        self.manifest_path = f"{log_path}.manifest.json"
+        self.lock_path = f"{log_path}.lock"
+        self.segment_seconds = segment_seconds
+        self.max_bytes = max_bytes
+        self.retention_hours = retention_hours
+        self.grace_seconds = grace_seconds
+        self._cache_lock = threading.Lock()
+        self._manifest: dict | None = None
+        self._manifest_mtime = None
+        self._started: tuple[int, float] | None = None  # (inode, first event ts)
+        self._data_cache: dict[tuple[int, int], bytes] = {}
+
+    @contextmanager
+    def _flock(self, exclusive: bool) -> Iterator[None]:
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            os.close(fd)
+
+    def shared(self):
+        return self._flock(False)
+
+    def manifest(self) -> dict:
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return {"active_seq": 0, "active_started": None, "segments": []}
+        with self._cache_lock:
+            if self._manifest is None or mtime != self._manifest_mtime:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+                self._manifest_mtime = mtime
+            return self._manifest
+
+    def _save(self, m: dict) -> None:
+        tmp = f"{self.manifest_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(m, f)
+        os.replace(tmp, self.manifest_path)
+
+    def _fresh(self) -> dict:
+        # Under the exclusive lock: copy, so the cached dict readers use is
+        # never modified in place.
+        return json.loads(json.dumps(self.manifest()))
+
+    def _active_started(self, m: dict, st: os.stat_result) -> float:
+        if m["active_started"] is not None:
+            return m["active_started"]
+        # Log written before segmentation: go by its first event.
+        if self._started is None or self._started[0] != st.st_ino:
+            started = st.st_mtime
+            with open(self.log_path, "rb") as f:
+                ts = event_ts(f.readline())
+            if ts is not None:
+                started = ts
+            self._started = (st.st_ino, started)
+        return self._started[1]
+
+    def _due(self, m: dict, now: float) -> os.stat_result | None:
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            return None
+        if st.st_size == 0:
+            return None
+        if self.max_bytes > 0 and st.st_size >= self.max_bytes:
+            return st
+        if self.segment_seconds > 0:
+            started = self._active_started(m, st)
+            if now // self.segment_seconds > started // self.segment_seconds:
+                return st
+        return None
+
+    def maybe_rotate(self, now: float | None = None) -> bool:
+        """Close the active file into a segment if its hour or size is up."""
+        now = time.time() if now is None else now
+        if self._due(self.manifest(), now) is None:
+            return False
+        with self._flock(True):
+            m = self._fresh()
+            st = self._due(m, now)
+            if st is None:
+                # Another process rotated first.
+                return False
+            seq = m["active_seq"]
+            name = f"{seq:08d}.jsonl"
+            # Before the rename: a pre-segmentation log is read for it.
+            started = self._active_started(m, st)
+            os.makedirs(self.dir, exist_ok=True)
+            os.rename(self.log_path, os.path.join(self.dir, name))
+            m["segments"].append(
+                {
+                    "seq": seq,
+                    "file": name,
+                    "started": started,
+                    "closed_at": now,
+                    "compressed": False,
+                    "min_ts": None,
+                    "max_ts": None,
+                    "lines": None,
+                    "bytes": st.st_size,
+                }
+            )
+            m["active_seq"] = seq + 1
+            m["active_started"] = now
+            self._save(m)
+        print(f"[watch] rotated segment {seq} ({st.st_size} bytes)", flush=True)
+        return True
+
+    def maintain(self, now: float | None = None) -> None:
+        """Compress segments past their grace period and apply retention."""
+        now = time.time() if now is None else now
+        for seg in self.manifest()["segments"]:
+            if not seg["compressed"] and now - seg["closed_at"] >= self.grace_seconds:
+                self._compress(seg["seq"])
+
+        if self.retention_hours <= 0:
+            return
+        cutoff = now - self.retention_hours * 3600
+        if not any(
+            s["compressed"] and s["max_ts"] is not None and s["max_ts"] < cutoff
+            for s in self.manifest()["segments"]
+        ):
+            return
+        with self._flock(True):
+            m = self._fresh()
+            expired = [
+                s for s in m["segments"]
+                if s["compressed"] and s["max_ts"] is not None and s["max_ts"] < cutoff
+            ]
+            m["segments"] = [s for s in m["segments"] if s not in expired]
+            self._save(m)
+            for s in expired:
+                try:
+                    os.unlink(os.path.join(self.dir, s["file"]))
+                except FileNotFoundError:
+                    pass
+        if expired:
+            print(f"[watch] retention dropped {len(expired)} segment(s)", flush=True)
+
+    def _compress(self, seq: int) -> None:
+        seg = next(s for s in self.manifest()["segments"] if s["seq"] == seq)
+        plain = os.path.join(self.dir, seg["file"])
+        name = f"{seq:08d}.jsonl.gz"
+        tmp = os.path.join(self.dir, f"{name}.tmp")
+
+        # Streamed: a legacy watch.log rotates into one segment of any size.
+        min_ts = max_ts = None
+        lines = 0
+        size = 0
+        carry = b""
+        with open(plain, "rb") as src, open(tmp, "wb") as raw, gzip.GzipFile(
+            filename="", mode="wb", compresslevel=6, fileobj=raw, mtime=0
+        ) as gz:
+            while True:
+                chunk = src.read(_COMPRESS_CHUNK)
+                if not chunk:
+                    break
+                gz.write(chunk)
+                size += len(chunk)
+                *complete, carry = (carry + chunk).split(b"\n")
+                for line in complete:
+                    if not line:
+                        continue
+                    lines += 1
+                    ts = event_ts(line)
+                    if ts is None:
+                        continue
+                    min_ts = ts if min_ts is None else min(min_ts, ts)
+                    max_ts = ts if max_ts is None else max(max_ts, ts)
+        if carry:
+            lines += 1
+            ts = event_ts(carry)
+            if ts is not None:
+                min_ts = ts if min_ts is None else min(min_ts, ts)
+                max_ts = ts if max_ts is None else max(max_ts, ts)
+
+        with self._flock(True):
+            m = self._fresh()
+            for s in m["segments"]:
+                if s["seq"] == seq:
+                    s.update(
+                        file=name,
+                        compressed=True,
+                        min_ts=min_ts,
+                        max_ts=max_ts,
+                        lines=lines,
+                        bytes=size,
+                    )
+            os.replace(tmp, os.path.join(self.dir, name))
+            self._save(m)
+            os.unlink(plain)
+
+    def read(self, seg: dict) -> bytes:
+        """Whole (decompressed) content of a closed segment."""
+        path = os.path.join(self.dir, seg["file"])
+        # Plain segments can still take stragglers, so their size is part of
+        # the key.
+        key = (seg["seq"], -1 if seg["compressed"] else os.stat(path).st_size)
+        with self._cache_lock:
+            data = self._data_cache.get(key)
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+            if seg["compressed"]:
+                data = gzip.decompress(data)
+            with self._cache_lock:
+                # The last couple of segments only: summary windows keep
+                # re-reading the one holding their edge minute.
+                while len(self._data_cache) >= 2:
+                    self._data_cache.pop(next(iter(self._data_cache)))
+                self._data_cache[key] = data
+        return data
+
+
+class LogView:
+    """
+    Segments and the active file as seen under one shared lock.
+
+    Inputs:
+    - log: the SegmentedLog
+    - mm: the active file mapped read-only, or None when it is empty/missing
+    - index: sparse index over the active file
+    """
+
+    def __init__(self, log: SegmentedLog, mm: mmap.mmap | None, index: WatchLogIndex):
+        self.log = log
+        self.mm = mm
+        self._index = index
+        manifest = log.manifest()
+        self.segments: list[dict] = manifest["segments"]
+        self.active_seq: int = manifest["active_seq"]
+        self._by_seq = {s["seq"]: s for s in self.segments}
+
+    def overlapping(self, cutoff_ts: float) -> list[dict]:
+        """Closed segments that may hold events at or after cutoff_ts, oldest first."""
+        return [
+            s for s in self.segments
+            if s["max_ts"] is None or s["max_ts"] >= cutoff_ts - _SLACK_SECONDS
+        ]
+
+    def data(self, seq: int):
+        """Bytes of a segment (the mmap for the active one), or None if gone."""
+        if seq == self.active_seq:
+            return self.mm
+        seg = self._by_seq.get(seq)
+        if seg is None:
+            return None
+        try:
+            return self.log.read(seg)
+        except FileNotFoundError:
+            return None
+
+    def seek(self, cutoff_ts: float) -> int:
+        """Offset in the active file from which events >= cutoff_ts are found."""
+        if self.mm is None:
+            return 0
+        self._index.refresh(self.mm)
+        return self._index.seek(cutoff_ts)
@@ -1,40 +1,327 @@
+import atexit
 import json
+import mmap
 import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict
+from functools import partial
+from typing import Any, Dict, Iterator
 from app.config import settings
+from app.services.watch_aggregates import WatchAggregator
+from app.services.watch_binlog import BinaryEventStore
+from app.services.watch_index import WatchLogIndex
+from app.services.watch_segments import LogView, SegmentedLog
+from app.services.watch_writer import MAINTAIN_EVERY_SECONDS, WatchLogWriter
 
 WATCH_LOG_PATH = settings.WATCH_LOG_PATH
 
+_INDEX: WatchLogIndex | None = None
+_INDEX_LOCK = threading.Lock()
+
+
+def _get_index() -> WatchLogIndex:
+    global _INDEX
+    with _INDEX_LOCK:
+        if _INDEX is None or _INDEX.log_path != WATCH_LOG_PATH:
+            _INDEX = WatchLogIndex(WATCH_LOG_PATH, settings.WATCH_INDEX_EVERY)
+        return _INDEX
+
+
+_SEGMENTS: SegmentedLog | None = None
+
+
+def _get_segments() -> SegmentedLog:
+    global _SEGMENTS
+    with _INDEX_LOCK:
+        if _SEGMENTS is None or _SEGMENTS.log_path != WATCH_LOG_PATH:
+            _SEGMENTS = SegmentedLog(
+                WATCH_LOG_PATH,
+                segment_seconds=settings.WATCH_SEGMENT_SECONDS,
+                max_bytes=settings.WATCH_SEGMENT_MAX_MB * 1024 * 1024,
+                retention_hours=settings.WATCH_RETENTION_HOURS,
+                grace_seconds=settings.WATCH_SEGMENT_GRACE_SECONDS,
+            )
+        return _SEGMENTS
+
+
+@contextmanager
+def _open_view() -> Iterator[LogView]:
+    """Closed segments plus the mmapped active file, held stable while in use."""
+    segments = _get_segments()
+    with segments.shared():
+        try:
+            f = open(WATCH_LOG_PATH, "rb")
+        except FileNotFoundError:
+            f = None
+        if f is None or os.fstat(f.fileno()).st_size == 0:
+            try:
+                yield LogView(segments, None, _get_index())
+            finally:
+                if f is not None:
+                    f.close()
+            return
+        with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield LogView(segments, mm, _get_index())
+
+
+_AGGREGATOR: WatchAggregator | None = None
+
+
+def _agg_max_hours() -> int:
+    # Buckets must not outlive the segments they were counted from.
+    if settings.WATCH_RETENTION_HOURS > 0:
+        return min(settings.WATCH_AGG_MAX_HOURS, settings.WATCH_RETENTION_HOURS)
+    return settings.WATCH_AGG_MAX_HOURS
+
+
+def _get_aggregator() -> WatchAggregator:
+    global _AGGREGATOR
+    with _INDEX_LOCK:
+        if _AGGREGATOR is None or _AGGREGATOR.log_path != WATCH_LOG_PATH:
+            _AGGREGATOR = WatchAggregator(WATCH_LOG_PATH, _agg_max_hours())
+        return _AGGREGATOR
+
+
+_WRITER: WatchLogWriter | None = None
+
+
+def _on_write(line: bytes, seq: int, start: int, end: int) -> None:
+    _get_aggregator().record(line, seq, start, end)
+
+
+def _get_writer() -> WatchLogWriter:
+    global _WRITER
+    segments = _get_segments()
+    old = None
+    with _INDEX_LOCK:
+        if _WRITER is None or _WRITER.path != WATCH_LOG_PATH:
+            old = _WRITER
+            _WRITER = WatchLogWriter(
+                WATCH_LOG_PATH,
+                fsync=settings.WATCH_FSYNC,
+                fsync_interval=settings.WATCH_FSYNC_INTERVAL_SECONDS,
+                on_write=_on_write,
+                segments=segments,
+            )
+        writer = _WRITER
+    if old is not None:
+        # Outside the lock: the old writer's on_write needs it to drain.
+        old.stop()
+    return writer
+
+
+_BIN_STORE: BinaryEventStore | None = None
+
+
+def _get_bin_store() -> BinaryEventStore:
+    global _BIN_STORE
+    with _INDEX_LOCK:
+        if _BIN_STORE is None or _BIN_STORE.path != settings.WATCH_BIN_PATH:
+            _BIN_STORE = BinaryEventStore(settings.WATCH_BIN_PATH)
+        return _BIN_STORE
+
+
+def _encode_events(store: BinaryEventStore, events: list[dict]) -> bytes:
+    try:
+        return store.encode_many(events)
+    except (TypeError, ValueError, struct.error):
+        pass
+    # An event that cannot be encoded would otherwise hold up the rest
+    # forever; drop just that one, as the JSONL path would have refused it.
+    records = []
+    for event in events:
+        try:
+            records.append(store.encode(event))
+        except (TypeError, ValueError, struct.error) as e:
+            print(f"[watch] dropped an event the binary store cannot encode: {e}", flush=True)
+    return b"".join(records)
+
+
+_BIN_WRITER: WatchLogWriter | None = None
+
+
+def _get_bin_writer() -> WatchLogWriter:
+    global _BIN_WRITER
+    store = _get_bin_store()
+    old = None
+    with _INDEX_LOCK:
+        if _BIN_WRITER is None or _BIN_WRITER.path != store.path:
+            old = _BIN_WRITER
+            _BIN_WRITER = WatchLogWriter(
+                store.path,
+                fsync=settings.WATCH_FSYNC,
+                fsync_interval=settings.WATCH_FSYNC_INTERVAL_SECONDS,
+                encode=partial(_encode_events, store),
+            )
+        writer = _BIN_WRITER
+    if old is not None:
+        old.stop()
+    return writer
+
+
+def flush_watch_log(timeout: float | None = None) -> bool:
+    """Wait until every event appended so far is in the log."""
+    done = True
+    for writer in (_WRITER, _BIN_WRITER):
+        if writer is not None:
+            done = writer.flush(timeout) and done
+    return done
+
+
+def shutdown() -> None:
+    for writer in (_WRITER, _BIN_WRITER):
+        if writer is not None:
+            writer.stop()
+
+
+atexit.register(shutdown)
+
+
+# Segment maintenance for synchronous appends (the writer runs its own).
+_MAINTAIN_LOCK = threading.Lock()
+_LAST_MAINTAIN = 0.0
+
+
+def _maybe_maintain(segments: SegmentedLog) -> None:
+    """
+    At most every MAINTAIN_EVERY_SECONDS, compress and expire segments on a
+    short-lived thread, so the append that triggers it does not wait out a
+    large segment's gzip.
+    """
+    global _LAST_MAINTAIN
+    now = time.monotonic()
+    if now - _LAST_MAINTAIN < MAINTAIN_EVERY_SECONDS or not _MAINTAIN_LOCK.acquire(blocking=False):
+        return
+    _LAST_MAINTAIN = now
+
+    def run() -> None:
+        try:
+            segments.maintain()
+        except Exception as e:
+            print(f"[watch] segment maintenance failed: {e}", flush=True)
+        finally:
+            _MAINTAIN_LOCK.release()
+
+    threading.Thread(target=run, name="watch-maintain", daemon=True).start()
+
+
 def append_watch_event(event: Dict[str, Any]) -> None:
     """
     Append a single WATCH event as JSONL (one JSON object per line).
     Uses /data persistent disk on Render if available.
-    """
-    os.makedirs(os.path.dirname(WATCH_LOG_PATH), exist_ok=True)
 
+    With WATCH_ASYNC_WRITES (default) the line is queued for the background
+    writer and this returns without touching the disk; readers in this
+    module flush the queue first, so they still see the event.
+    """
     # Ensure a timestamp exists
     if "timestamp" not in event:
         event["timestamp"] = datetime.now(timezone.utc).isoformat()
 
-    with open(WATCH_LOG_PATH, "a", encoding="utf-8") as f:
-        f.write(json.dumps(event, ensure_ascii=False) + "\n")
+    if settings.WATCH_STORE == "binary":
+        if settings.WATCH_ASYNC_WRITES:
+            # Encoded on the writer thread, a batch at a time (one dictionary
+            # flock per batch); a copy, since the caller keeps the dict.
+            _get_bin_writer().submit(dict(event))
+        else:
+            _get_bin_store().append(event)
+        return
+
+    line = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+    if settings.WATCH_ASYNC_WRITES:
+        _get_writer().submit(line)
+        return
+
+    segments = _get_segments()
+    segments.maybe_rotate()
+    _maybe_maintain(segments)
+    os.makedirs(os.path.dirname(WATCH_LOG_PATH), exist_ok=True)
+    with segments.shared():
+        # Unbuffered, so tell() asks the OS: with O_APPEND that is where our
+        # line ended, even if another process appended in between.
+        with open(WATCH_LOG_PATH, "ab", buffering=0) as f:
+            seq = segments.manifest()["active_seq"]
+            f.write(line)
+            end = f.tell()
+    _get_aggregator().record(line, seq, end - len(line), end)
+
+
+def _collect(lines, cutoff: datetime, events: list) -> None:
+    for line in lines:
+        try:
+            event = json.loads(line)
+            ts = datetime.fromisoformat(event["timestamp"])
+            if ts >= cutoff:
+                events.append(event)
+        except Exception:
+            continue
+
+
+def _mm_lines(mm: mmap.mmap, pos: int) -> Iterator[bytes]:
+    size = len(mm)
+    while pos < size:
+        end = mm.find(b"\n", pos)
+        if end == -1:
+            end = size
+        yield mm[pos:end]
+        pos = end + 1
+
 
 def load_recent_watch_events(hours: int = 24) -> list[Dict]:
+    """
+    Events with timestamp >= now - hours, in log order.
+
+    Only closed segments whose time range reaches the cutoff are opened (see
+    watch_segments). The active file is mmapped and the sparse index (see
+    watch_index) moves the start close to the cutoff, so only lines near or
+    inside the window are decoded.
+    """
     events = []
     cutoff = datetime.now(timezone.utc) - timedelta(hours=hours)
+    flush_watch_log(settings.WATCH_FLUSH_TIMEOUT_SECONDS)
+    if settings.WATCH_STORE == "binary":
+        return _get_bin_store().events_since(cutoff)
 
-    try:
-        with open(WATCH_LOG_PATH, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    event = json.loads(line)
-                    ts = datetime.fromisoformat(event["timestamp"])
-                    if ts >= cutoff:
-                        events.append(event)
-                except Exception:
-                    continue
-    except FileNotFoundError:
-        return []
+    with _open_view() as view:
+        cutoff_ts = cutoff.timestamp()
+        for seg in view.overlapping(cutoff_ts):
+            data = view.data(seg["seq"])
+            if data is None:
+                continue
+            try:
+                # One decode per segment beats json.loads sniffing each line.
+                lines = data.decode("utf-8").split("\n")
+            except UnicodeDecodeError:
+                lines = data.split(b"\n")
+            _collect(lines, cutoff, events)
+        if view.mm is not None:
+            _collect(_mm_lines(view.mm, view.seek(cutoff_ts)), cutoff, events)
 
     return events
+
+
+def watch_window_counts(hours: int = 24) -> tuple[dict, dict] | None:
+    """
+    Token and reason counts for the events load_recent_watch_events(hours)
+    would return, from the rolling per-minute aggregates.
+
+    Outputs:
+    - (token -> count, reason -> count), both in first-occurrence order
+    - None when the window reaches past WATCH_AGG_MAX_HOURS (scan instead)
+
+    With WATCH_STORE=binary the counts come straight from the token and
+    reasons fields of the binary records instead.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=hours)
+    if settings.WATCH_STORE == "binary":
+        flush_watch_log(settings.WATCH_FLUSH_TIMEOUT_SECONDS)
+        return _get_bin_store().window_counts(cutoff)
+    if settings.WATCH_AGG_MAX_HOURS <= 0:
+        return None
+    flush_watch_log(settings.WATCH_FLUSH_TIMEOUT_SECONDS)
+    aggregator = _get_aggregator()
+    with _open_view() as view:
+        return aggregator.counts(view, cutoff)
@@ -1,6 +1,7 @@
 from collections import Counter
 from typing import Dict, List
 from app.services.watch_store import load_recent_watch_events as _load_recent_watch_events
+from app.services.watch_store import watch_window_counts
 
 def load_recent_watch_events(hours: int = 24) -> List[Dict]:
     """
@@ -31,10 +32,25 @@ def build_watch_summary(hours: int = 24) -> Dict:
     - unique_tokens: number of distinct token identifiers
     - top_tokens: top 10 tokens by event count
     - reason_breakdown: frequency of reason strings across events
+
+    Counts come from the rolling per-minute aggregates when the window is
+    within WATCH_AGG_MAX_HOURS, otherwise from scanning the log.
     """
-    events = load_recent_watch_events(hours)
+    counts = watch_window_counts(hours)
+    if counts is not None:
+        token_counts = Counter(counts[0])
+        reason_counts = Counter(counts[1])
+        total = sum(token_counts.values())
+    else:
+        events = load_recent_watch_events(hours)
+        token_counts = Counter(e["token"] for e in events)
+        reason_counts = Counter()
+        for e in events:
+            for r in e.get("reasons", []):
+                reason_counts[r] += 1
+        total = len(events)
 
-    if not events:
+    if not total:
         return {
             "window_hours": hours,
             "total_watch_events": 0,
@@ -43,13 +59,6 @@ def build_watch_summary(hours: int = 24) -> Dict:
             "reason_breakdown": {},
         }
 
-    token_counts = Counter(e["token"] for e in events)
-    reason_counts = Counter()
-
-    for e in events:
-        for r in e.get("reasons", []):
-            reason_counts[r] += 1
-
     top_tokens = [
         {"token": t, "count": c}
         for t, c in token_counts.most_common(10)
@@ -57,7 +66,7 @@ def build_watch_summary(hours: int = 24) -> Dict:
 
     return {
         "window_hours": hours,
-        "total_watch_events": len(events),
+        "total_watch_events": total,
         "unique_tokens": len(token_counts),
         "top_tokens": top_tokens,
         "reason_breakdown": dict(reason_counts),
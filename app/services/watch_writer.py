@@ -0,0 +1,238 @@
+import os
+import queue
+import threading
+import time
+from typing import Callable
+
+from app.services.watch_segments import SegmentedLog
+
+FSYNC_POLICIES = ("never", "batch", "interval")
+# How often an idle writer compresses closed segments and applies retention.
+MAINTAIN_EVERY_SECONDS = 30.0
+
+
+class _Barrier:
+    __slots__ = ("done",)
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_STOP = object()
+
+
+class WatchLogWriter:
+    """
+    Background group-commit appender for the watch log.
+
+    Producers (the /score route, stage transitions) hand over a serialized
+    line and return at once; one thread drains the queue and writes whatever
+    has accumulated with a single write() on a file it keeps open.
+
+    Inputs:
+    - path: the JSONL watch log
+    - fsync: "never" (page cache only), "batch" (fsync after every write) or
+      "interval" (at most one fsync per fsync_interval seconds)
+    - on_write: called as on_write(line, seq, start, end) for every line
+      once it is in the file, with its segment seq and byte range (feeds the
+      summary aggregates)
+    - segments: when given, the active file is rotated before a write that
+      finds its hour or size up, and closed segments are compressed and
+      expired from this thread
+    - encode: when given, submitted items are whatever it takes, and each
+      batch is written as encode(items) instead of the lines joined (the
+      binary store encodes its records here, off the request path)
+
+    Invariants:
+    - Lines reach the file in the order they were submitted
+    - flush() returns once everything submitted before it is written
+    - A failed write is retried with the same lines, never reordered
+    - stop() (also run at exit) writes everything still queued
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fsync: str = "interval",
+        fsync_interval: float = 1.0,
+        max_batch: int = 1000,
+        on_write: Callable[[bytes, int, int, int], None] | None = None,
+        segments: SegmentedLog | None = None,
+        encode: Callable[[list], bytes] | None = None,
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"unknown fsync policy: {fsync}")
+        self.path = path
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.max_batch = max_batch
+        self.on_write = on_write
+        self.segments = segments
+        self.encode = encode
+        self.stats = {"lines": 0, "batches": 0, "fsyncs": 0, "max_batch": 0, "errors": 0}
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        self._fd: int | None = None
+        self._seq = 0
+        self._last_maintain = 0.0
+        self._last_fsync = 0.0
+        self._unsynced = False
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name="watch-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, line: bytes) -> None:
+        if self._thread is None:
+            self.start()
+        self._queue.put(line)
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Wait until every line submitted so far is written."""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        barrier = _Barrier()
+        self._queue.put(barrier)
+        return barrier.done.wait(timeout)
+
+    def stop(self, timeout: float | None = 10) -> None:
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        self._thread = None
+
+    def _open(self) -> int:
+        # Reopen when the log was rotated or removed under us.
+        if self._fd is not None:
+            try:
+                if os.stat(self.path).st_ino == os.fstat(self._fd).st_ino:
+                    return self._fd
+            except FileNotFoundError:
+                pass
+            self._sync(time.monotonic())
+            os.close(self._fd)
+            self._fd = None
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if self.segments is None:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            return self._fd
+        # The file and its seq must be read under the same lock, or a
+        # rotation in between would mislabel every line we write.
+        with self.segments.shared():
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self._seq = self.segments.manifest()["active_seq"]
+        return self._fd
+
+    def _maintain(self, rotate: bool) -> None:
+        if self.segments is None:
+            return
+        try:
+            if rotate:
+                self.segments.maybe_rotate()
+            now = time.monotonic()
+            if now - self._last_maintain >= MAINTAIN_EVERY_SECONDS:
+                self._last_maintain = now
+                self.segments.maintain()
+        except Exception as e:
+            # Never worth holding up the log itself.
+            print(f"[watch] segment maintenance failed: {e}", flush=True)
+
+    def _write(self, lines: list[bytes]) -> int:
+        data = self.encode(lines) if self.encode is not None else b"".join(lines)
+        self._maintain(rotate=True)
+        fd = self._open()
+        view = memoryview(data)
+        while view:
+            n = os.write(fd, view)
+            view = view[n:]
+        # With O_APPEND the offset after the write is the end of our batch,
+        # wherever other writers put theirs.
+        end = os.lseek(fd, 0, os.SEEK_CUR)
+
+        if self.fsync == "batch":
+            self._unsynced = True
+            self._sync(time.monotonic())
+        elif self.fsync == "interval":
+            self._unsynced = True
+            now = time.monotonic()
+            if now - self._last_fsync >= self.fsync_interval:
+                self._sync(now)
+
+        self.stats["lines"] += len(lines)
+        self.stats["batches"] += 1
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(lines))
+        return end
+
+    def _sync(self, now: float) -> None:
+        if self._fd is not None and self._unsynced:
+            os.fsync(self._fd)
+            self.stats["fsyncs"] += 1
+            self._unsynced = False
+        self._last_fsync = now
+
+    def _notify(self, lines: list[bytes], end: int) -> None:
+        if self.on_write is None:
+            return
+        pos = end - sum(len(line) for line in lines)
+        for line in lines:
+            try:
+                self.on_write(line, self._seq, pos, pos + len(line))
+            except Exception as e:
+                print(f"[watch] on_write failed: {e}", flush=True)
+            pos += len(line)
+
+    def _loop(self) -> None:
+        lines: list[bytes] = []
+        waiters: list[_Barrier] = []
+        stopping = False
+        while not stopping:
+            timeout = self.fsync_interval if self._unsynced else None
+            if self.segments is not None:
+                timeout = min(timeout or MAINTAIN_EVERY_SECONDS, MAINTAIN_EVERY_SECONDS)
+            try:
+                # Wake up for a pending interval fsync (and segment upkeep)
+                # even when idle.
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._sync(time.monotonic())
+                self._maintain(rotate=False)
+                continue
+            while True:
+                if item is _STOP:
+                    stopping = True
+                elif isinstance(item, _Barrier):
+                    waiters.append(item)
+                else:
+                    lines.append(item)
+                if len(lines) >= self.max_batch:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            while lines:
+                try:
+                    end = self._write(lines)
+                    self._notify(lines, end)
+                    lines = []
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    print(f"[watch] log write failed ({len(lines)} lines): {e}", flush=True)
+                    if stopping:
+                        break
+                    time.sleep(1)
+            for w in waiters:
+                w.done.set()
+            waiters = []
+
+        self._sync(time.monotonic())
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
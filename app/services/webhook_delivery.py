@@ -0,0 +1,279 @@
+import atexit
+import heapq
+import itertools
+import json
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.config import settings
+
+# Responses worth another attempt; any other status is final.
+RETRY_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+class _Delivery:
+    __slots__ = ("url", "payload", "queued_at", "queued_wall", "attempts", "last_error")
+
+    def __init__(self, url: str, payload: Dict[str, Any]):
+        self.url = url
+        self.payload = payload
+        self.queued_at = time.monotonic()
+        self.queued_wall = datetime.now(timezone.utc)
+        self.attempts = 0
+        self.last_error = ""
+
+
+class WebhookDelivery:
+    """
+    Background JSON webhook delivery.
+
+    Callers hand over (url, payload) and return at once. `workers` threads
+    post through one keep-alive session whose pool has a connection per
+    worker. A delivery that fails with a connection error, timeout, 429 or
+    5xx is retried with capped exponential backoff and full jitter (a
+    Retry-After on the response is honoured), up to `max_attempts`. It waits
+    in the due-time heap meanwhile, not in a worker. Other statuses, running
+    out of attempts, a full queue and anything still queued at close go to
+    the dead-letter file as JSON lines.
+
+    Inputs:
+    - workers: concurrent requests at most
+    - max_queue: deliveries waiting (including retries) before submit()
+      dead-letters instead
+    - timeout: per request, seconds
+    - backoff_seconds, max_backoff_seconds: first retry delay and its cap
+    - dead_letter_path: JSONL file of undeliverable events ("" = log only)
+
+    stats() reports counts and end-to-end latency (queued -> delivered)
+    percentiles over the last LATENCY_WINDOW deliveries.
+    """
+
+    LATENCY_WINDOW = 1024
+
+    def __init__(
+        self,
+        workers: int = 4,
+        max_queue: int = 10_000,
+        max_attempts: int = 5,
+        timeout: float = 5.0,
+        backoff_seconds: float = 1.0,
+        max_backoff_seconds: float = 60.0,
+        dead_letter_path: str = "",
+    ):
+        self.max_queue = max_queue
+        self.max_attempts = max(1, max_attempts)
+        self.timeout = timeout
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.dead_letter_path = dead_letter_path
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, workers))
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        # (due, seq, delivery): new submissions are due now, retries later.
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closing = False
+        self._in_flight = 0
+        self._dead_lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=self.LATENCY_WINDOW)
+        self._counts = {"queued": 0, "delivered": 0, "retried": 0, "dead": 0, "attempts": 0}
+
+        self._threads = [
+            threading.Thread(target=self._run, name=f"webhook-{i}", daemon=True) for i in range(max(1, workers))
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, url: str, payload: Dict[str, Any]) -> bool:
+        """Queue a delivery; False when the queue is full (it is dead-lettered)."""
+        delivery = _Delivery(url, payload)
+        with self._cond:
+            if not self._closing and len(self._heap) < self.max_queue:
+                heapq.heappush(self._heap, (delivery.queued_at, next(self._seq), delivery))
+                self._counts["queued"] += 1
+                self._cond.notify()
+                return True
+        delivery.last_error = "queue full" if not self._closing else "closed"
+        self._dead(delivery)
+        return False
+
+    def _next(self) -> Optional[_Delivery]:
+        with self._cond:
+            while True:
+                wait = None
+                if self._heap:
+                    due = self._heap[0][0]
+                    wait = due - time.monotonic()
+                    if wait <= 0 or self._closing:
+                        self._in_flight += 1
+                        return heapq.heappop(self._heap)[2]
+                elif self._closing:
+                    return None
+                self._cond.wait(wait)
+
+    def _run(self) -> None:
+        while True:
+            delivery = self._next()
+            if delivery is None:
+                return
+            try:
+                self._attempt(delivery)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+    def _attempt(self, delivery: _Delivery) -> None:
+        delivery.attempts += 1
+        with self._cond:
+            self._counts["attempts"] += 1
+        retry_after = None
+        try:
+            resp = self._session.post(delivery.url, json=delivery.payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            delivery.last_error = f"{type(e).__name__}: {e}"
+            retryable = True
+        else:
+            if resp.status_code < 400:
+                with self._cond:
+                    self._counts["delivered"] += 1
+                    self._latencies.append(time.monotonic() - delivery.queued_at)
+                return
+            delivery.last_error = f"HTTP {resp.status_code}"
+            retryable = resp.status_code in RETRY_STATUSES
+            try:
+                retry_after = float(resp.headers.get("Retry-After", ""))
+            except ValueError:
+                pass
+
+        if not retryable or delivery.attempts >= self.max_attempts or self._closing:
+            self._dead(delivery)
+            return
+        cap = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (delivery.attempts - 1))
+        delay = random.uniform(0, cap)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_backoff_seconds))
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), delivery))
+            self._counts["retried"] += 1
+            self._cond.notify()
+
+    def _dead(self, delivery: _Delivery) -> None:
+        with self._cond:
+            self._counts["dead"] += 1
+        print(
+            f"[webhook] giving up on {delivery.url} after {delivery.attempts} attempt(s): {delivery.last_error}",
+            flush=True,
+        )
+        if not self.dead_letter_path:
+            return
+        line = json.dumps(
+            {
+                "url": delivery.url,
+                "payload": delivery.payload,
+                "attempts": delivery.attempts,
+                "error": delivery.last_error,
+                "queued_at": delivery.queued_wall.isoformat(),
+                "dead_at": datetime.now(timezone.utc).isoformat(),
+            }
+        )
+        try:
+            with self._dead_lock, open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            print(f"[webhook] dead-letter write failed: {e}", flush=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            counts = dict(self._counts)
+            backlog = len(self._heap)
+            in_flight = self._in_flight
+            latencies = sorted(self._latencies)
+
+        def pct(p: float) -> float:
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else 0.0
+
+        return {
+            **counts,
+            "backlog": backlog,
+            "in_flight": in_flight,
+            "latency_p50_ms": pct(0.50),
+            "latency_p95_ms": pct(0.95),
+            "latency_max_ms": latencies[-1] * 1000 if latencies else 0.0,
+        }
+
+    def flush(self, timeout: float) -> bool:
+        """Wait until nothing is queued or in flight (retries included); False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._heap or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Give queued deliveries up to `timeout` (retries keep their
+        backoff), then make one last attempt at whatever remains, without
+        waiting out its backoff; failures are dead-lettered, and so is
+        anything the workers did not get to before their joins time out.
+        """
+        self.flush(timeout)
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=self.timeout + 1)
+        with self._cond:
+            left = [entry[2] for entry in self._heap]
+            self._heap.clear()
+        for delivery in left:
+            delivery.last_error = "closed"
+            self._dead(delivery)
+        # Attempts still running end (delivered or dead-lettered) within
+        # one request timeout.
+        deadline = time.monotonic() + self.timeout + 1
+        with self._cond:
+            while self._in_flight and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+        self._session.close()
+
+
+_DELIVERY: Optional[WebhookDelivery] = None
+_DELIVERY_LOCK = threading.Lock()
+
+
+def get_delivery() -> WebhookDelivery:
+    global _DELIVERY
+    if _DELIVERY is None:
+        with _DELIVERY_LOCK:
+            if _DELIVERY is None:
+                _DELIVERY = WebhookDelivery(
+                    workers=settings.WEBHOOK_WORKERS,
+                    max_queue=settings.WEBHOOK_QUEUE_MAX,
+                    max_attempts=settings.WEBHOOK_MAX_ATTEMPTS,
+                    timeout=settings.WEBHOOK_TIMEOUT_SECONDS,
+                    backoff_seconds=settings.WEBHOOK_BACKOFF_SECONDS,
+                    max_backoff_seconds=settings.WEBHOOK_MAX_BACKOFF_SECONDS,
+                    dead_letter_path=settings.WEBHOOK_DEAD_LETTER_PATH,
+                )
+                atexit.register(_DELIVERY.close, settings.WEBHOOK_CLOSE_TIMEOUT_SECONDS)
+    return _DELIVERY
+
+
+def delivery_stats() -> Optional[Dict[str, Any]]:
+    """stats() of the delivery queue, or None if nothing was sent yet."""
+    return _DELIVERY.stats() if _DELIVERY is not None else None
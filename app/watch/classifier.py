@@ -1,195 +1,132 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Optional, TypedDict
+from typing import Any, Dict, List, Optional
 from .stages import StageDecision, WatchStage
-from .stage_config import SOL_STAGE_THRESHOLDS as T
-
-class _EvalRecord(TypedDict):
-    tick: int
-    score: int
-    stage: WatchStage
-
-_HISTORY: Dict[str, List[_EvalRecord]] = {}
-
-def _token_key(signals: Dict[str, Any]) -> Optional[str]:
-    for key in ("token", "symbol", "address", "mint"):
-        value = signals.get(key)
-        if isinstance(value, str) and value:
-            return value
-    return None
-
-def _record_history(token: str, record: _EvalRecord, max_len: int) -> None:
-    history = _HISTORY.get(token)
-    if history is None:
-        history = []
-        _HISTORY[token] = history
-    history.append(record)
-    if len(history) > max_len:
-        del history[:-max_len]
-
-def classify_watch_stage(signals: Dict[str, Any]) -> StageDecision:
+from .stage_config import MetricTiers, StagePlan, current_stage_plan
+from .token_registry import TokenState, evict_idle, lookup, token_key
+
+try:
+    import numpy as np
+except ImportError:  # classify_many falls back to the scalar path
+    np = None
+
+_RUG_REASON = "rug / critical risk flag"
+
+def classify_watch_stage(signals: Dict[str, Any], state: Optional[TokenState] = None) -> StageDecision:
     """
     Classify a token into a watch stage based on deterministic, config-driven rules.
 
     Inputs:
     - signals: mapping of metric names to numeric values and flags
+    - state: the token's registry record, when the caller already looked it
+      up (evolve_watch_stage); otherwise found from the signals' identity
 
     Outputs:
     - StageDecision containing stage, score, reasons, and the original signals
 
     Invariants:
-    - Uses SOL_STAGE_THRESHOLDS for all thresholds and cutoffs
+    - Uses the current StagePlan (SOL_STAGE_THRESHOLDS plus any overrides,
+      see stage_config) for all thresholds and cutoffs
     - Deterministic and explainable scoring (no randomness)
     - Early exit on critical risk flag
     """
+    plan = current_stage_plan()
     reasons: list[str] = []
     score = 0
 
-    def apply_tiers(
-        value: Any,
-        metric_key: str,
-        label: str,
-        tiers: list[tuple[str, int]],
-        below_score: int,
-        below_reason: str,
-    ) -> None:
+    def apply_tiers(value: Any, tiers: MetricTiers) -> None:
         """
         Apply tiered scoring for a metric.
 
-        Chooses the first matching tier (highest threshold first in tiers list).
-        If no tier matches, applies the below_score and below_reason.
-        """
-        nonlocal score
-        if not isinstance(value, (int, float)):
-            return
-        thresholds = T[metric_key]
-        for tier_key, tier_score in tiers:
-            if value >= thresholds[tier_key]:
-                score += tier_score
-                reasons.append(f"{label} >= {tier_key}")
-                return
-        score += below_score
-        reasons.append(below_reason)
-
-    def apply_penalty(
-        value: Any,
-        metric_key: str,
-        label: str,
-        tiers: list[tuple[str, int]],
-    ) -> None:
-        """
-        Apply a penalty based on threshold tiers for a metric.
-
-        Uses the first matching tier in tiers list and adds its score.
+        Chooses the first tier reached (thresholds are highest first).
+        If none is, applies the below_score and below_reason; penalties
+        have neither and add nothing.
         """
         nonlocal score
         if not isinstance(value, (int, float)):
             return
-        thresholds = T[metric_key]
-        for tier_key, tier_score in tiers:
-            if value >= thresholds[tier_key]:
+        for threshold, tier_score, reason in zip(tiers.thresholds, tiers.scores, tiers.reasons):
+            if value >= threshold:
                 score += tier_score
-                reasons.append(f"{label} >= {tier_key}")
+                reasons.append(reason)
                 return
+        if tiers.below_reason is not None:
+            score += tiers.below_score
+            reasons.append(tiers.below_reason)
 
     # Critical risk flag forces early-stage classification.
     if bool(signals.get("rug_bad", False)):
         return StageDecision(
             stage="early",
             score=-999,
-            reasons=["rug / critical risk flag"],
+            reasons=[_RUG_REASON],
             signals=signals,
         )
 
-    apply_tiers(
-        signals.get("lp_usd"),
-        "lp_usd",
-        "LP",
-        [("high", 3), ("mid", 2), ("min", 1)],
-        -2,
-        "LP < min",
-    )
-    apply_tiers(
-        signals.get("vol_5m"),
-        "vol_5m",
-        "Vol5m",
-        [("high", 4), ("mid", 3), ("low", 1)],
-        -1,
-        "Vol5m weak",
-    )
-    apply_tiers(
-        signals.get("tx_5m"),
-        "tx_5m",
-        "Tx5m",
-        [("high", 3), ("mid", 2), ("low", 1)],
-        -1,
-        "Tx5m sparse",
-    )
-    apply_tiers(
-        signals.get("holders_delta_15m"),
-        "holders_delta_15m",
-        "Holders",
-        [("high", 4), ("mid", 3), ("low", 1)],
-        -1,
-        "Holder growth weak",
-    )
-    apply_penalty(
-        signals.get("top10_pct"),
-        "top10_pct",
-        "Top10",
-        [("severe", -3), ("bad", -2), ("warn", -1)],
-    )
+    for tiers in plan.metrics:
+        apply_tiers(signals.get(tiers.metric), tiers)
 
     # Stage thresholds are config-driven and derived from the cumulative score.
-    if score >= T["stage_cutoffs"]["near_pass"]:
+    if score >= plan.near_pass_cutoff:
         stage: WatchStage = "near_pass"
-    elif score >= T["stage_cutoffs"]["building"]:
+    elif score >= plan.building_cutoff:
         stage = "building"
     else:
         stage = "early"
 
-    confirm_cfg = T["near_pass_confirmation"]
-    min_consecutive = int(confirm_cfg["min_consecutive"])
-    trend_window = int(confirm_cfg["trend_window"])
-    min_slope = float(confirm_cfg["min_slope"])
-    cooldown_ticks = int(confirm_cfg["promotion_cooldown_ticks"])
-    demote_cutoff = int(confirm_cfg["demote_cutoff"])
-    history_size = int(confirm_cfg["history_size"])
+    if state is None:
+        token = token_key(signals)
+        state = lookup(token) if token else None
+    return _confirm_stage(signals, score, stage, reasons, state, plan)
+
+
+def _confirm_stage(
+    signals: Dict[str, Any],
+    score: int,
+    stage: WatchStage,
+    reasons: list[str],
+    history: Optional[TokenState],
+    plan: StagePlan,
+) -> StageDecision:
+    """
+    Per-token near_pass confirmation (consecutive ticks, trend, cooldown,
+    hysteresis) against the token's history, which it then extends; history
+    is None for signals with no identity. Shared by classify_watch_stage
+    and classify_many.
+
+    Constant time per call: the history's running counters stand in for
+    walking its records.
+    """
+    near_cutoff = plan.near_pass_cutoff
+    history_size = plan.history_size
 
     final_stage = stage
     final_reasons = list(reasons)
 
-    token_key = _token_key(signals)
-    history = _HISTORY.get(token_key, []) if token_key else []
-    tick = (history[-1]["tick"] + 1) if history else 1
+    count = history.count if history is not None else 0
+    tick = history.last_tick + 1 if count else 1
 
     if stage == "near_pass":
-        if not token_key:
+        if history is None:
             final_stage = "building"
             final_reasons.append("near_pass_needs_identity")
         else:
-            scores = [h["score"] for h in history] + [score]
-
+            # This score, then the newest records backwards.
             consecutive = 0
-            for s in reversed(scores):
-                if s >= T["stage_cutoffs"]["near_pass"]:
-                    consecutive += 1
-                else:
-                    break
-            consecutive_ok = consecutive >= min_consecutive
-
-            if len(scores) >= trend_window:
-                window = scores[-trend_window:]
-                slope = (window[-1] - window[0]) / (len(window) - 1)
-                slope_ok = slope >= min_slope
+            if score >= near_cutoff:
+                consecutive = 1 + (history.trailing(near_cutoff) if count else 0)
+            consecutive_ok = consecutive >= plan.min_consecutive
+
+            # trend_window >= 2, so the window's first score is a record.
+            trend_window = plan.trend_window
+            n_scores = count + 1
+            if n_scores >= trend_window:
+                slope = (score - history.score_at(n_scores - trend_window)) / (trend_window - 1)
+                slope_ok = slope >= plan.min_slope
             else:
                 slope_ok = False
 
-            last_promo_tick: Optional[int] = None
-            for h in reversed(history):
-                if h["stage"] == "near_pass":
-                    last_promo_tick = h["tick"]
-                    break
-            cooldown_ok = last_promo_tick is None or (tick - last_promo_tick) > cooldown_ticks
+            last_promo_tick = history.last_promo_tick() if count else None
+            cooldown_ok = last_promo_tick is None or (tick - last_promo_tick) > plan.cooldown_ticks
 
             if not consecutive_ok:
                 final_stage = "building"
@@ -201,16 +138,110 @@ def classify_watch_stage(signals: Dict[str, Any]) -> StageDecision:
                 final_stage = "building"
                 final_reasons.append("near_pass_cooldown_active")
 
-    elif token_key and history:
-        if history[-1]["stage"] == "near_pass" and score >= demote_cutoff:
+    elif count:
+        if history.last_stage() == "near_pass" and score >= plan.demote_cutoff:
             final_stage = "near_pass"
             final_reasons.append("near_pass_hysteresis")
 
-    if token_key:
-        _record_history(
-            token_key,
-            {"tick": tick, "score": score, "stage": final_stage},
-            history_size,
-        )
+    if history is not None:
+        if history.size != history_size:
+            # New, or history_size changed: this tick was judged on what was kept.
+            history.resize(history_size)
+        history.push(tick, score, final_stage)
+        # This token was looked up last, so it outlives any eviction.
+        evict_idle(history.seen_at, plan.history_ttl_seconds, plan.history_max_tokens)
 
     return StageDecision(final_stage, score, final_reasons, signals)
+
+
+def _state_for(signals: Dict[str, Any]) -> Optional[TokenState]:
+    token = token_key(signals)
+    return lookup(token) if token else None
+
+
+def _numeric_column(batch: List[Dict[str, Any]], key: str):
+    """(values as float64, mask of entries apply_tiers would score) for one metric."""
+    raw = [s.get(key) for s in batch]
+    valid = [isinstance(v, (int, float)) for v in raw]
+    cells = [v if ok else 0.0 for v, ok in zip(raw, valid)]
+    try:
+        values = np.array(cells, dtype=np.float64)
+    except OverflowError:
+        # Ints past float range: only their sign matters against the tiers.
+        values = np.array(
+            [float(v) if abs(v) < 1e308 else (float("inf") if v > 0 else float("-inf")) for v in cells],
+            dtype=np.float64,
+        )
+    return values, np.array(valid, dtype=bool)
+
+
+def classify_many(signals_batch: List[Dict[str, Any]]) -> List[StageDecision]:
+    """
+    classify_watch_stage for a whole scan cycle.
+
+    Inputs:
+    - signals_batch: signals dicts, in the order classify_watch_stage would
+      have seen them
+
+    Outputs:
+    - one StageDecision per input, equal to what the scalar calls in order
+      would return (same history updates, so a token listed twice sees its
+      first result)
+
+    The tier tables for every metric are evaluated over NumPy arrays at
+    once; only the per-token near_pass confirmation runs row by row.
+    Without NumPy this is the scalar loop.
+    """
+    if np is None or not signals_batch:
+        return [classify_watch_stage(s) for s in signals_batch]
+
+    plan = current_stage_plan()
+    n = len(signals_batch)
+    scores = np.zeros(n, dtype=np.int64)
+    # Per metric, the reason index each row gets (-1: none), and the texts.
+    codes = []
+    texts = []
+    for tiers in plan.metrics:
+        values, valid = _numeric_column(signals_batch, tiers.metric)
+        names = list(tiers.reasons)
+        if tiers.below_reason is None:
+            below, fallback = 0, -1
+        else:
+            below, fallback = tiers.below_score, len(names)
+            names.append(tiers.below_reason)
+        # First tier reached in list order, built from the last one back.
+        code = np.full(n, fallback, dtype=np.int64)
+        points = np.full(n, below, dtype=np.int64)
+        for i in range(len(tiers.thresholds) - 1, -1, -1):
+            hit = values >= tiers.thresholds[i]
+            code = np.where(hit, i, code)
+            points = np.where(hit, tiers.scores[i], points)
+        code[~valid] = -1
+        points[~valid] = 0
+        scores += points
+        codes.append(code)
+        texts.append(names)
+
+    stage_codes = np.where(
+        scores >= plan.near_pass_cutoff, 2, np.where(scores >= plan.building_cutoff, 1, 0)
+    )
+    stage_names: tuple[WatchStage, ...] = ("early", "building", "near_pass")
+
+    # Each row's reason codes packed into one int, so the reason list of
+    # every distinct combination is built once.
+    combo = np.zeros(n, dtype=np.int64)
+    for code, names in zip(codes, texts):
+        combo = combo * (len(names) + 1) + (code + 1)
+    combos: Dict[int, list[str]] = {}
+    for c, i in zip(*np.unique(combo, return_index=True)):
+        combos[int(c)] = [texts[m][code[i]] for m, code in enumerate(codes) if code[i] >= 0]
+
+    decisions: List[StageDecision] = []
+    for signals, score, stage_code, c in zip(signals_batch, scores.tolist(), stage_codes.tolist(), combo.tolist()):
+        if bool(signals.get("rug_bad", False)):
+            decisions.append(StageDecision(stage="early", score=-999, reasons=[_RUG_REASON], signals=signals))
+            continue
+        decisions.append(
+            _confirm_stage(signals, score, stage_names[stage_code], combos[c], _state_for(signals), plan)
+        )
+    return decisions
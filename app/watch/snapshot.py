@@ -0,0 +1,247 @@
+"""
+Snapshots of the process-local watch state, so a restart resumes instead of
+re-confirming every token from zero.
+
+Covers the token registry: each token's stage, score, entered_at and its
+classifier history (near_pass confirmation). start_watch_snapshots()
+restores once at startup, then writes a snapshot every
+WATCH_SNAPSHOT_SECONDS and at exit. Each process keeps its own file (the
+API and the worker classify different tokens).
+
+File: MAGIC, then zlib of (u32 header length, JSON header, per-token
+columns as raw arrays). The header carries the tokens and the byte length
+and typecode of each column.
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app.config import settings
+
+from . import token_registry
+from .stage_config import current_stage_plan
+
+MAGIC = b"WSNAP2\n"
+_STAGES = ("early", "building", "near_pass")
+_STAGE_CODES = {stage: i for i, stage in enumerate(_STAGES)}
+
+_STARTED = False
+_START_LOCK = threading.Lock()
+_SAVE_LOCK = threading.Lock()
+_STOP = threading.Event()
+
+
+def _encode() -> bytes:
+    saved_at = time.time()
+    now = time.monotonic()
+
+    tokens = []
+    stage_col = array("b")  # -1: no stage recorded yet
+    score_col = array("q")
+    entered_col = array("d")
+    counts = array("I")
+    last_ticks = array("q")
+    last_promos = array("q")  # 0: none (ticks start at 1)
+    idle = array("d")
+    runs = array("I")
+    run_cutoffs = array("d")
+    scores: list[int] = []
+    stages = bytearray()
+    for token, h in token_registry.items():
+        n, start, size = h.count, h.start, h.size
+        end = start + n
+        if end <= size:
+            ring_scores, ring_stages = h.scores[start:end], h.stages[start:end]
+        else:
+            ring_scores = h.scores[start:] + h.scores[: end - size]
+            ring_stages = h.stages[start:] + h.stages[: end - size]
+        tokens.append(token)
+        stage_col.append(_STAGE_CODES[h.stage] if h.stage is not None else -1)
+        score_col.append(h.score)
+        entered_col.append(h.entered_at)
+        counts.append(n)
+        last_ticks.append(h.last_tick)
+        last_promos.append(h.last_promo or 0)
+        idle.append(max(now - h.seen_at, 0.0))
+        runs.append(h.run)
+        run_cutoffs.append(h.run_cutoff)
+        scores.extend(ring_scores)
+        stages.extend(map(_STAGE_CODES.__getitem__, ring_stages))
+    wide = scores and (min(scores) < -(2**15) or max(scores) >= 2**15)
+    ring_scores_col = array("q" if wide else "h", scores)
+
+    columns = [
+        ("stage", stage_col),
+        ("score", score_col),
+        ("entered_at", entered_col),
+        ("counts", counts),
+        ("last_ticks", last_ticks),
+        ("last_promos", last_promos),
+        ("idle", idle),
+        ("runs", runs),
+        ("run_cutoffs", run_cutoffs),
+        ("ring_scores", ring_scores_col),
+    ]
+    header = {
+        "saved_at": saved_at,
+        "tokens": tokens,
+        "columns": [[name, col.typecode, len(col) * col.itemsize] for name, col in columns]
+        + [["ring_stages", "b", len(stages)]],
+    }
+    head = json.dumps(header, separators=(",", ":")).encode()
+    body = [struct.pack("<I", len(head)), head] + [col.tobytes() for _, col in columns] + [bytes(stages)]
+    return MAGIC + zlib.compress(b"".join(body), 1)
+
+
+def snapshot_watch_state(path: str) -> int:
+    """Write the current state to `path` atomically; returns its size in bytes."""
+    with _SAVE_LOCK:
+        data = _encode()
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        return len(data)
+
+
+def restore_watch_state(path: str) -> Optional[Dict[str, Any]]:
+    """
+    Load a snapshot into the (normally still empty) in-memory state.
+
+    Tokens already present are left alone, tokens idle past the current
+    history_ttl_seconds (downtime included) are skipped, and rings take the
+    current history_size. Returns counts and timings, or None
+    when there is no snapshot.
+    """
+    started = time.perf_counter()
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a watch state snapshot")
+    raw = zlib.decompress(data[len(MAGIC):])
+    (head_len,) = struct.unpack_from("<I", raw)
+    header = json.loads(raw[4 : 4 + head_len])
+    cols: Dict[str, Any] = {}
+    offset = 4 + head_len
+    for name, typecode, nbytes in header["columns"]:
+        col = array(typecode)
+        col.frombytes(raw[offset : offset + nbytes])
+        cols[name] = col
+        offset += nbytes
+
+    plan = current_stage_plan()
+    size = plan.history_size
+    downtime = max(time.time() - header["saved_at"], 0.0)
+    now = time.monotonic()
+    live = {token for token, _ in token_registry.items()}
+    restored: "OrderedDict[str, token_registry.TokenState]" = OrderedDict()
+    scores, stages = cols["ring_scores"], cols["ring_stages"]
+    pos = 0
+    for token, stage, score, entered_at, n, last_tick, last_promo, idle, run, run_cutoff in zip(
+        header["tokens"],
+        cols["stage"],
+        cols["score"],
+        cols["entered_at"],
+        cols["counts"],
+        cols["last_ticks"],
+        cols["last_promos"],
+        cols["idle"],
+        cols["runs"],
+        cols["run_cutoffs"],
+    ):
+        pos += n
+        idle += downtime
+        if token in live or idle > plan.history_ttl_seconds:
+            continue
+        keep = min(n, size)
+        h = token_registry.TokenState(size, run_cutoff)
+        h.stage = _STAGES[stage] if stage >= 0 else None
+        h.score = score
+        h.entered_at = entered_at
+        h.scores[:keep] = scores[pos - keep : pos].tolist()
+        h.stages[:keep] = [_STAGES[c] for c in stages[pos - keep : pos]]
+        h.count = keep
+        h.last_tick = last_tick
+        h.last_promo = last_promo or None
+        h.run = min(run, keep)  # trailing() recounts if the cutoff has since moved
+        h.seen_at = now - idle
+        restored[token] = h
+    restored_count = len(restored)
+    # Restored tokens are older than any classified since startup.
+    token_registry.restore(restored)
+    token_registry.evict_idle(now, plan.history_ttl_seconds, plan.history_max_tokens)
+
+    return {
+        "tokens": restored_count,
+        "age_seconds": downtime,
+        "bytes": len(data),
+        "ms": (time.perf_counter() - started) * 1000,
+    }
+
+
+def _save(path: str) -> None:
+    try:
+        snapshot_watch_state(path)
+    except Exception as e:
+        print(f"[watch] state snapshot failed: {e}", flush=True)
+
+
+def _snapshot_loop(path: str, interval: float) -> None:
+    while not _STOP.wait(interval):
+        _save(path)
+
+
+def _shutdown(path: str) -> None:
+    _STOP.set()
+    _save(path)
+
+
+def snapshot_path(name: str) -> str:
+    """WATCH_SNAPSHOT_PATH with the process name before the extension."""
+    root, ext = os.path.splitext(settings.WATCH_SNAPSHOT_PATH)
+    return f"{root}.{name}{ext}"
+
+
+def start_watch_snapshots(name: str) -> None:
+    """
+    Restore this process's snapshot (reporting how long it took), then keep
+    writing it. Only the first call does anything, and nothing when
+    WATCH_SNAPSHOT_SECONDS is 0.
+    """
+    global _STARTED
+    interval = settings.WATCH_SNAPSHOT_SECONDS
+    with _START_LOCK:
+        if _STARTED or not settings.WATCH_SNAPSHOT_PATH or interval <= 0:
+            return
+        _STARTED = True
+    path = snapshot_path(name)
+
+    try:
+        result = restore_watch_state(path)
+    except Exception as e:
+        print(f"[watch] state restore failed, starting cold: {e}", flush=True)
+    else:
+        if result is not None:
+            print(
+                f"[watch] state restored in {result['ms']:.0f}ms: {result['tokens']} tokens, "
+                f"snapshot {result['bytes']} bytes "
+                f"from {result['age_seconds']:.0f}s ago",
+                flush=True,
+            )
+
+    threading.Thread(target=_snapshot_loop, args=(path, interval), name="watch-snapshot", daemon=True).start()
+    atexit.register(_shutdown, path)
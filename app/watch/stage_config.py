@@ -1,3 +1,16 @@
+from __future__ import annotations
+
+import copy
+import json
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from app.config import settings
+
 SOL_STAGE_THRESHOLDS = {
     "lp_usd": {"min": 12_000, "mid": 30_000, "high": 60_000},
     "vol_5m": {"low": 3_000, "mid": 10_000, "high": 25_000},
@@ -12,5 +25,204 @@ SOL_STAGE_THRESHOLDS = {
         "promotion_cooldown_ticks": 2,
         "demote_cutoff": 8,
         "history_size": 20,
+        # Idle tokens' history is dropped after this long, and the least
+        # recently classified beyond history_max_tokens.
+        "history_ttl_seconds": 6 * 3600,
+        "history_max_tokens": 200_000,
     },
 }
+
+# (metric, label, tiers highest first, below_score, below_reason); penalties
+# have no below entry and score nothing when no tier matches.
+SCORED_METRICS: tuple = (
+    ("lp_usd", "LP", (("high", 3), ("mid", 2), ("min", 1)), -2, "LP < min"),
+    ("vol_5m", "Vol5m", (("high", 4), ("mid", 3), ("low", 1)), -1, "Vol5m weak"),
+    ("tx_5m", "Tx5m", (("high", 3), ("mid", 2), ("low", 1)), -1, "Tx5m sparse"),
+    ("holders_delta_15m", "Holders", (("high", 4), ("mid", 3), ("low", 1)), -1, "Holder growth weak"),
+    ("top10_pct", "Top10", (("severe", -3), ("bad", -2), ("warn", -1)), None, None),
+)
+
+
+@dataclass(frozen=True)
+class MetricTiers:
+    metric: str
+    thresholds: tuple[float, ...]  # highest first; the first one reached wins
+    scores: tuple[int, ...]
+    reasons: tuple[str, ...]
+    below_score: int
+    below_reason: Optional[str]  # None: a penalty, nothing below the last tier
+
+
+@dataclass(frozen=True)
+class StagePlan:
+    """
+    SOL_STAGE_THRESHOLDS (plus overrides) flattened and checked once.
+
+    Swapped whole on reload, so a caller holding one sees a consistent set
+    of thresholds for the rest of its call or batch.
+    """
+
+    metrics: tuple[MetricTiers, ...]
+    building_cutoff: float
+    near_pass_cutoff: float
+    min_consecutive: int
+    trend_window: int
+    min_slope: float
+    cooldown_ticks: int
+    demote_cutoff: float
+    history_size: int
+    history_ttl_seconds: float
+    history_max_tokens: int
+    source: str
+
+
+def _number(section: str, key: str, value: Any) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{section}.{key} must be a finite number, got {value!r}")
+    return value
+
+
+def _merged(overrides: Dict[str, Any]) -> Dict[str, Any]:
+    merged = copy.deepcopy(SOL_STAGE_THRESHOLDS)
+    for section, values in overrides.items():
+        if section not in merged:
+            raise ValueError(f"unknown section {section!r}")
+        if not isinstance(values, dict):
+            raise ValueError(f"{section} must be an object")
+        for key, value in values.items():
+            if key not in merged[section]:
+                raise ValueError(f"unknown key {section}.{key}")
+            merged[section][key] = value
+    return merged
+
+
+def compile_stage_plan(overrides: Optional[Dict[str, Any]] = None, source: str = "defaults") -> StagePlan:
+    """
+    Build a StagePlan from SOL_STAGE_THRESHOLDS with `overrides` (same shape,
+    any subset of keys) laid over it.
+
+    Raises ValueError on unknown keys, non-numeric values, tiers out of
+    order, or confirmation settings that could never promote.
+    """
+    T = _merged(overrides or {})
+
+    metrics = []
+    for metric, label, tiers, below_score, below_reason in SCORED_METRICS:
+        thresholds = tuple(_number(metric, tier_key, T[metric][tier_key]) for tier_key, _ in tiers)
+        if any(a < b for a, b in zip(thresholds, thresholds[1:])):
+            order = " >= ".join(tier_key for tier_key, _ in tiers)
+            raise ValueError(f"{metric} tiers must satisfy {order}")
+        metrics.append(
+            MetricTiers(
+                metric=metric,
+                thresholds=thresholds,
+                scores=tuple(tier_score for _, tier_score in tiers),
+                reasons=tuple(f"{label} >= {tier_key}" for tier_key, _ in tiers),
+                below_score=below_score or 0,
+                below_reason=below_reason,
+            )
+        )
+
+    cutoffs = T["stage_cutoffs"]
+    building = _number("stage_cutoffs", "building", cutoffs["building"])
+    near_pass = _number("stage_cutoffs", "near_pass", cutoffs["near_pass"])
+    if building > near_pass:
+        raise ValueError("stage_cutoffs.building must not exceed stage_cutoffs.near_pass")
+
+    confirm = {k: _number("near_pass_confirmation", k, v) for k, v in T["near_pass_confirmation"].items()}
+    for key in ("min_consecutive", "trend_window", "promotion_cooldown_ticks", "history_size", "history_max_tokens"):
+        if confirm[key] != int(confirm[key]) or confirm[key] < 0:
+            raise ValueError(f"near_pass_confirmation.{key} must be a non-negative integer")
+    if confirm["trend_window"] < 2:
+        raise ValueError("near_pass_confirmation.trend_window must be at least 2")
+    if confirm["history_size"] < confirm["trend_window"] - 1:
+        raise ValueError("near_pass_confirmation.history_size must cover trend_window - 1 ticks")
+    if confirm["history_ttl_seconds"] <= 0 or confirm["history_max_tokens"] < 1:
+        raise ValueError("near_pass_confirmation history_ttl_seconds and history_max_tokens must be positive")
+
+    return StagePlan(
+        metrics=tuple(metrics),
+        building_cutoff=building,
+        near_pass_cutoff=near_pass,
+        min_consecutive=int(confirm["min_consecutive"]),
+        trend_window=int(confirm["trend_window"]),
+        min_slope=float(confirm["min_slope"]),
+        cooldown_ticks=int(confirm["promotion_cooldown_ticks"]),
+        demote_cutoff=confirm["demote_cutoff"],
+        history_size=int(confirm["history_size"]),
+        history_ttl_seconds=float(confirm["history_ttl_seconds"]),
+        history_max_tokens=int(confirm["history_max_tokens"]),
+        source=source,
+    )
+
+
+def _config_mtime() -> Optional[int]:
+    try:
+        return os.stat(settings.WATCH_STAGE_CONFIG_PATH).st_mtime_ns if settings.WATCH_STAGE_CONFIG_PATH else None
+    except OSError:
+        return None
+
+
+def _load_overrides() -> tuple[Dict[str, Any], str]:
+    """Env overrides with the file's laid over them, and where they came from."""
+    overrides: Dict[str, Any] = {}
+    sources = ["defaults"]
+    layers = []
+    raw = settings.WATCH_STAGE_OVERRIDES
+    if raw.strip():
+        layers.append(("env", json.loads(raw)))
+    path = settings.WATCH_STAGE_CONFIG_PATH
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            layers.append((path, json.load(f)))
+    for name, layer in layers:
+        for section, values in layer.items():
+            overrides.setdefault(section, {}).update(values)
+        sources.append(name)
+    return overrides, "+".join(sources)
+
+
+_PLAN: StagePlan = compile_stage_plan()
+_PLAN_MTIME: Optional[int] = None
+_NEXT_CHECK = 0.0
+_RELOAD_LOCK = threading.Lock()
+
+
+def reload_stage_plan() -> StagePlan:
+    """
+    Recompile from WATCH_STAGE_OVERRIDES and WATCH_STAGE_CONFIG_PATH and
+    swap the plan in. A config that fails to load or validate is reported
+    and the current plan kept.
+    """
+    global _PLAN, _PLAN_MTIME
+    with _RELOAD_LOCK:
+        _PLAN_MTIME = _config_mtime()  # a rejected file is not retried until it changes
+        try:
+            overrides, source = _load_overrides()
+            plan = compile_stage_plan(overrides, source)
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            print(f"[watch] stage config rejected, keeping {_PLAN.source}: {e}", flush=True)
+            return _PLAN
+        if plan != _PLAN:
+            print(f"[watch] stage config loaded from {plan.source}", flush=True)
+        _PLAN = plan
+        return plan
+
+
+def current_stage_plan() -> StagePlan:
+    """
+    The plan in force, reloading first when WATCH_STAGE_CONFIG_PATH changed
+    (checked at most every WATCH_STAGE_RELOAD_SECONDS).
+    """
+    global _NEXT_CHECK
+    path = settings.WATCH_STAGE_CONFIG_PATH
+    if path and settings.WATCH_STAGE_RELOAD_SECONDS > 0:
+        now = time.monotonic()
+        if now >= _NEXT_CHECK:
+            _NEXT_CHECK = now + settings.WATCH_STAGE_RELOAD_SECONDS
+            if _config_mtime() != _PLAN_MTIME:
+                reload_stage_plan()
+    return _PLAN
+
+
+reload_stage_plan()
@@ -1,16 +1,10 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
-from typing import Dict, List, TypedDict
+from typing import List, Optional
 
 from .stages import WatchStage
 from .stage_transitions import record_stage_transition
-
-class _StageState(TypedDict):
-    stage: WatchStage
-    entered_at: datetime
-
-_STATE: Dict[str, _StageState] = {}
+from .token_registry import TokenState, lookup
 
 def persist_stage_state(
     token: str,
@@ -18,12 +12,9 @@ def persist_stage_state(
     stage: WatchStage,
     score: int,
     reasons: List[str],
+    state: Optional[TokenState] = None,
 ) -> None:
-    prev = _STATE.get(token)
-    if prev is None or prev["stage"] != stage:
-        record_stage_transition(token, chain, stage, score, reasons)
-
-    _STATE[token] = {
-        "stage": stage,
-        "entered_at": datetime.now(timezone.utc),
-    }
+    if state is None:
+        state = lookup(token)
+    if state.stage != stage:
+        record_stage_transition(token, chain, stage, score, reasons, state)
@@ -1,30 +1,20 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import Dict, List, TypedDict
-
-import requests
+from typing import Dict, List, Optional
 
 from .stages import WatchStage
+from .token_registry import TokenState, lookup
 from app.services.watch_store import append_watch_event
+from app.services.webhook_delivery import get_delivery
 
 _N8N_NEAR_PASS_TRANSITION_URL = "https://justsomekids.app.n8n.cloud/webhook/near-pass-transition"
 _N8N_NEAR_PASS_DEMOTION_URL = "https://justsomekids.app.n8n.cloud/webhook/near-pass-demotion"
 
 
-class _TransitionState(TypedDict):
-    stage: WatchStage
-    entered_at: datetime
-
-
-_STATE: Dict[str, _TransitionState] = {}
-
-
 def _post_webhook(url: str, event: Dict[str, object]) -> None:
-    try:
-        requests.post(url, json=event, timeout=5)
-    except Exception:
-        pass
+    # Queued: delivery, retries and dead-lettering happen off this thread.
+    get_delivery().submit(url, event)
 
 
 def _emit_transition_webhook(event: Dict[str, object]) -> None:
@@ -46,16 +36,20 @@ def record_stage_transition(
     stage: WatchStage,
     score: int,
     reasons: List[str],
+    state: Optional[TokenState] = None,
 ) -> None:
     now = datetime.now(timezone.utc)
 
-    prev = _STATE.get(token)
-    if prev and prev["stage"] == stage:
+    if state is None:
+        state = lookup(token)
+    if state.stage == stage:
         return
 
+    entered_at = None
     duration_seconds: int | None = None
-    if prev:
-        entered_at = prev["entered_at"]
+    if state.stage is not None:
+        # Epoch floats hold microseconds exactly at present-day magnitudes.
+        entered_at = datetime.fromtimestamp(state.entered_at, timezone.utc)
         exited_at = now
         duration_seconds = int((exited_at - entered_at).total_seconds())
 
@@ -63,11 +57,11 @@ def record_stage_transition(
         "event": "stage_transition",
         "token": token,
         "chain": chain,
-        "from_stage": prev["stage"] if prev else None,
+        "from_stage": state.stage,
         "to_stage": stage,
         "score": score,
         "reasons": reasons,
-        "entered_at": prev["entered_at"].isoformat() if prev else None,
+        "entered_at": entered_at.isoformat() if entered_at else None,
         "exited_at": now.isoformat(),
         "duration_seconds": duration_seconds,
         "timestamp": now.isoformat(),
@@ -76,7 +70,5 @@ def record_stage_transition(
     append_watch_event(event)
     _emit_transition_webhook(event)
 
-    _STATE[token] = {
-        "stage": stage,
-        "entered_at": now,
-    }
+    state.stage = stage
+    state.entered_at = now.timestamp()
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, TypedDict
+
+from .stages import WatchStage
+
+
+class EvalRecord(TypedDict):
+    tick: int
+    score: int
+    stage: WatchStage
+
+
+class TokenState:
+    """
+    Everything the watch pipeline keeps about one token, in one record.
+
+    - stage, score, entered_at: the persisted stage (None until
+      evolve_watch_stage first records one), the score it was last evaluated
+      at, and when the token entered that stage (epoch seconds)
+    - the classifier's history: the last `size` evaluations in a ring
+      buffer. Ticks are consecutive per token, so only the newest is stored.
+      Running counters answer the near_pass checks without walking the
+      buffer: `run` is how many of the newest records scored >= `run_cutoff`,
+      and `last_promo` the tick of the newest near_pass record (still
+      relevant only while it is in the buffer)
+    - seen_at: time.monotonic() of the last evaluation, for eviction
+    """
+
+    __slots__ = (
+        "stage",
+        "score",
+        "entered_at",
+        "size",
+        "scores",
+        "stages",
+        "start",
+        "count",
+        "last_tick",
+        "run",
+        "run_cutoff",
+        "last_promo",
+        "seen_at",
+    )
+
+    def __init__(self, size: int = 0, run_cutoff: float = math.nan):
+        self.stage: Optional[WatchStage] = None
+        self.score = 0
+        self.entered_at = 0.0
+        self.size = size
+        self.scores: list[int] = [0] * size
+        self.stages: list[Optional[WatchStage]] = [None] * size
+        self.start = 0
+        self.count = 0
+        self.last_tick = 0
+        self.run = 0
+        self.run_cutoff = run_cutoff
+        self.last_promo: Optional[int] = None
+        self.seen_at = 0.0
+
+    def score_at(self, i: int) -> int:
+        """Score of the i-th retained record, oldest first."""
+        return self.scores[(self.start + i) % self.size]
+
+    def last_stage(self) -> Optional[WatchStage]:
+        return self.stages[(self.start + self.count - 1) % self.size] if self.count else None
+
+    def trailing(self, cutoff: float) -> int:
+        """How many of the newest records scored >= cutoff."""
+        if cutoff != self.run_cutoff:
+            # Cutoff changed since the counter was kept: count once, keep it.
+            self.run_cutoff = cutoff
+            self.run = 0
+            for i in range(self.count - 1, -1, -1):
+                if self.score_at(i) < cutoff:
+                    break
+                self.run += 1
+        return self.run
+
+    def last_promo_tick(self) -> Optional[int]:
+        """Tick of the newest retained near_pass record."""
+        if self.last_promo is not None and self.last_promo > self.last_tick - self.count:
+            return self.last_promo
+        return None
+
+    def push(self, tick: int, score: int, stage: WatchStage) -> None:
+        if self.count == self.size:
+            self.start = (self.start + 1) % self.size
+        else:
+            self.count += 1
+        i = (self.start + self.count - 1) % self.size
+        self.scores[i] = score
+        self.stages[i] = stage
+        self.last_tick = tick
+        self.run = min(self.run + 1, self.count) if score >= self.run_cutoff else 0
+        if stage == "near_pass":
+            self.last_promo = tick
+
+    def resize(self, size: int) -> None:
+        """Keep the newest records in a buffer of another size (history_size changed, or first use)."""
+        keep = min(self.count, size)
+        first = self.count - keep
+        scores = [0] * size
+        stages: list[Optional[WatchStage]] = [None] * size
+        for j in range(keep):
+            k = (self.start + first + j) % self.size
+            scores[j] = self.scores[k]
+            stages[j] = self.stages[k]
+        self.size, self.scores, self.stages = size, scores, stages
+        self.start = 0
+        self.count = keep
+        self.run = min(self.run, keep)
+
+    def records(self) -> List[EvalRecord]:
+        first = self.last_tick - self.count + 1
+        return [
+            {"tick": first + i, "score": self.score_at(i), "stage": self.stages[(self.start + i) % self.size]}
+            for i in range(self.count)
+        ]
+
+
+# token -> state, least recently evaluated first. Sync routes run in a
+# threadpool and the snapshot thread copies it, so every access to the
+# dict itself goes through _LOCK.
+_TOKENS: "OrderedDict[str, TokenState]" = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def token_key(signals: Dict[str, Any], strip: bool = False) -> Optional[str]:
+    """
+    The first non-empty identity field. The classifier keys its history on
+    the value as given; stage persistence (strip=True) on the stripped
+    value, skipping whitespace-only ones.
+    """
+    for key in ("token", "symbol", "address", "mint"):
+        value = signals.get(key)
+        if isinstance(value, str):
+            if strip:
+                value = value.strip()
+            if value:
+                return value
+    return None
+
+
+def lookup(token: str) -> TokenState:
+    """The token's record, created if new, marked most recently used."""
+    with _LOCK:
+        state = _TOKENS.get(token)
+        if state is None:
+            state = _TOKENS[token] = TokenState()
+        else:
+            _TOKENS.move_to_end(token)
+        state.seen_at = time.monotonic()
+    return state
+
+
+def evict_idle(now: float, ttl: float, max_tokens: int) -> None:
+    with _LOCK:
+        # Oldest first, so this stops at the first token still in use.
+        while _TOKENS:
+            token, state = next(iter(_TOKENS.items()))
+            if len(_TOKENS) <= max_tokens and now - state.seen_at <= ttl:
+                return
+            del _TOKENS[token]
+
+
+def items() -> List[tuple[str, TokenState]]:
+    """A copy of the registry's (token, state) pairs, least recently evaluated first."""
+    with _LOCK:
+        return list(_TOKENS.items())
+
+
+def restore(older: "OrderedDict[str, TokenState]") -> None:
+    """Put `older` behind the current records; tokens already present keep theirs."""
+    with _LOCK:
+        older.update(_TOKENS)
+        _TOKENS.clear()
+        _TOKENS.update(older)
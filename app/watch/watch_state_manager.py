@@ -1,46 +1,29 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
-from typing import Any, Dict, Optional, TypedDict
+from typing import Any, Dict
 
 from .classifier import classify_watch_stage
 from .stage_state import persist_stage_state
-from .stages import StageDecision, WatchStage
-
-class WatchStageState(TypedDict):
-    stage: WatchStage
-    score: int
-    entered_at: datetime
-
-# Process-local, in-memory state only (ephemeral; resets on restart).
-_STATE: Dict[str, WatchStageState] = {}
-
-def _token_key(signals: Dict[str, Any]) -> Optional[str]:
-    for key in ("token", "symbol", "address", "mint"):
-        value = signals.get(key)
-        if isinstance(value, str):
-            token = value.strip()
-            if token:
-                return token
-    return None
+from .stages import StageDecision
+from .token_registry import lookup, token_key
 
 def evolve_watch_stage(signals: Dict[str, Any]) -> StageDecision:
     """
     Single entry point for watch stage evolution.
     Calls the classifier, evaluates transitions, and persists stage state.
+
+    The token's registry record (process-local, in memory; see
+    app.watch.snapshot for carrying it across restarts) is looked up once
+    and shared by every step.
     """
-    decision = classify_watch_stage(signals)
-    token = _token_key(signals)
+    token = token_key(signals, strip=True)
     if not token:
-        return decision
+        return classify_watch_stage(signals)
 
+    state = lookup(token)
+    # Padded identities keep separate classifier history, as they always have.
+    decision = classify_watch_stage(signals, state if token_key(signals) == token else None)
     chain = signals.get("chain") if isinstance(signals.get("chain"), str) else "sol"
-    _STATE.get(token)
-    persist_stage_state(token, chain, decision.stage, decision.score, decision.reasons)
-
-    _STATE[token] = {
-        "stage": decision.stage,
-        "score": decision.score,
-        "entered_at": datetime.now(timezone.utc),
-    }
+    persist_stage_state(token, chain, decision.stage, decision.score, decision.reasons, state)
+    state.score = decision.score
     return decision
@@ -0,0 +1,161 @@
+"""
+Benchmark the worker's Dexscreener poll: a fresh connection per fetch
+against the keep-alive session with conditional requests and the pair
+fingerprint filter.
+
+Starts a local stand-in for the search endpoint serving --pairs pairs, with
+an ETag that honours If-None-Match. Each tick a --change-share of the pairs
+move, and a --static-share of ticks change nothing at all (304). Runs
+--ticks polls both ways and reports time per fetch, bytes received, and
+how many pairs reached score_pairs.
+
+    python -m bench.dex_poll_bench --pairs 30 --ticks 200 --change-share 0.2
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from app.services import dex_service, scan_service
+from app.services.score_service import score_pairs
+
+
+def _pairs(rnd: random.Random, n: int, now_ms: float) -> list[dict]:
+    return [
+        {
+            "chainId": "solana",
+            "pairAddress": f"Pair{i:05d}",
+            "baseToken": {"address": f"Mint{i:05d}", "name": f"Token {i}", "symbol": f"T{i}"},
+            "priceUsd": f"{rnd.uniform(0.0001, 2):.6f}",
+            "liquidity": {"usd": rnd.uniform(0, 50_000), "base": rnd.uniform(0, 1e9), "quote": rnd.uniform(0, 300)},
+            "volume": {"m5": rnd.uniform(0, 20_000), "h1": rnd.uniform(0, 90_000), "h24": rnd.uniform(0, 1e6)},
+            "priceChange": {"m5": rnd.uniform(-20, 30), "h1": rnd.uniform(-50, 80)},
+            "pairCreatedAt": now_ms - rnd.uniform(0, 60_000),
+        }
+        for i in range(n)
+    ]
+
+
+def _server(state: dict):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out as separate writes; without this, Nagle
+        # and delayed ACKs stall every keep-alive response by ~40ms.
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with state["lock"]:
+                body, etag = state["body"], state["etag"]
+                state["requests"] += 1
+            if state.get("delay"):
+                time.sleep(state["delay"])  # upstream response time
+            if state["etags"] and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            if state["etags"]:
+                self.send_header("ETag", etag)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            state["bytes"] += len(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _publish(state: dict, pairs: list[dict]) -> None:
+    body = json.dumps({"schemaVersion": "1.0.0", "pairs": pairs}).encode()
+    with state["lock"]:
+        state["body"] = body
+        state["etag"] = '"' + hashlib.md5(body).hexdigest() + '"'
+
+
+def _ticks(args) -> list:
+    # None: nothing changed since the previous tick.
+    rnd = random.Random(22)
+    now_ms = time.time() * 1000
+    pairs = _pairs(rnd, args.pairs, now_ms)
+    out = [pairs]
+    for _ in range(args.ticks - 1):
+        if rnd.random() < args.static_share:
+            out.append(None)
+            continue
+        pairs = [dict(p) for p in pairs]
+        for i in rnd.sample(range(len(pairs)), int(len(pairs) * args.change_share)):
+            p = pairs[i]
+            p["volume"] = {**p["volume"], "m5": p["volume"]["m5"] * rnd.uniform(0.9, 1.3)}
+            p["priceChange"] = {**p["priceChange"], "m5": p["priceChange"]["m5"] + rnd.uniform(-2, 2)}
+        out.append(pairs)
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pairs", type=int, default=30)
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--change-share", type=float, default=0.2)
+    parser.add_argument("--static-share", type=float, default=0.3)
+    args = parser.parse_args()
+
+    ticks = _ticks(args)
+    state = {"lock": threading.Lock(), "requests": 0, "bytes": 0, "etags": False}
+    server = _server(state)
+    url = f"http://127.0.0.1:{server.server_address[1]}/latest/dex/search?q=solana"
+
+    # Before: requests.get (new connection) and every pair scored.
+    scored = 0
+    fetch_s = 0.0
+    for pairs in ticks:
+        if pairs is not None:
+            _publish(state, pairs)
+        started = time.perf_counter()
+        got = requests.get(url, timeout=10).json()["pairs"]
+        fetch_s += time.perf_counter() - started
+        scored += len(got)
+        score_pairs(got)
+    print(
+        f"[bench] before  fetch={fetch_s * 1000 / len(ticks):6.2f}ms "
+        f"received={state['bytes'] / 1024:8.0f}KB pairs scored={scored}"
+    )
+
+    # After: the worker path, process_scan(changed_only=True).
+    state.update(requests=0, bytes=0, etags=True)
+    dex_service.DEX_URL = url
+    scored_after = 0
+    fetch_s = 0.0
+    ratios = []
+    for pairs in ticks:
+        if pairs is not None:
+            _publish(state, pairs)
+        started = time.perf_counter()
+        got = dex_service.fetch_solana_pairs()
+        fetch_s += time.perf_counter() - started
+        changed = scan_service._CHANGES.changed(got)
+        scored_after += len(changed)
+        score_pairs(changed)
+        ratios.append(scan_service._CHANGES.last["skipped"] / max(len(got), 1))
+    print(
+        f"[bench] after   fetch={fetch_s * 1000 / len(ticks):6.2f}ms "
+        f"received={state['bytes'] / 1024:8.0f}KB pairs scored={scored_after} "
+        f"304s={dex_service.FETCH_STATS['not_modified']}/{len(ticks)} "
+        f"mean skip ratio={sum(ratios[1:]) / max(len(ratios) - 1, 1):.0%}"
+    )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
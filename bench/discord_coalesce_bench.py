@@ -0,0 +1,85 @@
+"""
+Benchmark per-cycle coalescing of Discord alerts.
+
+Runs --cycles scan cycles of --hits alerts each (--pass-share pass,
+--rug-share rug, the rest near_pass) the way worker/scanner does, with
+end_cycle() after each and --interval seconds between cycles, against the
+fake webhook server of bench.discord_outbox_bench (one webhook per mode).
+Compares one post per alert with posts of up to 10 embeds, reporting the
+HTTP calls made and saved, 429s, and queued -> delivered latency. Every
+alert must arrive exactly once.
+
+    python -m bench.discord_coalesce_bench --cycles 5 --hits 40
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from app.services import discord_service, state_service
+from app.services.discord_outbox import DiscordOutbox
+from app.services.state_backends import SqliteStateBackend
+from bench.discord_outbox_bench import _candidate, _drain, _record_alert, fake_discord_server
+
+
+def _run(args, max_embeds: int) -> dict:
+    seen: dict = {}
+    counts = {"posts": 0, "429": 0, "502": 0}
+    server = fake_discord_server(args.limit, args.window, args.delay_ms / 1000, 0.0, seen, counts)
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/webhooks"
+    for n, mode in enumerate(("pass", "rug", "near_pass")):
+        discord_service.WEBHOOKS[mode] = [f"{url}/{n}/{mode}"]
+
+    rnd = random.Random(21)
+    with tempfile.TemporaryDirectory() as tmp:
+        state_service.set_backend(SqliteStateBackend(os.path.join(tmp, "engine.db")))
+        state_service.init()
+        sender = DiscordOutbox(max_embeds=max_embeds, poll_seconds=0.2)
+        sender.start()
+
+        i = 0
+        started = time.perf_counter()
+        for _ in range(args.cycles):
+            for _ in range(args.hits):
+                r = rnd.random()
+                mode = "pass" if r < args.pass_share else "rug" if r < args.pass_share + args.rug_share else "near_pass"
+                _record_alert(_candidate(i), mode)
+                i += 1
+            sender.end_cycle()
+            time.sleep(args.interval)
+        assert _drain(sender, 300), "outbox did not drain"
+        total_s = time.perf_counter() - started
+        sender.stop()
+        stats = sender.stats()
+        state_service.set_backend(SqliteStateBackend(os.path.join(tmp, "other.db")))
+    server.shutdown()
+
+    assert len(seen) == i and all(n == 1 for n in seen.values()), "an alert was lost or sent twice"
+    return {"stats": stats, "server": counts, "total_s": total_s, "alerts": i}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--hits", type=int, default=40)
+    parser.add_argument("--interval", type=float, default=2.0)
+    parser.add_argument("--pass-share", type=float, default=0.1)
+    parser.add_argument("--rug-share", type=float, default=0.1)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--window", type=float, default=2.0)
+    parser.add_argument("--delay-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    for label, max_embeds in (("per-alert", 1), ("coalesced", 10)):
+        r = _run(args, max_embeds)
+        s = r["stats"]
+        print(
+            f"[bench] {label:<9} alerts={r['alerts']} posts={r['server']['posts']} "
+            f"(ok={s['posts'] - s['rate_limited']}) saved={s['saved']} 429={r['server']['429']} "
+            f"drained in {r['total_s']:.1f}s latency p50={s['latency_p50_ms']:.0f}ms p95={s['latency_p95_ms']:.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
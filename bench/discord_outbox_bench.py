@@ -0,0 +1,216 @@
+"""
+Benchmark Discord alert delivery: inline requests.post per alert (as
+discord_service used to) against the engine.db outbox and its sender.
+
+Starts a local stand-in for Discord's webhook endpoint: each webhook allows
+--limit posts per --window seconds and reports its budget in X-RateLimit-*
+headers like Discord does, answering 429 (with retry_after) past it; each
+post takes --delay-ms and a --fail-rate share answers 502. One URL always
+404s. --alerts alerts are recorded the way worker/scanner does, spread over
+--hooks near_pass webhooks, plus one fanout log line that also hits the
+404 URL.
+
+The outbox run is stopped halfway and restarted on a fresh backend over the
+same file, to check that unsent alerts survive; every alert must then
+arrive exactly once, with its token_state row committed alongside it.
+
+    python -m bench.discord_outbox_bench --alerts 200 --hooks 3 --limit 5 --window 2
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from app.services import discord_service, state_service
+from app.services.discord_outbox import DiscordOutbox
+from app.services.discord_service import candidate_embed, queue_embed, send_text
+from app.services.state_backends import SqliteStateBackend
+
+
+def fake_discord_server(limit: int, window: float, delay: float, fail_rate: float, seen: dict, counts: dict):
+    rnd = random.Random(20)
+    lock = threading.Lock()
+    windows: dict = {}  # path -> (window end, used)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status: int, headers: dict, body: dict | None = None):
+            data = json.dumps(body).encode() if body is not None else b""
+            self.send_response(status)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(delay)
+            if self.path.endswith("/missing"):
+                self._reply(404, {}, {"message": "Unknown Webhook", "code": 10015})
+                return
+            now = time.monotonic()
+            with lock:
+                end, used = windows.get(self.path, (0.0, 0))
+                if now >= end:
+                    end, used = now + window, 0
+                over = used >= limit
+                if not over:
+                    used += 1
+                windows[self.path] = (end, used)
+                fail = not over and rnd.random() < fail_rate
+                counts["posts"] += 1
+                counts["429"] += over
+                counts["502"] += fail
+                if not over and not fail:
+                    keys = [e["footer"]["text"] for e in body["embeds"]] if "embeds" in body else [body["content"]]
+                    for key in keys:
+                        seen[key] = seen.get(key, 0) + 1
+                    counts.setdefault("order", []).extend(keys)
+            headers = {
+                "X-RateLimit-Limit": str(limit),
+                "X-RateLimit-Remaining": str(limit - used),
+                "X-RateLimit-Reset-After": f"{max(end - now, 0):.3f}",
+                "X-RateLimit-Bucket": self.path.rsplit("/", 1)[-1],
+            }
+            if over:
+                self._reply(429, headers, {"message": "You are being rate limited.", "retry_after": round(end - now, 3), "global": False})
+            elif fail:
+                self._reply(502, headers)
+            else:
+                self._reply(204, headers)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _candidate(i: int) -> dict:
+    return {
+        "token": f"Mint{i:06d}",
+        "symbol": f"T{i}",
+        "metrics": {"liquidity": 20_000 + i, "volume_5m": 9_000, "price_change_5m": 4.2, "age_minutes": 0.3},
+    }
+
+
+def _record_alert(c: dict, mode: str) -> dict:
+    with state_service.TokenStateTxn(c["token"]) as st:
+        st.upsert_seen(c["metrics"])
+        st.record_alert(mode)
+        embed = candidate_embed(c, mode=mode, explanation="bench")
+        embed["footer"]["text"] = c["token"]  # the server counts arrivals by token
+        queue_embed(st, embed, mode)
+    return embed
+
+
+def _drain(sender: DiscordOutbox, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while state_service.outbox_backlog():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--alerts", type=int, default=200)
+    parser.add_argument("--hooks", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--window", type=float, default=2.0)
+    parser.add_argument("--delay-ms", type=float, default=20)
+    parser.add_argument("--fail-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    seen: dict = {}
+    counts = {"posts": 0, "429": 0, "502": 0}
+    server = fake_discord_server(args.limit, args.window, args.delay_ms / 1000, args.fail_rate, seen, counts)
+    base = f"http://127.0.0.1:{server.server_address[1]}/api/webhooks"
+    hooks = [f"{base}/{n}/near-pass-{n}" for n in range(args.hooks)]
+    discord_service.WEBHOOKS["near_pass"] = hooks
+    discord_service.WEBHOOKS["logs"] = [f"{base}/9/logs", f"{base}/8/missing"]
+    alerts = [_candidate(i) for i in range(args.alerts)]
+
+    # Inline: one blocking post per alert, round-robin, responses ignored.
+    started = time.perf_counter()
+    for i, c in enumerate(alerts):
+        embed = candidate_embed(c, mode="near_pass", explanation="bench")
+        embed["footer"]["text"] = c["token"]
+        try:
+            requests.post(hooks[i % len(hooks)], json={"embeds": [embed]}, timeout=6)
+        except Exception:
+            pass
+    inline_s = time.perf_counter() - started
+    print(
+        f"[bench] inline  caller blocked {inline_s * 1000 / args.alerts:7.2f}ms/alert "
+        f"delivered={len(seen)}/{args.alerts} lost to 429={counts['429']} to 502={counts['502']}"
+    )
+
+    seen.clear()
+    counts.update(posts=0, **{"429": 0, "502": 0})
+    time.sleep(args.window)  # let the server's windows reset
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "engine.db")
+        state_service.set_backend(SqliteStateBackend(path))
+        state_service.init()
+
+        started = time.perf_counter()
+        for c in alerts:
+            _record_alert(c, "near_pass")
+        send_text("bench log line", mode="logs", fanout=True)
+        record_s = time.perf_counter() - started
+
+        # First sender: stopped once about half the alerts are out.
+        sender = DiscordOutbox(backoff_seconds=0.05, max_backoff_seconds=0.5, poll_seconds=0.2)
+        sender.start()
+        while len(seen) < args.alerts // 2:
+            time.sleep(0.01)
+        sender.stop()
+        first = sender.stats()
+        left = state_service.outbox_backlog()
+
+        # "Restart": a new backend over the same file and a new sender.
+        state_service.set_backend(SqliteStateBackend(path))
+        state_service.init()
+        sender = DiscordOutbox(backoff_seconds=0.05, max_backoff_seconds=0.5, poll_seconds=0.2)
+        sender.start()
+        assert _drain(sender, 300), "outbox did not drain"
+        drain_s = time.perf_counter() - started
+        sender.stop()
+        second = sender.stats()
+        state_service.set_backend(SqliteStateBackend(os.path.join(tmp, "other.db")))
+
+        with sqlite3.connect(path) as c:
+            alerted = c.execute("SELECT COUNT(*) FROM token_state WHERE sent_count = 1").fetchone()[0]
+            dead = c.execute("SELECT url, last_error FROM outbox WHERE dead_at IS NOT NULL").fetchall()
+
+    alerted_seen = [k for k in seen if k.startswith("Mint")]
+    assert all(n == 1 for n in seen.values()), "a message was delivered twice"
+    assert len(alerted_seen) == args.alerts == alerted, "an alert was lost"
+    assert len(dead) == 1 and "404" in dead[0][1], dead
+    print(
+        f"[bench] outbox  caller blocked {record_s * 1000 / (args.alerts + 1):7.2f}ms/alert "
+        f"(commit incl.) delivered={len(alerted_seen)}/{args.alerts} in {drain_s:.1f}s "
+        f"restarted with {left} unsent, posts={counts['posts']} 429={counts['429']} "
+        f"502 retried={first['retried'] + second['retried']} dead=1 (the 404) "
+        f"latency p50={second['latency_p50_ms']:.0f}ms p95={second['latency_p95_ms']:.0f}ms"
+    )
+    budget = args.hooks * args.limit / args.window
+    print(f"[bench] webhook budget {budget:.1f} posts/s, outbox achieved {len(alerted_seen) / drain_s:.1f} alerts/s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Local stand-in for a Redis server, covering only the commands that
+RedisStateBackend sends (strings, hashes, sorted sets, MULTI/EXEC with
+WATCH, expiry, and its lock-release script).
+Single process, in memory, one global lock: enough to exercise the backend
+and benchmark the protocol round trips without a real Redis.
+
+    python -m bench.resp_server --port 6390
+"""
+import argparse
+import socket
+import socketserver
+import threading
+import time
+
+from app.services.state_backends import RELEASE_LOCK_SCRIPT
+
+
+class _Store:
+    def __init__(self):
+        self.data: dict[str, object] = {}
+        self.expires: dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def _alive(self, key: str) -> bool:
+        exp = self.expires.get(key)
+        if exp is not None and exp <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def get(self, key: str, kind: type):
+        if not self._alive(key):
+            return None
+        value = self.data[key]
+        if not isinstance(value, kind):
+            raise ValueError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def delete(self, key: str) -> int:
+        self.expires.pop(key, None)
+        return 1 if self.data.pop(key, None) is not None else 0
+
+    def snapshot(self, key: str):
+        # What WATCH compares at EXEC; by value, which is enough for the
+        # unique owner tokens the backend watches.
+        if not self._alive(key):
+            return None
+        value = self.data[key]
+        return dict(value) if isinstance(value, dict) else value
+
+
+def _score(raw: str) -> tuple[float, bool]:
+    exclusive = raw.startswith("(")
+    raw = raw[1:] if exclusive else raw
+    return float(raw), exclusive
+
+
+def _in_range(score: float, lo: tuple[float, bool], hi: tuple[float, bool]) -> bool:
+    if score < lo[0] or (lo[1] and score == lo[0]):
+        return False
+    if score > hi[0] or (hi[1] and score == hi[0]):
+        return False
+    return True
+
+
+def _zrange(store: _Store, args: list[str], reverse: bool):
+    key = args[0]
+    if reverse:
+        hi, lo = _score(args[1]), _score(args[2])
+    else:
+        lo, hi = _score(args[1]), _score(args[2])
+    offset, count = 0, -1
+    rest = [a.upper() for a in args[3:]]
+    if "LIMIT" in rest:
+        i = rest.index("LIMIT")
+        offset, count = int(args[3 + i + 1]), int(args[3 + i + 2])
+    zset = store.get(key, dict) or {}
+    members = sorted(
+        (m for m, s in zset.items() if _in_range(s, lo, hi)),
+        key=lambda m: (zset[m], m),
+        reverse=reverse,
+    )
+    members = members[offset:]
+    return members if count < 0 else members[:count]
+
+
+def _execute(store: _Store, cmd: str, args: list[str]):
+    if cmd == "PING":
+        return "+PONG"
+    if cmd in ("AUTH", "SELECT"):
+        return "+OK"
+    if cmd == "FLUSHDB":
+        store.data.clear()
+        store.expires.clear()
+        return "+OK"
+    if cmd == "GET":
+        return store.get(args[0], str)
+    if cmd == "SET":
+        key, value = args[0], args[1]
+        opts = [a.upper() for a in args[2:]]
+        if "NX" in opts and store._alive(key):
+            return None
+        store.data[key] = value
+        store.expires.pop(key, None)
+        if "PX" in opts:
+            store.expires[key] = time.time() + int(args[2 + opts.index("PX") + 1]) / 1000
+        if "EX" in opts:
+            store.expires[key] = time.time() + int(args[2 + opts.index("EX") + 1])
+        return "+OK"
+    if cmd == "DEL":
+        return sum(store.delete(k) for k in args if store._alive(k))
+    if cmd == "EVAL":
+        if args[0] != RELEASE_LOCK_SCRIPT:
+            raise ValueError("ERR only the state lock release script is supported")
+        key, owner = args[2], args[3]
+        if store.get(key, str) == owner:
+            return store.delete(key)
+        return 0
+    if cmd == "EXPIRE":
+        if not store._alive(args[0]):
+            return 0
+        store.expires[args[0]] = time.time() + int(args[1])
+        return 1
+    if cmd == "HSET":
+        h = store.get(args[0], dict)
+        if h is None:
+            h = store.data[args[0]] = {}
+        added = 0
+        for f, v in zip(args[1::2], args[2::2]):
+            added += f not in h
+            h[f] = v
+        return added
+    if cmd == "HGET":
+        return (store.get(args[0], dict) or {}).get(args[1])
+    if cmd == "HDEL":
+        h = store.get(args[0], dict) or {}
+        return sum(h.pop(f, None) is not None for f in args[1:])
+    if cmd == "HGETALL":
+        h = store.get(args[0], dict) or {}
+        return [x for kv in h.items() for x in kv]
+    if cmd == "ZADD":
+        z = store.get(args[0], dict)
+        if z is None:
+            z = store.data[args[0]] = {}
+        added = 0
+        for s, m in zip(args[1::2], args[2::2]):
+            added += m not in z
+            z[m] = float(s)
+        return added
+    if cmd == "ZREM":
+        z = store.get(args[0], dict) or {}
+        return sum(z.pop(m, None) is not None for m in args[1:])
+    if cmd == "ZSCORE":
+        score = (store.get(args[0], dict) or {}).get(args[1])
+        return None if score is None else repr(score)
+    if cmd == "ZCARD":
+        return len(store.get(args[0], dict) or {})
+    if cmd == "ZRANGEBYSCORE":
+        return _zrange(store, args, reverse=False)
+    if cmd == "ZREVRANGEBYSCORE":
+        return _zrange(store, args, reverse=True)
+    raise ValueError(f"ERR unknown command '{cmd}'")
+
+
+def _encode(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, Exception):
+        return f"-{value}\r\n".encode()
+    if isinstance(value, bool) or isinstance(value, int):
+        return b":%d\r\n" % int(value)
+    if isinstance(value, str) and value.startswith("+"):
+        return f"{value}\r\n".encode()
+    if isinstance(value, str):
+        b = value.encode()
+        return b"$%d\r\n%s\r\n" % (len(b), b)
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(v) for v in value)
+    raise TypeError(type(value))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        # Pipelined replies are written one by one; without this they stall
+        # behind the client's delayed ACKs.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _read_command(self) -> list[str] | None:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        n = int(line[1:-2])
+        args = []
+        for _ in range(n):
+            size = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(size + 2)[:-2].decode())
+        return args
+
+    def handle(self):
+        store: _Store = self.server.store
+        queued: list[list[str]] | None = None
+        watched: dict[str, object] = {}
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            cmd = args[0].upper()
+            if cmd == "WATCH":
+                with store.lock:
+                    for key in args[1:]:
+                        watched[key] = store.snapshot(key)
+                reply = "+OK"
+            elif cmd == "UNWATCH":
+                watched = {}
+                reply = "+OK"
+            elif cmd == "MULTI":
+                queued = []
+                reply = "+OK"
+            elif cmd == "DISCARD":
+                queued = None
+                watched = {}
+                reply = "+OK"
+            elif cmd == "EXEC":
+                results = []
+                with store.lock:
+                    if any(store.snapshot(k) != v for k, v in watched.items()):
+                        results = None  # a watched key changed: nothing runs
+                    else:
+                        for q in queued or []:
+                            try:
+                                results.append(_execute(store, q[0].upper(), q[1:]))
+                            except Exception as e:
+                                results.append(e)
+                queued = None
+                watched = {}
+                reply = results
+            elif queued is not None:
+                queued.append(args)
+                reply = "+QUEUED"
+            else:
+                try:
+                    with store.lock:
+                        reply = _execute(store, cmd, args[1:])
+                except Exception as e:
+                    reply = e
+            self.wfile.write(_encode(reply))
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.store = _Store()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self) -> "RespServer":
+        threading.Thread(target=self.serve_forever, name="resp-server", daemon=True).start()
+        return self
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+
+    server = RespServer(args.host, args.port)
+    print(f"[resp] listening on {server.url}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark POST /scan under concurrent load: a blocking Dexscreener fetch
+per request on the event loop (as the route used to) against the shared
+scan snapshot with its background refresh and single-flight fetches.
+
+Starts the local search-endpoint stand-in of bench.dex_poll_bench, with
+--upstream-ms per response. --clients n8n-like clients post signed
+payloads back to back for --seconds, pausing --think-ms between requests;
+a --fresh-share of them send max_staleness_seconds 0. Requests go through
+the ASGI app in-process. Reports request latency, the longest event-loop
+stall (seen by a 10ms ticker), and upstream calls made.
+
+    python -m bench.scan_endpoint_bench --clients 50 --seconds 10 --upstream-ms 300
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+
+from app.routes import scan as scan_route
+from app.services import dex_service
+from app.services.scan_service import ScanRequestError, process_scan_payload
+from app.services.scan_snapshot import SCAN_SNAPSHOTS, SCAN_STATS
+from bench.dex_poll_bench import _pairs, _publish, _server
+
+SECRET = "bench-secret"
+
+
+def _before_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/scan")
+    async def scan(request: Request):
+        raw_body = await request.body()
+        try:
+            return process_scan_payload(raw_body, request.headers.get("X-N8N-Signature"), SECRET)
+        except ScanRequestError as exc:
+            raise HTTPException(status_code=exc.status_code, detail=exc.detail)
+
+    return app
+
+
+def _after_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(scan_route.router)
+    return app
+
+
+def _signed(payload: dict) -> tuple[bytes, dict]:
+    body = json.dumps(payload).encode()
+    sig = hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return body, {"X-N8N-Signature": sig, "Content-Type": "application/json"}
+
+
+def _pct(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] if values else 0.0
+
+
+async def _load(app: FastAPI, args, start_refresh: bool) -> dict:
+    latencies: list[float] = []
+    statuses: dict = {}
+    stall = [0.0]
+    stop = time.monotonic() + args.seconds
+
+    async def ticker():
+        last = time.perf_counter()
+        while time.monotonic() < stop:
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            stall[0] = max(stall[0], now - last - 0.01)
+            last = now
+
+    async def client(n: int, http: httpx.AsyncClient):
+        rnd = random.Random(n)
+        # Latency counts from when the request was due, so time spent
+        # waiting for a blocked loop to get to it is included.
+        due = time.perf_counter() + rnd.uniform(0, args.think_ms / 1000)
+        await asyncio.sleep(due - time.perf_counter())
+        while time.monotonic() < stop:
+            payload = {"timestamp": "2026-01-01T00:00:00Z"}
+            if rnd.random() < args.fresh_share:
+                payload["max_staleness_seconds"] = 0
+            body, headers = _signed(payload)
+            r = await http.post("/scan", content=body, headers=headers)
+            latencies.append(time.perf_counter() - due)
+            statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+            due = time.perf_counter() + args.think_ms / 1000
+            await asyncio.sleep(args.think_ms / 1000)
+
+    if start_refresh:
+        SCAN_SNAPSHOTS.start(args.refresh)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as http:
+        await asyncio.gather(ticker(), *(client(n, http) for n in range(args.clients)))
+    if SCAN_SNAPSHOTS._task is not None:
+        SCAN_SNAPSHOTS._task.cancel()
+    return {"latencies": latencies, "statuses": statuses, "stall": stall[0]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--think-ms", type=float, default=200)
+    parser.add_argument("--fresh-share", type=float, default=0.02)
+    parser.add_argument("--upstream-ms", type=float, default=300)
+    parser.add_argument("--refresh", type=float, default=2.0)
+    parser.add_argument("--pairs", type=int, default=30)
+    args = parser.parse_args()
+
+    state = {"lock": threading.Lock(), "requests": 0, "bytes": 0, "etags": False, "delay": args.upstream_ms / 1000}
+    _publish(state, _pairs(random.Random(24), args.pairs, time.time() * 1000))
+    server = _server(state)
+    dex_service.DEX_URL = f"http://127.0.0.1:{server.server_address[1]}/latest/dex/search?q=solana"
+    scan_route.N8N_SHARED_SECRET = SECRET
+
+    for label, app, refresh in (("before", _before_app(), False), ("snapshot", _after_app(), True)):
+        state["requests"] = 0
+        r = asyncio.run(_load(app, args, refresh))
+        lat = r["latencies"]
+        print(
+            f"[bench] {label:<8} requests={len(lat)} ({len(lat) / args.seconds:.0f}/s) "
+            f"statuses={r['statuses']} p50={_pct(lat, 0.5) * 1000:.0f}ms p95={_pct(lat, 0.95) * 1000:.0f}ms "
+            f"max={max(lat, default=0) * 1000:.0f}ms loop stall={r['stall'] * 1000:.0f}ms "
+            f"upstream calls={state['requests']}"
+        )
+    print(
+        f"[bench] snapshot served {SCAN_STATS['cached']} from cache, {SCAN_STATS['joined']} joins "
+        f"of an in-flight fetch, {SCAN_STATS['refreshes']} refreshes"
+    )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark the token_state time queries before and after the index migration.
+
+Builds a token_state table at schema v1 (primary key only), times the
+top_recent and replay queries, runs the remaining migrations and times them
+again.
+
+    python -m bench.schema_bench --rows 1000000
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from app.services.state_backends import _MIGRATIONS, SqliteStateBackend
+
+TOP_RECENT_SQL = """
+    SELECT token, last_seen, last_severity, sent_count
+    FROM token_state
+    WHERE last_seen >= ?
+    ORDER BY last_seen DESC
+    LIMIT 25
+"""
+
+REPLAY_SQL = """
+    SELECT token, last_seen
+    FROM token_state
+    WHERE last_seen >= ?
+    ORDER BY last_seen ASC
+"""
+
+
+def _fill(c, rows: int, now: int) -> None:
+    rnd = random.Random(42)
+    metrics = '{"liquidity": 900.0, "volume_5m": 25.0, "price_change_5m": 1.5, "age_minutes": 0.3}'
+    batch = []
+    for i in range(rows):
+        # Mostly one-off mints spread over 30 days, as in production.
+        seen = now - rnd.randrange(30 * 86400)
+        batch.append((f"mint{i:09d}", seen, seen, metrics, rnd.choice(("near_pass", "pass", "rug"))))
+        if len(batch) == 50_000:
+            c.executemany(
+                "INSERT INTO token_state (token, first_seen, last_seen, last_metrics, last_severity) "
+                "VALUES (?, ?, ?, ?, ?)",
+                batch,
+            )
+            batch.clear()
+    if batch:
+        c.executemany(
+            "INSERT INTO token_state (token, first_seen, last_seen, last_metrics, last_severity) "
+            "VALUES (?, ?, ?, ?, ?)",
+            batch,
+        )
+    c.commit()
+
+
+def _time(c, label: str, sql: str, params: tuple, repeat: int) -> float:
+    plan = " / ".join(r[-1] for r in c.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+    started = time.perf_counter()
+    for _ in range(repeat):
+        n = len(c.execute(sql, params).fetchall())
+    ms = (time.perf_counter() - started) / repeat * 1000
+    print(f"[bench] {label:<22} rows={n:<7} {ms:9.2f}ms  plan: {plan}")
+    return ms
+
+
+def _run(c, tag: str, now: int, repeat: int) -> tuple[float, float]:
+    top = _time(c, f"top_recent 24h ({tag})", TOP_RECENT_SQL, (now - 86400,), repeat)
+    replay = _time(c, f"replay 1h ({tag})", REPLAY_SQL, (now - 3600,), repeat)
+    return top, replay
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    now = int(time.time())
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SqliteStateBackend(Path(tmp) / "engine.db")
+        c = backend._connect()
+        _MIGRATIONS[0](c)
+        c.execute("PRAGMA user_version=1")
+
+        started = time.perf_counter()
+        _fill(c, args.rows, now)
+        print(f"[bench] filled {args.rows} rows in {time.perf_counter() - started:.1f}s")
+
+        before = _run(c, "v1", now, args.repeat)
+
+        started = time.perf_counter()
+        version = backend._migrate(c)
+        print(f"[bench] migrated to v{version} in {time.perf_counter() - started:.1f}s")
+
+        after = _run(c, f"v{version}", now, args.repeat)
+        backend.close()
+
+    print(f"[bench] speedup top_recent={before[0] / after[0]:.0f}x replay={before[1] / after[1]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
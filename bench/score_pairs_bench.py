@@ -0,0 +1,101 @@
+"""
+Benchmark score_pairs_batch against score_pairs on whole Dexscreener
+responses.
+
+Builds responses of --pairs pairs shaped like the search endpoint's, about
+a --pass-share of them fresh and liquid enough to pass the gate. Unless
+--clean, a --junk-share of pairs are malformed the ways JSON allows:
+numbers as strings, nulls, missing or non-object fields, NaN, bools,
+integers past float range, pairs that are not objects, and passing pairs
+without a baseToken. Every response is scored --repeat times both ways at
+the same clock, and the outputs must be equal.
+
+    python -m bench.score_pairs_bench --pairs 10000 100000
+"""
+import argparse
+import random
+import time
+
+from app.services.score_service import score_pairs, score_pairs_batch
+
+_JUNK = (
+    lambda p: p["liquidity"].update(usd=str(p["liquidity"]["usd"])),
+    lambda p: p["liquidity"].update(usd=None),
+    lambda p: p["liquidity"].update(usd="n/a"),
+    lambda p: p.update(liquidity=None),
+    lambda p: p.pop("volume"),
+    lambda p: p["volume"].update(m5=float("nan")),
+    lambda p: p["volume"].update(m5=True),
+    lambda p: p["priceChange"].update(m5=10**400),
+    lambda p: p["priceChange"].update(m5=[1]),
+    lambda p: p.update(priceChange="flat"),
+    lambda p: p.update(pairCreatedAt=str(p["pairCreatedAt"])),
+    lambda p: p.update(pairCreatedAt=0),
+    lambda p: p.update(pairCreatedAt=None),
+    lambda p: p.update(pairCreatedAt=float("nan")),
+    lambda p: p.update(pairCreatedAt=10**400),
+    lambda p: p.update(pairCreatedAt=int(p["pairCreatedAt"])),
+    lambda p: p.pop("baseToken"),
+    lambda p: p["baseToken"].pop("symbol"),
+)
+
+
+def _response(rnd: random.Random, n: int, now_ms: float, pass_share: float, junk_share: float) -> list:
+    pairs: list = []
+    for i in range(n):
+        fresh = rnd.random() < pass_share
+        p = {
+            "chainId": "solana",
+            "dexId": "raydium",
+            "pairAddress": f"Pair{i:06d}",
+            "baseToken": {"address": f"Mint{i:06d}", "name": f"Token {i}", "symbol": f"T{i}"},
+            "quoteToken": {"address": "So11111111111111111111111111111111111111112", "symbol": "SOL"},
+            "priceUsd": f"{rnd.uniform(0.0001, 2):.6f}",
+            "txns": {"m5": {"buys": rnd.randrange(50), "sells": rnd.randrange(50)}},
+            "liquidity": {"usd": rnd.uniform(800, 50_000) if fresh else rnd.uniform(0, 50_000)},
+            "volume": {"m5": rnd.uniform(20, 20_000) if fresh else rnd.uniform(0, 20_000), "h1": rnd.uniform(0, 9e4)},
+            "priceChange": {"m5": rnd.uniform(-10, 30) if fresh else rnd.uniform(-40, 30), "h1": rnd.uniform(-50, 80)},
+            "pairCreatedAt": now_ms - (rnd.uniform(0, 29_000) if fresh else rnd.uniform(0, 3_600_000)),
+        }
+        if rnd.random() < junk_share:
+            if rnd.random() < 0.05:
+                p = rnd.choice([None, "pair", [p], 7])
+            else:
+                rnd.choice(_JUNK)(p)
+        pairs.append(p)
+    return pairs
+
+
+def _time(fn, pairs: list, now_ms: float, repeat: int) -> tuple[float, list]:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        out = fn(pairs, now_ms)
+    return (time.perf_counter() - started) / repeat, out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pairs", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pass-share", type=float, default=0.05)
+    parser.add_argument("--junk-share", type=float, default=0.05)
+    parser.add_argument("--clean", action="store_true")
+    args = parser.parse_args()
+
+    now_ms = time.time() * 1000
+    for n in args.pairs:
+        pairs = _response(random.Random(n), n, now_ms, args.pass_share, 0.0 if args.clean else args.junk_share)
+        scalar_s, scalar = _time(score_pairs, pairs, now_ms, args.repeat)
+        batch_s, batch = _time(score_pairs_batch, pairs, now_ms, args.repeat)
+        assert batch == scalar, "outputs differ"
+        assert [type(v) for c in batch for v in c["metrics"].values()] == [
+            type(v) for c in scalar for v in c["metrics"].values()
+        ], "metric types differ"
+        print(
+            f"[bench] pairs={n:<7} candidates={len(batch):<5} score_pairs={scalar_s * 1000:7.1f}ms "
+            f"score_pairs_batch={batch_s * 1000:7.1f}ms ({scalar_s / batch_s:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
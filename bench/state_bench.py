@@ -0,0 +1,117 @@
+"""
+Micro-benchmark for the per-candidate state cost in state_service.
+
+Runs the same sequence of state calls that worker.scanner._process_candidate
+makes for a near_pass hit against a throwaway database: with a fresh sqlite3
+connection per call (the old behaviour), with the reused per-thread
+connection, and as a single TokenStateTxn per candidate. Those three runs are
+write-through; the next one uses the write-behind cache with batched flushes.
+The same TokenStateTxn loop is then run against the in-memory backend and the
+Redis backend (a real server via --redis-url, otherwise the local RESP
+stand-in from bench.resp_server).
+
+    python -m bench.state_bench --candidates 5000 --tokens 500
+    python -m bench.state_bench --redis-url redis://localhost:6379/0
+"""
+import argparse
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+import app.services.state_service as state
+from app.services.state_backends import MemoryStateBackend, RedisStateBackend, SqliteStateBackend
+from bench.resp_server import RespServer
+
+
+def _process(token: str, metrics: dict) -> None:
+    state.upsert_seen(token, metrics)
+    if state.maybe_auto_mute(token, 15, 4, 60):
+        return
+    if state.pass_escalation_check(token, metrics, 3, 10, 15000, 8000):
+        state.update_severity(token, "pass")
+        state.record_alert(token, "pass")
+        return
+    state.update_severity(token, "near_pass")
+    if state.allow_alert(token, 900):
+        state.record_alert(token, "near_pass")
+    else:
+        state.record_repeat(token, "near_pass")
+
+
+def _process_txn(token: str, metrics: dict) -> None:
+    with state.TokenStateTxn(token) as st:
+        st.upsert_seen(metrics)
+        if st.maybe_auto_mute(15, 4, 60):
+            return
+        if st.pass_escalation_check(metrics, 3, 10, 15000, 8000):
+            st.update_severity("pass")
+            st.record_alert("pass")
+            return
+        st.update_severity("near_pass")
+        if st.allow_alert(900):
+            st.record_alert("near_pass")
+        else:
+            st.record_repeat("near_pass")
+
+
+def _run(label: str, candidates: int, tokens: int, process=_process) -> float:
+    metrics = {"liquidity": 20000.0, "volume_5m": 9000.0, "price_change_5m": 4.2, "age_minutes": 0.3}
+    started = time.perf_counter()
+    for i in range(candidates):
+        process(f"{label}-{i % tokens}", metrics)
+    elapsed = time.perf_counter() - started
+    per_candidate_us = elapsed / candidates * 1e6
+    print(f"[bench] {label:<8} candidates={candidates} total={elapsed:.3f}s per_candidate={per_candidate_us:.1f}us")
+    return per_candidate_us
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--candidates", type=int, default=5000)
+    parser.add_argument("--tokens", type=int, default=500)
+    parser.add_argument("--redis-url", default="", help="default: local RESP stand-in")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite_backend = SqliteStateBackend(Path(tmp) / "engine.db")
+        state.set_backend(sqlite_backend)
+        state.init()
+
+        flush_interval = state.FLUSH_INTERVAL_MS
+        state.FLUSH_INTERVAL_MS = 0
+        sqlite_backend._connect = lambda: sqlite3.connect(sqlite_backend.path)
+        before = _run("fresh", args.candidates, args.tokens)
+        del sqlite_backend._connect
+        reused = _run("reused", args.candidates, args.tokens)
+        txn = _run("txn", args.candidates, args.tokens, _process_txn)
+        state.FLUSH_INTERVAL_MS = flush_interval
+        cached = _run("cached", args.candidates, args.tokens, _process_txn)
+        state.shutdown()
+        state.close()
+
+    state.set_backend(MemoryStateBackend())
+    state.init()
+    memory = _run("memory", args.candidates, args.tokens, _process_txn)
+
+    server = None
+    redis_url = args.redis_url
+    if not redis_url:
+        server = RespServer().start()
+        redis_url = server.url
+    state.set_backend(RedisStateBackend(redis_url, prefix="bench:"))
+    state.init()
+    redis = _run("redis", args.candidates, args.tokens, _process_txn)
+    state.close()
+    if server is not None:
+        server.shutdown()
+
+    print(
+        f"[bench] speedup reused={before / reused:.1f}x "
+        f"txn={before / txn:.1f}x cached={before / cached:.1f}x "
+        f"memory={before / memory:.1f}x redis={before / redis:.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
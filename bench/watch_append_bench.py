@@ -0,0 +1,80 @@
+"""
+Benchmark the producer side of append_watch_event: what the /score route and
+stage transitions wait for per event.
+
+Runs the synchronous open/write/close path and the background group-commit
+writer under each fsync policy, then checks every line made it to the log.
+With --store binary the same runs go to the binary event store (see
+watch_binlog), whose dictionary grows with every one of --tokens first seen.
+
+    python -m bench.watch_append_bench --events 20000
+    python -m bench.watch_append_bench --store binary --tokens 20000
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import app.services.watch_store as watch_store
+from app.config import settings
+from app.services.watch_binlog import BinaryEventStore
+
+
+def _run(label: str, path: Path, events: int, tokens: int) -> float:
+    watch_store.WATCH_LOG_PATH = str(path)
+    settings.WATCH_BIN_PATH = str(path)
+    waits = []
+    started = time.perf_counter()
+    for i in range(events):
+        t = time.perf_counter()
+        watch_store.append_watch_event(
+            {"token": f"T{i % tokens}", "status": "WATCH", "score": 61, "reasons": ["liq_ok", "vol_spike"]}
+        )
+        waits.append(time.perf_counter() - t)
+    produced = time.perf_counter() - started
+    watch_store.flush_watch_log()
+    total = time.perf_counter() - started
+
+    if settings.WATCH_STORE == "binary":
+        lines = sum(1 for _ in BinaryEventStore(str(path)).iter_events())
+    else:
+        with open(path, "rb") as f:
+            lines = sum(1 for _ in f)
+    assert lines == events, f"{label}: {lines} lines for {events} events"
+
+    waits.sort()
+    p50 = waits[len(waits) // 2] * 1e6
+    p99 = waits[int(len(waits) * 0.99)] * 1e6
+    writer = watch_store._BIN_WRITER if settings.WATCH_STORE == "binary" else watch_store._WRITER
+    stats = writer.stats if settings.WATCH_ASYNC_WRITES else {}
+    print(
+        f"[bench] {label:<20} producer={produced:.3f}s p50={p50:7.1f}us p99={p99:8.1f}us "
+        f"on_disk={total:.3f}s batches={stats.get('batches', events)} fsyncs={stats.get('fsyncs', 0)}"
+    )
+    return p50
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--tokens", type=int, default=500)
+    parser.add_argument("--store", choices=("jsonl", "binary"), default="jsonl")
+    args = parser.parse_args()
+    settings.WATCH_STORE = args.store
+
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.WATCH_ASYNC_WRITES = False
+        sync = _run("sync", Path(tmp) / "sync.log", args.events, args.tokens)
+
+        settings.WATCH_ASYNC_WRITES = True
+        results = {}
+        for policy in ("never", "interval", "batch"):
+            settings.WATCH_FSYNC = policy
+            results[policy] = _run(f"async fsync={policy}", Path(tmp) / f"{policy}.log", args.events, args.tokens)
+        watch_store.shutdown()
+
+    print(" ".join(["[bench] producer p50 speedup"] + [f"{p}={sync / v:.0f}x" for p, v in results.items()]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Benchmark the binary event store against the JSONL watch log.
+
+Writes synthetic /score WATCH events and stage transitions (plus a few odd
+records: "Z" and naive timestamps, a huge int, a nested object, a broken
+line) over --days ending now, converts the log with convert_jsonl and checks
+every event decodes back identical, key order included. Then compares disk
+footprint, a full replay pass, the 24h window and the /watch/summary counts.
+
+    python -m bench.watch_binlog_bench --events 500000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import app.services.watch_store as watch_store
+from app.config import settings
+from app.services.watch_binlog import BinaryEventStore, convert_jsonl
+
+NOW = datetime.now(timezone.utc)
+REASONS = ["liq_ok", "vol_spike", "socials", "fresh_pool", "whale_buy", "lp_locked", "dev_sold"]
+STAGES = [None, "watch", "near_pass", "pass", "demoted"]
+
+
+class _FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return NOW
+
+
+def _event(rnd: random.Random, ts: datetime) -> dict:
+    token = f"T{rnd.randrange(3000)}"
+    if rnd.random() < 0.3:
+        prev = rnd.choice(STAGES)
+        entered = ts - timedelta(seconds=rnd.randrange(0, 900)) if prev else None
+        return {
+            "event": "stage_transition",
+            "token": token,
+            "chain": "sol",
+            "from_stage": prev,
+            "to_stage": rnd.choice(STAGES[1:]),
+            "score": rnd.randrange(0, 100),
+            "reasons": rnd.sample(REASONS, rnd.randrange(0, 4)),
+            "entered_at": entered.isoformat() if entered else None,
+            "exited_at": ts.isoformat(),
+            "duration_seconds": int((ts - entered).total_seconds()) if entered else None,
+            "timestamp": ts.isoformat(),
+        }
+    return {
+        "token": token,
+        "chain": "sol",
+        "status": "WATCH",
+        "score": rnd.choice([rnd.randrange(40, 90), round(rnd.uniform(40, 90), 2)]),
+        "reasons": rnd.sample(REASONS, rnd.randrange(0, 4)),
+        "rug_risk": rnd.choice(["low", "medium", None]),
+        "rug_flags": rnd.sample(["mint_auth", "freeze_auth", "top10"], rnd.randrange(0, 2)),
+        "liquidity": rnd.choice([None, round(rnd.uniform(1e3, 1e6), 2), rnd.randrange(1000, 90000)]),
+        "volume_delta": rnd.choice([None, round(rnd.uniform(-1, 5), 4)]),
+        "social_velocity": rnd.choice([None, rnd.randrange(0, 50)]),
+        "timestamp": ts.isoformat(),
+    }
+
+
+def _write_log(path: Path, events: int, days: int) -> None:
+    rnd = random.Random(13)
+    start = NOW - timedelta(days=days)
+    step = (NOW - start) / events
+    odd = [
+        {"token": "ZULU", "reasons": ["liq_ok"], "timestamp": (NOW - timedelta(minutes=5)).isoformat().replace("+00:00", "Z")},
+        {"token": "NAIVE", "reasons": [], "timestamp": (NOW - timedelta(minutes=5)).replace(tzinfo=None).isoformat()},
+        {"token": "BIG", "score": 10**30, "meta": {"a": [1, 2.5, None]}, "reasons": ["x"], "timestamp": NOW.isoformat()},
+        {"token": "EXACT", "reasons": ["liq_ok"], "timestamp": (NOW - timedelta(hours=2)).replace(microsecond=0).isoformat()},
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(events):
+            ts = start + step * i + timedelta(seconds=rnd.uniform(-5, 5))
+            f.write(json.dumps(_event(rnd, ts)) + "\n")
+        for e in odd:
+            f.write(json.dumps(e) + "\n")
+        f.write('{"token": "BROKEN", "timest\n')
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    out = fn()
+    return (time.perf_counter() - started) * 1000, out
+
+
+def _replay_jsonl(path: Path) -> list[dict]:
+    events = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+    return events
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=500_000)
+    parser.add_argument("--days", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = Path(tmp) / "watch.log"
+        binary = Path(tmp) / "watch.bin"
+        _write_log(log, args.events, args.days)
+
+        ms, (written, dropped) = _timed(lambda: convert_jsonl(str(log), str(binary)))
+        print(f"[bench] converted {written} events ({dropped} dropped) in {ms / 1000:.1f}s")
+
+        json_ms, expected = _timed(lambda: _replay_jsonl(log))
+        bin_ms, got = _timed(lambda: list(BinaryEventStore(str(binary)).iter_events()))
+        assert [json.dumps(e) for e in got] == [json.dumps(e) for e in expected], "replay differs"
+
+        json_mb = log.stat().st_size / 1e6
+        bin_mb = (binary.stat().st_size + os.path.getsize(f"{binary}.dict")) / 1e6
+        print(f"[bench] disk jsonl={json_mb:.1f}MB binary={bin_mb:.1f}MB ({json_mb / bin_mb:.1f}x smaller)")
+        print(f"[bench] replay all  jsonl={json_ms:8.1f}ms binary={bin_ms:8.1f}ms ({json_ms / bin_ms:.1f}x)")
+
+        watch_store.WATCH_LOG_PATH = str(log)
+        watch_store.datetime = _FrozenDatetime
+        settings.WATCH_BIN_PATH = str(binary)
+        settings.WATCH_SEGMENT_SECONDS = 0
+        settings.WATCH_SEGMENT_MAX_MB = 0
+        for hours in (1, 24):
+            settings.WATCH_STORE = "jsonl"
+            watch_store.load_recent_watch_events(hours)  # index built outside the timing
+            json_ms, expected = _timed(lambda: watch_store.load_recent_watch_events(hours))
+            settings.WATCH_STORE = "binary"
+            watch_store.load_recent_watch_events(hours)  # seek checkpoints likewise
+            bin_ms, got = _timed(lambda: watch_store.load_recent_watch_events(hours))
+            assert [json.dumps(e) for e in got] == [json.dumps(e) for e in expected], f"{hours}h differs"
+            print(
+                f"[bench] {hours:>3}h window events={len(got):<7} jsonl={json_ms:8.1f}ms "
+                f"binary={bin_ms:8.1f}ms ({json_ms / bin_ms:.1f}x)"
+            )
+
+        for hours in (24, args.days * 24):
+            settings.WATCH_STORE = "jsonl"
+            scan_ms, events = _timed(lambda: watch_store.load_recent_watch_events(hours))
+            tokens = Counter(e["token"] for e in events)
+            reasons = Counter(r for e in events for r in e.get("reasons", []))
+            watch_store.watch_window_counts(hours)  # aggregates built outside the timing
+            agg_ms, _ = _timed(lambda: watch_store.watch_window_counts(hours))
+            settings.WATCH_STORE = "binary"
+            bin_ms, counts = _timed(lambda: watch_store.watch_window_counts(hours))
+            assert [list(c.items()) for c in counts] == [list(tokens.items()), list(reasons.items())]
+            print(
+                f"[bench] {hours:>3}h counts events={len(events):<7} jsonl scan={scan_ms:8.1f}ms "
+                f"jsonl aggregates={agg_ms:6.1f}ms binary={bin_ms:6.1f}ms ({scan_ms / bin_ms:.1f}x vs scan)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark load_recent_watch_events on a large watch log.
+
+Writes a synthetic JSONL log spread over --days ending now, then times the
+old line-by-line full scan against the mmap reader with the sparse index:
+once cold (index built from scratch) and then warm for 1h and 24h windows.
+Both readers must return the same events.
+
+    python -m bench.watch_log_bench --events 2000000
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import app.services.watch_store as watch_store
+
+NOW = datetime.now(timezone.utc)
+
+
+class _FrozenDatetime(datetime):
+    # Both readers must see the same cutoff for their results to compare.
+    @classmethod
+    def now(cls, tz=None):
+        return NOW
+
+
+def _full_scan(path: Path, hours: int) -> list[dict]:
+    # load_recent_watch_events before the index.
+    events = []
+    cutoff = NOW - timedelta(hours=hours)
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+                ts = datetime.fromisoformat(event["timestamp"])
+                if ts >= cutoff:
+                    events.append(event)
+            except Exception:
+                continue
+    return events
+
+
+def _write_log(path: Path, events: int, days: int) -> None:
+    rnd = random.Random(7)
+    start = NOW - timedelta(days=days)
+    step = (NOW - start) / events
+    reasons = ["liq_ok", "vol_spike", "socials", "fresh_pool", "whale_buy"]
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(events):
+            # Writers interleave, so timestamps wobble by a few seconds.
+            ts = start + step * i + timedelta(seconds=rnd.uniform(-3, 3))
+            f.write(
+                json.dumps(
+                    {
+                        "token": f"T{rnd.randrange(5000)}",
+                        "chain": "sol",
+                        "status": "WATCH",
+                        "score": rnd.randrange(40, 90),
+                        "reasons": rnd.sample(reasons, 2),
+                        "timestamp": ts.isoformat(),
+                    }
+                )
+                + "\n"
+            )
+
+
+def _time(label: str, fn, repeat: int) -> tuple[float, list]:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        out = fn()
+    ms = (time.perf_counter() - started) / repeat * 1000
+    print(f"[bench] {label:<18} events={len(out):<8} {ms:10.2f}ms")
+    return ms, out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "watch.log"
+        started = time.perf_counter()
+        _write_log(path, args.events, args.days)
+        mb = path.stat().st_size / 1e6
+        print(f"[bench] wrote {args.events} events ({mb:.0f}MB) in {time.perf_counter() - started:.1f}s")
+
+        watch_store.WATCH_LOG_PATH = str(path)
+        watch_store.datetime = _FrozenDatetime
+        old_1h, old = _time("full scan 1h", lambda: _full_scan(path, 1), 1)
+        _time("index build", lambda: watch_store.load_recent_watch_events(1), 1)
+        new_1h, new = _time("indexed 1h", lambda: watch_store.load_recent_watch_events(1), args.repeat)
+        assert new == old, "indexed reader returned different events"
+
+        old_24h, old = _time("full scan 24h", lambda: _full_scan(path, 24), 1)
+        new_24h, new = _time("indexed 24h", lambda: watch_store.load_recent_watch_events(24), args.repeat)
+        assert new == old, "indexed reader returned different events"
+
+    print(f"[bench] speedup 1h={old_1h / new_1h:.0f}x 24h={old_24h / new_24h:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Benchmark the segmented watch log against one flat JSONL file.
+
+Writes the same synthetic events (over --days ending now) to a flat log and
+through the segmented log, rotating hourly and gzipping closed segments, then
+compares disk use, load_recent_watch_events against the old whole-file scan
+for 1h / 24h / 7d windows (same events, same order), and the /watch/summary
+aggregates.
+Finally applies --retention-hours and checks windows inside it still match.
+
+    python -m bench.watch_segments_bench --events 500000 --days 14
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import app.services.watch_store as watch_store
+from app.config import settings
+
+NOW = datetime.now(timezone.utc)
+REASONS = ["liq_ok", "vol_spike", "socials", "fresh_pool", "whale_buy", "lp_locked", "dev_sold"]
+
+
+class _FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return NOW
+
+
+def _flat_events(path: Path, hours: int) -> list[dict]:
+    # load_recent_watch_events before segments and the index.
+    cutoff = NOW - timedelta(hours=hours)
+    events = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+                # Same datetime class the store sees, so timings compare.
+                if _FrozenDatetime.fromisoformat(event["timestamp"]) >= cutoff:
+                    events.append(event)
+            except Exception:
+                continue
+    return events
+
+
+def _disk(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    return sum(p.stat().st_size for p in path.iterdir())
+
+
+def _compare(flat: Path, hours: int) -> None:
+    started = time.perf_counter()
+    expected = _flat_events(flat, hours)
+    flat_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    got = watch_store.load_recent_watch_events(hours)
+    seg_ms = (time.perf_counter() - started) * 1000
+    assert got == expected, f"events differ for hours={hours}"
+    tokens = Counter(e["token"] for e in expected)
+    reasons = Counter(r for e in expected for r in e.get("reasons", []))
+    counts = watch_store.watch_window_counts(hours)
+    assert counts is not None and [list(c.items()) for c in counts] == [
+        list(tokens.items()),
+        list(reasons.items()),
+    ], f"aggregates differ for hours={hours}"
+    print(
+        f"[bench] {hours:>4}h events={len(got):<8} flat={flat_ms:9.2f}ms "
+        f"segments={seg_ms:8.2f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=500_000)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--retention-hours", type=int, default=72)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        flat = Path(tmp) / "flat.log"
+        path = Path(tmp) / "watch.log"
+        watch_store.WATCH_LOG_PATH = str(path)
+        watch_store.datetime = _FrozenDatetime
+        settings.WATCH_ASYNC_WRITES = False
+        settings.WATCH_RETENTION_HOURS = 0
+        segments = watch_store._get_segments()
+        segments.grace_seconds = 0
+
+        rnd = random.Random(11)
+        start = NOW - timedelta(days=args.days)
+        step = (NOW - start) / args.events
+        clock = start.timestamp()
+        started = time.perf_counter()
+        with open(flat, "w", encoding="utf-8") as f, open(path, "a", encoding="utf-8") as active:
+            for i in range(args.events):
+                ts = start + step * i + timedelta(seconds=rnd.uniform(-5, 5))
+                line = json.dumps(
+                    {
+                        "token": f"T{rnd.randrange(3000)}",
+                        "status": "WATCH",
+                        "score": rnd.randrange(40, 90),
+                        "reasons": rnd.sample(REASONS, rnd.randrange(0, 4)),
+                        "timestamp": ts.isoformat(),
+                    }
+                ) + "\n"
+                f.write(line)
+                clock = max(clock, ts.timestamp())
+                if segments.maybe_rotate(now=clock):
+                    active.close()
+                    active = open(path, "a", encoding="utf-8")
+                active.write(line)
+                active.flush()
+            active.close()
+        segments.maintain(now=NOW.timestamp())
+        print(f"[bench] wrote {args.events} events twice in {time.perf_counter() - started:.1f}s")
+
+        manifest = segments.manifest()
+        seg_disk = _disk(path) + _disk(Path(segments.dir)) + _disk(Path(segments.manifest_path))
+        print(
+            f"[bench] flat={_disk(flat) / 1e6:.1f}MB segmented={seg_disk / 1e6:.1f}MB "
+            f"({len(manifest['segments'])} gzipped segments + active)"
+        )
+
+        for h in (1, 24, 168):
+            _compare(flat, h)
+
+        segments.retention_hours = args.retention_hours
+        segments.maintain(now=NOW.timestamp())
+        kept = segments.manifest()["segments"]
+        seg_disk = _disk(path) + _disk(Path(segments.dir)) + _disk(Path(segments.manifest_path))
+        print(
+            f"[bench] retention={args.retention_hours}h kept {len(kept)} segments, "
+            f"segmented={seg_disk / 1e6:.1f}MB"
+        )
+        for h in (1, 24, args.retention_hours - 1):
+            _compare(flat, h)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark build_watch_summary: rebuilding Counters from every event in the
+window against the rolling per-minute aggregates.
+
+Writes a synthetic watch log over --days ending now (timestamps slightly out
+of order, as with several writers), answers 1h / 24h / 7d windows both ways
+and checks the JSON is byte-identical. Then appends events through
+append_watch_event (the aggregate path) and straight to the file (another
+process) and checks again.
+
+    python -m bench.watch_summary_bench --events 1000000
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import app.services.watch_store as watch_store
+from app.services.watch_summary import build_watch_summary
+
+NOW = datetime.now(timezone.utc)
+REASONS = ["liq_ok", "vol_spike", "socials", "fresh_pool", "whale_buy", "lp_locked", "dev_sold"]
+
+
+class _FrozenDatetime(datetime):
+    # Both paths must see the same cutoff for their output to compare.
+    @classmethod
+    def now(cls, tz=None):
+        return NOW
+
+
+def _full_summary(hours: int) -> dict:
+    # build_watch_summary before the aggregates.
+    events = watch_store.load_recent_watch_events(hours)
+    if not events:
+        return {
+            "window_hours": hours,
+            "total_watch_events": 0,
+            "unique_tokens": 0,
+            "top_tokens": [],
+            "reason_breakdown": {},
+        }
+    token_counts = Counter(e["token"] for e in events)
+    reason_counts = Counter()
+    for e in events:
+        for r in e.get("reasons", []):
+            reason_counts[r] += 1
+    return {
+        "window_hours": hours,
+        "total_watch_events": len(events),
+        "unique_tokens": len(token_counts),
+        "top_tokens": [{"token": t, "count": c} for t, c in token_counts.most_common(10)],
+        "reason_breakdown": dict(reason_counts),
+    }
+
+
+def _event(rnd: random.Random, ts: datetime) -> dict:
+    return {
+        "token": f"T{rnd.randrange(3000)}",
+        "status": "WATCH",
+        "score": rnd.randrange(40, 90),
+        "reasons": rnd.sample(REASONS, rnd.randrange(0, 4)),
+        "timestamp": ts.isoformat(),
+    }
+
+
+def _write_log(path: Path, events: int, days: int) -> None:
+    rnd = random.Random(11)
+    start = NOW - timedelta(days=days)
+    step = (NOW - start) / events
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(events):
+            ts = start + step * i + timedelta(seconds=rnd.uniform(-5, 5))
+            f.write(json.dumps(_event(rnd, ts)) + "\n")
+
+
+def _time(fn, repeat: int) -> tuple[float, dict]:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        out = fn()
+    return (time.perf_counter() - started) / repeat * 1000, out
+
+
+def _compare(hours: int, repeat: int) -> tuple[float, float]:
+    full_ms, full = _time(lambda: _full_summary(hours), 1)
+    agg_ms, agg = _time(lambda: build_watch_summary(hours), repeat)
+    assert json.dumps(agg) == json.dumps(full), f"summary differs for hours={hours}"
+    print(
+        f"[bench] {hours:>4}h events={full['total_watch_events']:<8} "
+        f"scan={full_ms:9.2f}ms aggregates={agg_ms:8.2f}ms"
+    )
+    return full_ms, agg_ms
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "watch.log"
+        started = time.perf_counter()
+        _write_log(path, args.events, args.days)
+        print(f"[bench] wrote {args.events} events in {time.perf_counter() - started:.1f}s")
+
+        watch_store.WATCH_LOG_PATH = str(path)
+        watch_store.datetime = _FrozenDatetime
+
+        started = time.perf_counter()
+        build_watch_summary(1)
+        print(f"[bench] aggregates built in {time.perf_counter() - started:.1f}s")
+
+        results = [_compare(h, args.repeat) for h in (1, 24, 168)]
+
+        rnd = random.Random(12)
+        for i in range(2000):
+            ts = NOW - timedelta(seconds=rnd.uniform(0, 7200))
+            if i % 5:
+                watch_store.append_watch_event(_event(rnd, ts))
+            else:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(_event(rnd, ts)) + "\n")
+        print("[bench] appended 2000 events (1 in 5 by another writer)")
+        for h in (1, 24):
+            _compare(h, args.repeat)
+
+    speedups = " ".join(f"{h}h={s / a:.0f}x" for h, (s, a) in zip((1, 24, 168), results))
+    print(f"[bench] speedup {speedups}")
+
+
+if __name__ == "__main__":
+    main()
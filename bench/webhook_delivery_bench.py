@@ -0,0 +1,112 @@
+"""
+Benchmark n8n transition webhook delivery: inline requests.post (as
+stage_transitions used to) against the WebhookDelivery queue.
+
+Starts a local HTTP endpoint that takes --delay-ms per request and answers
+500 to a --fail-rate share of attempts (Retry-After: 0), plus a URL that
+always 404s. Sends --events transition-shaped payloads both ways and reports
+how long the caller was blocked, what arrived, and the queue's retries,
+dead letters and delivery latency.
+
+    python -m bench.webhook_delivery_bench --events 500 --delay-ms 50 --fail-rate 0.2
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from app.services.webhook_delivery import WebhookDelivery
+
+
+def _server(delay: float, fail_rate: float, seen: dict):
+    rnd = random.Random(19)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(delay)
+            with lock:
+                fail = rnd.random() < fail_rate
+                if self.path == "/ok" and not fail:
+                    seen[body["id"]] = seen.get(body["id"], 0) + 1
+            status = 404 if self.path != "/ok" else (500 if fail else 200)
+            self.send_response(status)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--delay-ms", type=float, default=50)
+    parser.add_argument("--fail-rate", type=float, default=0.2)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    events = [{"event": "stage_transition", "id": i, "token": f"T{i}", "to_stage": "near_pass"} for i in range(args.events)]
+
+    seen: dict = {}
+    server = _server(args.delay_ms / 1000, args.fail_rate, seen)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    started = time.perf_counter()
+    for e in events:
+        try:
+            requests.post(f"{base}/ok", json=e, timeout=5)
+        except Exception:
+            pass
+    inline_s = time.perf_counter() - started
+    inline_ok = len(seen)
+    print(
+        f"[bench] inline  caller blocked {inline_s * 1000 / args.events:7.2f}ms/event "
+        f"({inline_s:.1f}s total) delivered={inline_ok}/{args.events} (failures dropped)"
+    )
+
+    seen.clear()
+    with tempfile.TemporaryDirectory() as tmp:
+        dead_path = os.path.join(tmp, "dead.jsonl")
+        delivery = WebhookDelivery(
+            workers=args.workers, backoff_seconds=0.05, max_backoff_seconds=0.5, dead_letter_path=dead_path
+        )
+        started = time.perf_counter()
+        for e in events:
+            delivery.submit(f"{base}/ok", e)
+        delivery.submit(f"{base}/missing", {"id": -1})
+        submit_s = time.perf_counter() - started
+        delivery.flush(120)
+        drain_s = time.perf_counter() - started
+        stats = delivery.stats()
+        delivery.close()
+        with open(dead_path) as f:
+            dead = [json.loads(line) for line in f]
+
+    assert all(n == 1 for n in seen.values()), "an event was delivered twice"
+    assert len(seen) + len(dead) == args.events + 1, "an event was lost"
+    print(
+        f"[bench] queued  caller blocked {submit_s * 1e6 / (args.events + 1):7.1f}us/event "
+        f"drained in {drain_s:.1f}s delivered={len(seen)}/{args.events} retried={stats['retried']} "
+        f"dead={len(dead)} (incl. the 404) latency p50={stats['latency_p50_ms']:.0f}ms "
+        f"p95={stats['latency_p95_ms']:.0f}ms max={stats['latency_max_ms']:.0f}ms"
+    )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
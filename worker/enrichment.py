@@ -0,0 +1,167 @@
+"""
+Follow-up Dexscreener lookups for mints first seen on the Helius WS.
+
+A WS mint enters the scanner with zeroed metrics because Dexscreener has not
+indexed it yet. schedule() queues it for lookups at ENRICH_SCHEDULE_SECONDS
+after discovery (20s, 1m, 3m by default). run() wakes when the next lookup
+is due, takes every mint due by then (and, to fill the request, mints due
+within ENRICH_GATHER_SECONDS), and looks them up ENRICH_BATCH_SIZE at a time
+through the multi-address tokens endpoint, with at most ENRICH_CONCURRENCY
+requests in flight. Each mint's most liquid pair goes back through
+scanner.process_enriched_candidate, so its state, escalation and alerts see
+real numbers.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+
+from app.services.dex_service import DEX_TOKENS_MAX, fetch_token_pairs
+from app.services.score_service import pair_candidate
+
+ENRICH_SCHEDULE_SECONDS = tuple(
+    float(s) for s in os.getenv("ENRICH_SCHEDULE_SECONDS", "20,60,180").split(",") if s.strip()
+)
+ENRICH_BATCH_SIZE = min(int(os.getenv("ENRICH_BATCH_SIZE", str(DEX_TOKENS_MAX))), DEX_TOKENS_MAX)
+ENRICH_CONCURRENCY = int(os.getenv("ENRICH_CONCURRENCY", "2"))
+ENRICH_GATHER_SECONDS = float(os.getenv("ENRICH_GATHER_SECONDS", "2"))
+ENRICH_MAX_PENDING = int(os.getenv("ENRICH_MAX_PENDING", "10000"))
+
+ENRICH_STATS = {"scheduled": 0, "dropped": 0, "lookups": 0, "requests": 0, "found": 0, "errors": 0}
+
+
+def best_pairs(pairs: list[dict], mints: set[str]) -> dict[str, dict]:
+    """Per mint in `mints`, its pair (as base token) with the most liquidity."""
+    best: dict[str, tuple[float, dict]] = {}
+    for p in pairs:
+        if not isinstance(p, dict):
+            continue
+        mint = (p.get("baseToken") or {}).get("address")
+        if mint not in mints:
+            continue
+        try:
+            liq = float((p.get("liquidity") or {}).get("usd") or 0)
+        except (TypeError, ValueError):
+            liq = 0.0
+        if mint not in best or liq > best[mint][0]:
+            best[mint] = (liq, p)
+    return {mint: p for mint, (_, p) in best.items()}
+
+
+class EnrichmentScheduler:
+    """
+    Inputs:
+    - process: called (in a worker thread) with each enriched candidate
+    - schedule_seconds: lookup offsets from discovery
+    - fetch: blocking lookup of up to batch_size addresses -> pairs
+
+    Invariants:
+    - a mint is in at most one pending lookup at a time; its next step is
+      queued only once the current one has run
+    - at most max_pending mints are followed; newer ones beyond that are
+      dropped (and counted)
+    """
+
+    def __init__(
+        self,
+        process,
+        schedule_seconds: tuple = ENRICH_SCHEDULE_SECONDS,
+        batch_size: int = ENRICH_BATCH_SIZE,
+        concurrency: int = ENRICH_CONCURRENCY,
+        gather_seconds: float = ENRICH_GATHER_SECONDS,
+        max_pending: int = ENRICH_MAX_PENDING,
+        fetch=fetch_token_pairs,
+    ):
+        self.process = process
+        self.schedule_seconds = tuple(sorted(schedule_seconds))
+        self.batch_size = max(1, min(batch_size, DEX_TOKENS_MAX))
+        self.gather_seconds = gather_seconds
+        self.max_pending = max_pending
+        self.fetch = fetch
+        # (due monotonic, seq, mint, discovered monotonic, step)
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._pending: set[str] = set()
+        self._wake: asyncio.Event | None = None
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+
+    def _push(self, mint: str, discovered: float, step: int) -> None:
+        due = discovered + self.schedule_seconds[step]
+        heapq.heappush(self._heap, (due, next(self._seq), mint, discovered, step))
+
+    def schedule(self, mint: str) -> bool:
+        """Follow a newly discovered mint; False if it is already followed or the queue is full."""
+        if not mint or mint in self._pending or not self.schedule_seconds:
+            return False
+        if len(self._pending) >= self.max_pending:
+            ENRICH_STATS["dropped"] += 1
+            return False
+        self._pending.add(mint)
+        self._push(mint, time.monotonic(), 0)
+        ENRICH_STATS["scheduled"] += 1
+        if self._wake is not None:
+            self._wake.set()
+        return True
+
+    def _take_due(self, now: float) -> list[tuple]:
+        """Entries due now, topped up with ones due soon to fill the last request."""
+        taken = []
+        while self._heap and self._heap[0][0] <= now:
+            taken.append(heapq.heappop(self._heap))
+        while self._heap and len(taken) % self.batch_size and self._heap[0][0] <= now + self.gather_seconds:
+            taken.append(heapq.heappop(self._heap))
+        return taken
+
+    async def _lookup(self, entries: list[tuple]) -> None:
+        mints = [e[2] for e in entries]
+        async with self._slots:
+            started = time.perf_counter()
+            try:
+                pairs = await asyncio.to_thread(self.fetch, mints)
+            except Exception as e:
+                pairs = None
+                ENRICH_STATS["errors"] += 1
+                print(f"[enrich] lookup of {len(mints)} mints failed: {e}", flush=True)
+            ENRICH_STATS["requests"] += 1
+            ENRICH_STATS["lookups"] += len(mints)
+
+        found = best_pairs(pairs or [], set(mints))
+        ENRICH_STATS["found"] += len(found)
+        print(
+            f"[enrich] looked up {len(mints)} mints in {(time.perf_counter() - started) * 1000:.0f}ms, "
+            f"{len(found)} listed",
+            flush=True,
+        )
+        now_ms = time.time() * 1000
+        for mint, pair in found.items():
+            candidate = pair_candidate(pair, "helius_enriched", now_ms)
+            if candidate is None:
+                continue
+            try:
+                await asyncio.to_thread(self.process, candidate)
+            except Exception as e:
+                print(f"[enrich] processing {mint} failed: {e}", flush=True)
+
+        for _, _, mint, discovered, step in entries:
+            if step + 1 < len(self.schedule_seconds):
+                self._push(mint, discovered, step + 1)
+            else:
+                self._pending.discard(mint)
+        self._wake.set()
+
+    async def run(self) -> None:
+        self._wake = asyncio.Event()
+        lookups: set[asyncio.Task] = set()
+        while True:
+            self._wake.clear()
+            entries = self._take_due(time.monotonic())
+            for i in range(0, len(entries), self.batch_size):
+                task = asyncio.create_task(self._lookup(entries[i : i + self.batch_size]))
+                lookups.add(task)
+                task.add_done_callback(lookups.discard)
+            timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -1,14 +1,10 @@
 import argparse
-import json
-import sqlite3
 import time
 from datetime import datetime, timezone
-from pathlib import Path
 
+import app.services.state_service as state
 import worker.scanner as scanner
-
-
-DB_PATH = Path("state/engine.db")
+from app.services.state_backends import MemoryStateBackend
 
 
 def _parse_from(value: str) -> int:
@@ -26,29 +22,24 @@ def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("--from", dest="from_ts", required=True)
     parser.add_argument("--sleep", type=float, default=0.0)
+    parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help="apply replayed decisions to a scratch in-memory state instead of the live store",
+    )
     args = parser.parse_args()
 
     start_ts = _parse_from(args.from_ts)
-    if not DB_PATH.exists():
-        raise SystemExit("state/engine.db not found")
-
-    with sqlite3.connect(DB_PATH) as c:
-        rows = c.execute(
-            """
-            SELECT token, last_metrics, last_seen
-            FROM token_state
-            WHERE last_seen >= ?
-            ORDER BY last_seen ASC
-        """,
-            (start_ts,),
-        ).fetchall()
+    if state.BACKEND == "sqlite" and not state.DB_PATH.exists():
+        raise SystemExit(f"{state.DB_PATH} not found")
 
-    for token, last_metrics, last_seen in rows:
-        try:
-            metrics = json.loads(last_metrics) if last_metrics else {}
-        except Exception:
-            metrics = {}
+    state.init()
+    rows = state.seen_since(start_ts)
+    if args.in_memory:
+        state.set_backend(MemoryStateBackend())
+        state.init()
 
+    for token, metrics, last_seen in rows:
         candidate = {
             "token": token,
             "symbol": "REPLAY",
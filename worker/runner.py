@@ -1,9 +1,13 @@
 import asyncio
 import os
 
+from worker.enrichment import EnrichmentScheduler
 from worker.helius_listener import listen
 import worker.scanner as scanner
 
+# WS mints get real metrics from follow-up Dexscreener lookups.
+ENRICHMENT = EnrichmentScheduler(scanner.process_enriched_candidate)
+
 
 def process_early_candidate(event: dict) -> None:
     """
@@ -27,7 +31,11 @@ async def handle_new_pool(event: dict) -> None:
         "signature": event.get("signature"),
     }
 
-    scanner.process_early_candidate(candidate)
+    # Off the event loop: the candidate does HTTP calls and state work, and
+    # its state writes queue behind the poll loop's on the single state
+    # writer thread instead of contending for the SQLite lock.
+    await asyncio.to_thread(scanner.process_early_candidate, candidate)
+    ENRICHMENT.schedule(event["token"])
 
 
 async def main() -> None:
@@ -35,6 +43,7 @@ async def main() -> None:
     tasks = [asyncio.to_thread(scanner.run)]
     if enable_ws:
         tasks.append(listen(handle_new_pool))
+        tasks.append(ENRICHMENT.run())
 
     await asyncio.gather(*tasks)
 
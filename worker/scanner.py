@@ -11,20 +11,20 @@ except Exception:
 from app.services.scan_service import process_scan
 from app.services.state_service import (
     init,
-    upsert_seen,
-    allow_alert,
-    maybe_auto_mute,
-    pass_escalation_check,
-    update_severity,
+    get_writer,
+    start_retention_sweeper,
+    RETENTION_STATS,
+    TokenStateTxn,
     top_recent,
     kv_get,
     kv_set,
-    record_alert,
-    record_repeat,
 )
-from app.services.discord_service import send_candidate, send_text, send_collapsed_repeat
+from app.services.discord_service import candidate_embed, queue_embed, repeat_embed, send_text
+from app.services.discord_outbox import end_discord_cycle, outbox_stats, start_discord_outbox
 from app.services.explain_service import one_sentence_explanation
 from app.services.wallet_service import wallet_risk_score
+from app.services.webhook_delivery import delivery_stats
+from app.watch.snapshot import start_watch_snapshots
 
 DRY_RUN = os.getenv("DRY_RUN", "false").lower() in ("1", "true", "yes")
 DISCORD_ENABLED = os.getenv("ENABLE_DISCORD", "true").lower() in ("1", "true", "yes")
@@ -111,13 +111,13 @@ def send_daily_digest():
         send_text(msg, mode="digest", fanout=False)
 
 
-def passes_near_pass(c: dict) -> bool:
+def passes_near_pass(c: dict, check_age: bool = True) -> bool:
     metrics = c.get("metrics") or {}
     liq = float(metrics.get("liquidity") or 0)
     vol5m = float(metrics.get("volume_5m") or 0)
     chg5m = float(metrics.get("price_change_5m") or 0)
     age = float(metrics.get("age_minutes") or 0)
-    return age <= 0.5 and liq >= 800 and vol5m >= 20 and chg5m >= -10
+    return (not check_age or age <= 0.5) and liq >= 800 and vol5m >= 20 and chg5m >= -10
 
 
 def _process_candidate(c: dict, bypass_metrics: bool = False) -> None:
@@ -127,58 +127,54 @@ def _process_candidate(c: dict, bypass_metrics: bool = False) -> None:
             return
 
     token = c["token"]
-    upsert_seen(token, metrics)
 
+    # Wallet scoring is a network call, so it runs before the state
+    # transaction and the row lock is never held across I/O.
+    mode = "near_pass"
     if WALLET_SCORE_ENABLED:
         risk = wallet_risk_score(token)
         if risk.get("enabled") and risk.get("risk") in ("warn", "high"):
             c["reason"] = f"rug_wallet_{risk.get('reason')}"
             mode = "rug"
-            update_severity(token, "rug")
-        else:
-            mode = "near_pass"
         c["wallet"] = risk
-    else:
-        mode = "near_pass"
-
-    muted = maybe_auto_mute(
-        token,
-        MUTE_WINDOW_MINUTES,
-        MUTE_AFTER_ALERTS,
-        MUTE_DURATION_MINUTES,
-    )
-    if muted:
-        return
 
-    if mode != "rug":
-        if pass_escalation_check(
-            token=token,
-            metrics=metrics,
-            pass_confirmations=PASS_CONFIRMATIONS,
-            pass_window_minutes=PASS_WINDOW_MINUTES,
-            min_liq=PASS_MIN_LIQUIDITY,
-            min_vol5m=PASS_MIN_VOL5M,
-        ):
-            mode = "pass"
-            c["escalated_from"] = "near_pass"
-            update_severity(token, "pass")
-        else:
-            update_severity(token, "near_pass")
-
-    if mode == "pass":
-        explanation = one_sentence_explanation(c, mode)
-        if not DRY_RUN and DISCORD_ENABLED:
-            send_candidate(c, mode=mode, explanation=explanation)
-        record_alert(token, mode)
-        return
+    # Alerts go to the outbox inside the transaction, so the row that records
+    # an alert and the message announcing it are committed together.
+    with TokenStateTxn(token) as st:
+        st.upsert_seen(metrics)
+        if mode == "rug":
+            st.update_severity("rug")
+
+        muted = st.maybe_auto_mute(
+            MUTE_WINDOW_MINUTES,
+            MUTE_AFTER_ALERTS,
+            MUTE_DURATION_MINUTES,
+        )
+        if muted:
+            return
+
+        if mode != "rug":
+            if st.pass_escalation_check(
+                metrics=metrics,
+                pass_confirmations=PASS_CONFIRMATIONS,
+                pass_window_minutes=PASS_WINDOW_MINUTES,
+                min_liq=PASS_MIN_LIQUIDITY,
+                min_vol5m=PASS_MIN_VOL5M,
+            ):
+                mode = "pass"
+                c["escalated_from"] = "near_pass"
+                st.update_severity("pass")
+            else:
+                st.update_severity("near_pass")
+
+        if mode == "pass" or st.allow_alert(BASE_COOLDOWN):
+            st.record_alert(mode)
+            explanation = one_sentence_explanation(c, mode)
+            if not DRY_RUN and DISCORD_ENABLED:
+                queue_embed(st, candidate_embed(c, mode=mode, explanation=explanation), mode)
+            return
 
-    if allow_alert(token, BASE_COOLDOWN):
-        explanation = one_sentence_explanation(c, mode)
-        if not DRY_RUN and DISCORD_ENABLED:
-            send_candidate(c, mode=mode, explanation=explanation)
-        record_alert(token, mode)
-    else:
-        stats = record_repeat(token, mode)
+        stats = st.record_repeat(mode)
         if should_send_collapsed_repeat(stats):
             heating = is_heating_up(stats)
             log(
@@ -187,7 +183,7 @@ def _process_candidate(c: dict, bypass_metrics: bool = False) -> None:
                 f"{'HEATING_UP' if heating else ''}"
             )
             if not DRY_RUN and DISCORD_ENABLED:
-                send_collapsed_repeat(c, mode=mode, stats=stats, heating_up=heating)
+                queue_embed(st, repeat_embed(c, mode=mode, stats=stats, heating_up=heating), mode)
 
 
 def process_early_candidate(candidate: dict) -> None:
@@ -210,6 +206,19 @@ def process_early_candidate(candidate: dict) -> None:
     _process_candidate(candidate, bypass_metrics=True)
 
 
+def process_enriched_candidate(candidate: dict) -> None:
+    """
+    Follow-up Dexscreener numbers for a mint first seen on the Helius WS
+    (worker/enrichment.py). Same gate as a polled pair except for age: the
+    mint was early when the WS saw it, and its later lookups are what
+    confirm it (and can escalate it to pass).
+    """
+    candidate["source"] = "helius"
+    candidate["stage"] = "enriched_ws"
+    if passes_near_pass(candidate, check_age=False):
+        _process_candidate(candidate, bypass_metrics=True)
+
+
 def process_candidate(candidate: dict) -> None:
     _process_candidate(candidate)
 
@@ -217,6 +226,10 @@ def process_candidate(candidate: dict) -> None:
 def run():
     log("[worker] starting")
     init()
+    if not DRY_RUN and DISCORD_ENABLED:
+        start_discord_outbox()
+    start_retention_sweeper()
+    start_watch_snapshots("worker")
     cycle = 0
 
     while True:
@@ -225,8 +238,37 @@ def run():
             if cycle % HEARTBEAT_EVERY == 0:
                 hb = (
                     f"[worker] heartbeat {datetime.now(timezone.utc).isoformat()} "
-                    f"cycle={cycle} DRY_RUN={DRY_RUN}"
+                    f"cycle={cycle} DRY_RUN={DRY_RUN} "
+                    f"swept={RETENTION_STATS['rows_swept']} "
+                    f"sweep_secs={RETENTION_STATS['seconds']:.1f}"
                 )
+                writer = get_writer()
+                if writer is not None:
+                    hb += (
+                        f" state_txns={writer.stats['transactions']}"
+                        f" state_merged={writer.stats['merged']}"
+                        f" state_max_queue={writer.stats['max_queue']}"
+                    )
+                webhooks = delivery_stats()
+                if webhooks is not None:
+                    hb += (
+                        f" webhooks_delivered={webhooks['delivered']}"
+                        f" webhooks_retried={webhooks['retried']}"
+                        f" webhooks_dead={webhooks['dead']}"
+                        f" webhooks_backlog={webhooks['backlog']}"
+                        f" webhook_p95_ms={webhooks['latency_p95_ms']:.0f}"
+                    )
+                discord = outbox_stats()
+                if discord is not None:
+                    hb += (
+                        f" discord_sent={discord['sent']}"
+                        f" discord_posts={discord['posts']}"
+                        f" discord_calls_saved={discord['saved']}"
+                        f" discord_rate_limited={discord['rate_limited']}"
+                        f" discord_dead={discord['dead']}"
+                        f" discord_backlog={discord['backlog']}"
+                        f" discord_p95_ms={discord['latency_p95_ms']:.0f}"
+                    )
                 log(hb)
                 if not DRY_RUN and DISCORD_ENABLED:
                     send_text(hb, mode="logs", fanout=False)
@@ -237,7 +279,7 @@ def run():
 
             hits = []
             if DEX_ENABLED:
-                hits = process_scan()
+                hits = process_scan(changed_only=True)
                 print(
                     f"[worker] candidates={len(hits)} early={EARLY_COUNT}",
                     flush=True,
@@ -245,6 +287,8 @@ def run():
 
                 for c in hits:
                     _process_candidate(c)
+                # This cycle's alerts are all queued: send them, coalesced.
+                end_discord_cycle()
             else:
                 if cycle == 1:
                     log("[worker] dex polling disabled")